@@ -4,5 +4,50 @@ export CDK_DEFAULT_REGION=us-east-1
 export USERS_TABLE=transferidp_users
 export IDP_TABLE=transferidp_identity_providers
 
+# true deploys one Lambda function serving both /api/idp/ and /api/user/
+export SINGLE_API_FUNCTION=false
+# true adds an S3 bucket and a nightly gzip NDJSON export of both tables
+export NIGHTLY_EXPORT=false
+# log level of the API functions, per route overrides as JSON and the share of requests logged at DEBUG
+export API_LOG_LEVEL=INFO
+export ROUTE_LOG_LEVELS='{}'
+export LOG_DEBUG_SAMPLE_RATE=0.01
+# startup profile of the API functions, arm64 needs the arm64 build of the jwt layer (see README).
+# 128 MB and 3 seconds are the defaults, 1024 MB and 10 seconds shorten cold starts at a higher cost per request
+export LAMBDA_MEMORY_SIZE=128
+export API_TIMEOUT_SECONDS=3
+export LAMBDA_ARCHITECTURE=x86_64
+# environments kept initialized behind a live alias, 0 turns it off, billed while deployed
+export PROVISIONED_CONCURRENCY=0
+# true adds a CloudWatch dashboard of the per route API metrics and p99 latency and server error rate alarms,
+# notifying the SNS topic of ALARM_TOPIC_ARN when set
+export API_MONITORING=false
+export LATENCY_ALARM_MS=1000
+export ERROR_RATE_ALARM=0.05
+export ALARM_TOPIC_ARN=
+# true profiles every API request with cProfile and logs the hot functions, else only requests sent with the
+# header x-profile: true by members of the comma separated cognito groups in PROFILE_GROUPS
+export PROFILE_REQUESTS=false
+export PROFILE_GROUPS=
+# true creates USERS_TABLE and IDP_TABLE in the stack, with the provider index, point-in-time recovery and
+# optionally an index on identity_provider_module. Existing tables have to be brought in with cdk import first
+export MANAGE_TABLES=false
+# with MANAGE_TABLES=false, true adds the provider index to the existing USERS_TABLE with an UpdateTable call,
+# with TABLE_READ_CAPACITY/TABLE_WRITE_CAPACITY when the table uses provisioned capacity
+export ADD_USER_PROVIDER_INDEX=false
+export USER_MODULE_INDEX=
+# PAY_PER_REQUEST or PROVISIONED, provisioned capacity autoscales between the capacity and the max capacity
+export TABLE_BILLING=PAY_PER_REQUEST
+export TABLE_READ_CAPACITY=5
+export TABLE_WRITE_CAPACITY=5
+export TABLE_MAX_READ_CAPACITY=100
+export TABLE_MAX_WRITE_CAPACITY=100
+export TABLE_TARGET_UTILIZATION=70
+# true turns on DynamoDB Streams with new and old images on the managed tables
+export TABLE_STREAMS=false
+# true keeps users per IdP, module and role and IdPs per module in a statistics table for GET /api/stats,
+# updated from the streams of the managed tables, needs MANAGE_TABLES=true
+export TABLE_STATS=false
+
 export ALB_DOMAIN_NAME=toolkit.transferfamily.aws.com
 export VPC_NAME=ToolkitWebAppVpc/ToolkitWebAppVpc
\ No newline at end of file
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import json
 import os
 
 import aws_cdk as cdk
@@ -22,6 +23,32 @@ IdpWebAppBackend(app, "ToolkitWebAppBackend", env=env,
                  vpc_name=vpc_name,
                  users_table=os.environ["USERS_TABLE"],
                  idp_table=os.environ["IDP_TABLE"],
-                 alb_domain=os.environ["ALB_DOMAIN_NAME"])
+                 alb_domain=os.environ["ALB_DOMAIN_NAME"],
+                 single_function=os.environ.get("SINGLE_API_FUNCTION", "false") == "true",
+                 nightly_export=os.environ.get("NIGHTLY_EXPORT", "false") == "true",
+                 log_level=os.environ.get("API_LOG_LEVEL", "INFO"),
+                 route_log_levels=json.loads(os.environ.get("ROUTE_LOG_LEVELS") or "{}"),
+                 debug_sample_rate=float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "0.01")),
+                 lambda_memory_size=int(os.environ.get("LAMBDA_MEMORY_SIZE", "128")),
+                 api_timeout_seconds=int(os.environ.get("API_TIMEOUT_SECONDS", "3")),
+                 lambda_architecture=os.environ.get("LAMBDA_ARCHITECTURE", "x86_64"),
+                 provisioned_concurrency=int(os.environ.get("PROVISIONED_CONCURRENCY", "0")),
+                 monitoring=os.environ.get("API_MONITORING", "false") == "true",
+                 latency_alarm_ms=int(os.environ.get("LATENCY_ALARM_MS", "1000")),
+                 error_rate_alarm=float(os.environ.get("ERROR_RATE_ALARM", "0.05")),
+                 alarm_topic_arn=os.environ.get("ALARM_TOPIC_ARN") or None,
+                 profile_requests=os.environ.get("PROFILE_REQUESTS", "false") == "true",
+                 profile_groups=[group for group in os.environ.get("PROFILE_GROUPS", "").split(",") if group],
+                 manage_tables=os.environ.get("MANAGE_TABLES", "false") == "true",
+                 add_provider_index=os.environ.get("ADD_USER_PROVIDER_INDEX", "false") == "true",
+                 user_module_index=os.environ.get("USER_MODULE_INDEX") or None,
+                 table_billing=os.environ.get("TABLE_BILLING", "PAY_PER_REQUEST"),
+                 table_read_capacity=int(os.environ.get("TABLE_READ_CAPACITY", "5")),
+                 table_write_capacity=int(os.environ.get("TABLE_WRITE_CAPACITY", "5")),
+                 table_max_read_capacity=int(os.environ.get("TABLE_MAX_READ_CAPACITY", "100")),
+                 table_max_write_capacity=int(os.environ.get("TABLE_MAX_WRITE_CAPACITY", "100")),
+                 table_target_utilization=int(os.environ.get("TABLE_TARGET_UTILIZATION", "70")),
+                 table_streams=os.environ.get("TABLE_STREAMS", "false") == "true",
+                 table_stats=os.environ.get("TABLE_STATS", "false") == "true")
 cdk.Aspects.of(app).add(AwsSolutionsChecks(verbose=True))
 app.synth()
@@ -0,0 +1,98 @@
+"""
+Cold import cost of the Lambda handler modules: wall time and module count of `import manage_users` and
+`import manage_idps` in a fresh interpreter, the top packages by import time, and the cost of the modules
+the routes import lazily, which a cold read no longer pays.
+
+    python benchmarks/bench_cold_import.py --runs 10
+
+Lambda at 128 MB gets a fraction of a vCPU, expect the deployed init to take several times the local numbers.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from local_jwks import FUNCTIONS_DIR, CLIENT_ID
+
+# the import runs in the child, timed from the first line so the interpreter start is not counted
+child_code = """
+import json, sys, time
+start = time.perf_counter()
+before = len(sys.modules)
+import {module}
+imported = time.perf_counter()
+after = len(sys.modules)
+for name in getattr(sys.modules[{module!r}], 'lazy_modules', ()):
+    __import__(name)
+print(json.dumps({{'import_ms': (imported - start) * 1000, 'modules': after - before,
+                  'lazy_ms': (time.perf_counter() - imported) * 1000, 'lazy_modules': len(sys.modules) - after}}))
+"""
+
+
+def environment():
+    return {
+        **os.environ,
+        'PYTHONPATH': FUNCTIONS_DIR,
+        'AWS_DEFAULT_REGION': os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'),
+        'COGNITO_USER_POOL_CLIENT_ID': CLIENT_ID,
+        'IDP_TABLE_NAME': 'transferidp_identity_providers',
+        'USER_TABLE_NAME': 'transferidp_users',
+        'POWERTOOLS_SERVICE_NAME': 'bench_cold_import',
+    }
+
+
+def run(module: str):
+    output = subprocess.run([sys.executable, '-c', child_code.format(module=module)],
+                            env=environment(), check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def top_packages(module: str, count: int):
+    """
+    Packages with the largest self import time, summed over their submodules, from python -X importtime
+    """
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                            env=environment(), check=True, capture_output=True, text=True).stderr
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+    ranked = sorted(packages.items(), key=lambda entry: entry[1], reverse=True)[:count]
+    return {package: round(us / 1000, 1) for package, us in ranked}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='fresh interpreters per module')
+    parser.add_argument('--top', type=int, default=8, help='packages to list by import time')
+    parser.add_argument('modules', nargs='*', default=['manage_users', 'manage_idps', 'manage_api'])
+    args = parser.parse_args()
+
+    # the first run compiles the bytecode, keep it out of the numbers
+    for module in args.modules:
+        run(module)
+
+    results = []
+    for module in args.modules:
+        runs = [run(module) for _ in range(args.runs)]
+        import_ms = sorted(result['import_ms'] for result in runs)
+        results.append({
+            'module': module,
+            'runs': args.runs,
+            'import_p50_ms': round(statistics.median(import_ms), 1),
+            'import_max_ms': round(import_ms[-1], 1),
+            'modules_loaded': runs[-1]['modules'],
+            'lazy_import_p50_ms': round(statistics.median(result['lazy_ms'] for result in runs), 1),
+            'lazy_modules_loaded': runs[-1]['lazy_modules'],
+            'top_packages_ms': top_packages(module, args.top),
+        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Latency and peak memory per endpoint of manage_users.handler and manage_idps.handler, called in process with ALB
+events and locally signed tokens, against DynamoDB Local or moto, for one or more users table sizes.
+
+    docker run -d -p 8000:8000 amazon/dynamodb-local
+    python benchmarks/bench_handlers.py --endpoint-url http://localhost:8000 --users 1000 10000 100000 1000000 \\
+        --output results.json
+    # later, fail when an endpoint got slower than the saved run
+    python benchmarks/bench_handlers.py --endpoint-url http://localhost:8000 --users 1000 10000 --baseline results.json
+
+Every table size runs in a process of its own, with freshly seeded tables and cold handler modules. Without
+--endpoint-url the tables live in moto, which is only fit for small sizes and smoke runs.
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import local_api
+import local_dynamodb
+from local_jwks import LocalJwks, JwksServer
+
+
+def endpoints(users: int, providers: int):
+    """
+    Benchmarked requests by endpoint name, each a function of the iteration returning handler and event arguments.
+    Writes come last and delete what the put of the same endpoint group created.
+    """
+    def seeded_user(i):
+        index = (i * 7919) % users
+        return f"user{index:07}", local_dynamodb.provider_name(index % providers)
+
+    def new_user(i):
+        # provider 1 is a cognito IdP, its users need no password hash
+        user = local_dynamodb.user_item(1, providers)
+        user['user'] = f"bench-put-{i:07}"
+        return user
+
+    return {
+        'idp list': ('idp', lambda i: ('GET', '/api/idp/', None, {'limit': '50'})),
+        'idp get': ('idp', lambda i: ('GET', f"/api/idp/{local_dynamodb.provider_name(i % providers)}", None, {})),
+        'idp put': ('idp', lambda i: ('PUT', '/api/idp/', json.dumps(
+            {'provider': f"bench-idp-{i:05}", 'module': 'argon2', 'config': {'attributes': {}}}), {})),
+        'idp delete': ('idp', lambda i: ('DELETE', f"/api/idp/bench-idp-{i:05}", None, {})),
+        'user list': ('user', lambda i: ('GET', '/api/user/', None, {'limit': '50'})),
+        'user list by provider': ('user', lambda i: ('GET', '/api/user/', None, {
+            'limit': '50', 'provider': local_dynamodb.provider_name(i % providers)})),
+        'user get': ('user', lambda i: ('GET', f"/api/user/{seeded_user(i)[0]}", None, {'provider': seeded_user(i)[1]})),
+        'user count': ('user', lambda i: ('GET', '/api/user/', None, {
+            'count': 'true', 'provider': local_dynamodb.provider_name(i % providers)})),
+        'user put': ('user', lambda i: ('PUT', '/api/user/', json.dumps(new_user(i)), {})),
+        'user delete': ('user', lambda i: ('DELETE', f"/api/user/bench-put-{i:07}", None, {
+            'provider': local_dynamodb.provider_name(1)})),
+    }
+
+
+def measure(handler, token: str, request, iterations: int, memory_iterations: int):
+    context = local_api.Context()
+    timings = []
+    errors = 0
+    for i in range(iterations):
+        method, path, body, query = request(i)
+        event = local_api.alb_event(method, path, token, body=body, query=query)
+        start = time.perf_counter()
+        response = handler(event, context)
+        timings.append((time.perf_counter() - start) * 1000)
+        errors += response['statusCode'] >= 400
+
+    # tracemalloc slows every allocation down, peaks are taken on separate calls that repeat the first requests,
+    # writes repeat the same put or delete
+    peak = 0
+    for i in range(min(memory_iterations, iterations)):
+        method, path, body, query = request(i)
+        event = local_api.alb_event(method, path, token, body=body, query=query)
+        tracemalloc.start()
+        handler(event, context)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {**local_api.percentiles(timings), 'errors': errors, 'peak_memory_kb': round(peak / 1024)}
+
+
+def child(args):
+    resource_ddb = local_dynamodb.dynamodb(args.endpoint_url)
+    users_table, idp_table = local_dynamodb.create_tables(resource_ddb, provider_index=local_dynamodb.PROVIDER_INDEX)
+    local_dynamodb.create_version_table(resource_ddb)
+    start = time.perf_counter()
+    local_dynamodb.seed(users_table, idp_table, args.users, args.providers, workers=args.seed_workers)
+    seed_seconds = time.perf_counter() - start
+
+    jwks = LocalJwks()
+    token = jwks.token()
+    local_api.handler_environment()
+    with JwksServer(jwks) as server:
+        handlers = dict(zip(('idp', 'user'), local_api.load_handlers(server.url)))
+        # the first request pays for the JWKS fetch and the first DynamoDB connection
+        start = time.perf_counter()
+        handlers['user'](local_api.alb_event('GET', '/api/user/', token, query={'limit': '1'}), local_api.Context())
+        first_request_ms = (time.perf_counter() - start) * 1000
+
+        results = []
+        for name, (group, request) in endpoints(args.users, args.providers).items():
+            if args.endpoints and name not in args.endpoints:
+                continue
+            results.append({
+                'users': args.users,
+                'endpoint': name,
+                'iterations': args.iterations,
+                **measure(handlers[group], token, request, args.iterations, args.memory_iterations),
+            })
+        jwks_fetches = server.fetches
+
+    print(json.dumps({
+        'users': args.users,
+        'seed_seconds': round(seed_seconds, 1),
+        'first_request_ms': round(first_request_ms, 3),
+        'jwks_fetches': jwks_fetches,
+        # ru_maxrss is in KB on Linux
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'endpoints': results,
+    }))
+
+
+def regressions(results: dict, baseline: dict, threshold: float):
+    """
+    Endpoints whose p95 grew by more than threshold against a previous run, matched by table size and endpoint
+    """
+    previous = {(run['users'], entry['endpoint']): entry
+                for run in baseline['runs'] for entry in run['endpoints']}
+    found = []
+    for run in results['runs']:
+        for entry in run['endpoints']:
+            before = previous.get((run['users'], entry['endpoint']))
+            if before and before.get('p95_ms') and entry['p95_ms'] > before['p95_ms'] * (1 + threshold):
+                found.append({'users': run['users'], 'endpoint': entry['endpoint'],
+                              'baseline_p95_ms': before['p95_ms'], 'p95_ms': entry['p95_ms']})
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--endpoint-url', help='DynamoDB Local endpoint, moto when omitted')
+    parser.add_argument('--users', type=int, nargs='+', default=[1000], help='users table sizes to run')
+    parser.add_argument('--providers', type=int, default=10)
+    parser.add_argument('--iterations', type=int, default=200, help='requests per endpoint')
+    parser.add_argument('--memory-iterations', type=int, default=20, help='requests per endpoint traced for memory')
+    parser.add_argument('--seed-workers', type=int, default=8)
+    parser.add_argument('--endpoints', nargs='*', help='endpoint names to run, all when omitted')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='results of a previous run, exit 1 when an endpoint p95 regressed')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='allowed p95 growth against the baseline')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.users = args.users[0]
+        child(args)
+        return
+
+    runs = []
+    for users in args.users:
+        command = [sys.executable, __file__, '--child', '--users', str(users), '--providers', str(args.providers),
+                   '--iterations', str(args.iterations), '--memory-iterations', str(args.memory_iterations),
+                   '--seed-workers', str(args.seed_workers)]
+        if args.endpoint_url:
+            command += ['--endpoint-url', args.endpoint_url]
+        if args.endpoints:
+            command += ['--endpoints', *args.endpoints]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    results = {
+        'dynamodb': args.endpoint_url or 'moto',
+        'python': sys.version.split()[0],
+        'providers': args.providers,
+        'runs': runs,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.max_regression)
+        if found:
+            print(json.dumps({'regressions': found}, indent=2), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+RS256 verifications per second of each JWT backend in functions/jwt_backends.py, the token cache left out.
+
+    python benchmarks/bench_jwt_backends.py --iterations 2000 --tokens 10
+
+"jose, two-pass" is the verify path before the backends, which decoded the header and the claims separately
+with python-jose. "jose, pure python rsa" is python-jose without cryptography installed, as in a layer built
+with `pip install python-jose` alone.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from local_jwks import LocalJwks, CLIENT_ID
+
+os.environ.setdefault('COGNITO_USER_POOL_CLIENT_ID', CLIENT_ID)
+
+import jwt_backends  # noqa: E402
+import jwt_token_helper  # noqa: E402
+
+
+class PurePythonJoseBackend(jwt_backends.JoseBackend):
+    name = 'jose, pure python rsa'
+
+    def public_key(self, key: dict):
+        from jose.backends.rsa_backend import RSAKey
+        return RSAKey(key, key.get('alg', 'RS256'))
+
+
+def two_pass_verify(jwt_token, key_cache):
+    from jose import jwt
+    from jose.utils import base64url_decode
+    headers = jwt.get_unverified_headers(jwt_token)
+    public_key = key_cache.get_key(headers['kid'])
+    message, encoded_signature = str(jwt_token).rsplit('.', 1)
+    if not public_key.verify(message.encode('utf8'), base64url_decode(encoded_signature.encode('utf-8'))):
+        raise jwt_token_helper.JwtTokenException('Signature verification failed')
+    claims = jwt.get_unverified_claims(jwt_token)
+    if time.time() > claims['exp'] or claims['client_id'] != os.environ['COGNITO_USER_POOL_CLIENT_ID']:
+        raise jwt_token_helper.JwtTokenException('invalid claims')
+    return headers['kid'], claims
+
+
+def variants():
+    result = [('jose, two-pass', jwt_backends.JoseBackend, two_pass_verify),
+              ('jose', jwt_backends.JoseBackend, jwt_token_helper.verify_token),
+              ('jose, pure python rsa', PurePythonJoseBackend, jwt_token_helper.verify_token)]
+    try:
+        jwt_backends.CryptographyBackend()
+        result.append(('cryptography', jwt_backends.CryptographyBackend, jwt_token_helper.verify_token))
+    except ImportError:
+        pass
+    return result
+
+
+def run(jwks: LocalJwks, tokens, iterations: int, name: str, backend_class, verify):
+    backend = backend_class()
+    start = time.perf_counter()
+    for _ in range(100):
+        backend.public_key(jwks.public_jwk)
+    key_us = (time.perf_counter() - start) * 10_000
+
+    key_cache = jwt_token_helper.JwksCache(fetch=jwks.keys, backend=backend)
+    verify(tokens[0], key_cache)
+    timings = []
+    for i in range(iterations):
+        token = tokens[i % len(tokens)]
+        start = time.perf_counter()
+        verify(token, key_cache)
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    timings.sort()
+    return {
+        'backend': name,
+        'iterations': iterations,
+        'p50_us': round(timings[len(timings) // 2], 1),
+        'p99_us': round(timings[int(len(timings) * 0.99) - 1], 1),
+        'mean_us': round(statistics.fmean(timings), 1),
+        'verifications_per_second': round(iterations / (sum(timings) / 1_000_000)),
+        'public_key_us': round(key_us, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--tokens', type=int, default=10, help='distinct tokens verified in turn')
+    parser.add_argument('--bits', type=int, default=2048, help='RSA key size, cognito uses 2048')
+    args = parser.parse_args()
+
+    jwks = LocalJwks(bits=args.bits)
+    tokens = [jwks.token() for _ in range(args.tokens)]
+    results = [run(jwks, tokens, args.iterations, name, backend_class, verify)
+               for name, backend_class, verify in variants()]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+"""
+Concurrent load on manage_users.handler and manage_idps.handler: a mix of admin requests replayed at a target
+rate by a pool of workers, against DynamoDB Local. Reports throughput, latency histograms per endpoint, DynamoDB
+throttles and retries, and how often the JWKS was fetched.
+
+    docker run -d -p 8000:8000 amazon/dynamodb-local
+    python benchmarks/bench_load.py --endpoint-url http://localhost:8000 --users 100000 \\
+        --rate 50 --duration 60 --workers 8 --sessions 5 \\
+        --mix "user list=40,user get=30,user count=10,user put=5,user delete=5,idp list=5,idp get=5"
+
+With --pool process (default) every worker is a process of its own with cold handler modules and its own caches,
+like a Lambda execution environment, so --workers is the concurrency to size. --pool thread runs the workers as
+threads sharing one set of handlers, which also works with moto when --endpoint-url is omitted.
+
+Requests are sent on a fixed schedule whatever the latency, latency is measured from the scheduled time, so time
+spent waiting for a free worker shows up in it. service_ms is the handler time alone.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+
+import bench_handlers
+import local_api
+import local_dynamodb
+from local_jwks import LocalJwks, JwksServer
+
+histogram_bounds_ms = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+throttle_codes = frozenset(('ProvisionedThroughputExceededException', 'ThrottlingException',
+                            'RequestLimitExceeded', 'TransactionInProgressException'))
+
+
+def parse_mix(text: str):
+    """
+    {endpoint name: weight} from "user list=40,user get=30", endpoint names as in bench_handlers
+    """
+    known = bench_handlers.endpoints(1, 1)
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip().replace('-', ' ')
+        if name not in known:
+            raise ValueError(f"unknown endpoint {name!r}, one of {', '.join(known)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def schedule(mix: dict, rate: float, duration: float, sessions: int):
+    """
+    (offset in seconds, endpoint, iteration, session) for every request, endpoints interleaved by weight
+    """
+    total = sum(mix.values())
+    credit = dict.fromkeys(mix, 0.0)
+    counters = dict.fromkeys(mix, 0)
+    for n in range(int(rate * duration)):
+        # smooth weighted round robin, every endpoint gets its share without bursts of one kind
+        for name, weight in mix.items():
+            credit[name] += weight
+        name = max(credit, key=credit.get)
+        credit[name] -= total
+        yield n / rate, name, counters[name], n % sessions
+        counters[name] += 1
+
+
+class RetryCounter:
+    """
+    Counts DynamoDB retries and throttled attempts of a boto3 client through its event hooks
+    """
+
+    def __init__(self, client):
+        self.retries = 0
+        self.throttles = 0
+        self._lock = threading.Lock()
+        client.meta.events.register('needs-retry.dynamodb', self._needs_retry, unique_id='bench-load-retries')
+        client.meta.events.register('after-call.dynamodb', self._after_call, unique_id='bench-load-attempts')
+
+    def _needs_retry(self, response=None, **kwargs):
+        if response and response[1].get('Error', {}).get('Code') in throttle_codes:
+            with self._lock:
+                self.throttles += 1
+        return None
+
+    def _after_call(self, parsed=None, **kwargs):
+        attempts = (parsed or {}).get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        if attempts:
+            with self._lock:
+                self.retries += attempts
+
+    def stats(self):
+        return {'retries': self.retries, 'throttles': self.throttles}
+
+
+def setup(config: dict):
+    """
+    Handlers by group and the retry counter of their DynamoDB client
+    """
+    # the functions log and write their metrics to stdout, the report goes there
+    sys.stdout = open(os.devnull, 'w')
+    local_dynamodb.dynamodb(config['endpoint_url'])
+    local_api.handler_environment(**config['environment'])
+    idp_handler, user_handler = local_api.load_handlers(config['jwks_url'])
+    import ddb_helper
+    return {'idp': idp_handler, 'user': user_handler}, RetryCounter(ddb_helper.resource().meta.client)
+
+
+def cache_stats():
+    import jwt_token_helper
+    import manage_idps
+    return {
+        'jwks_cache': jwt_token_helper.jwks_cache.stats(),
+        'token_cache': jwt_token_helper.token_cache.stats(),
+        'idp_cache': manage_idps.idp_cache.stats(),
+    }
+
+
+def work(tasks, results, config: dict, handlers=None):
+    """
+    Run requests from tasks until None, putting a result per request and, when it set up the handlers, its stats
+    """
+    counter = None
+    if handlers is None:
+        handlers, counter = setup(config)
+    requests = bench_handlers.endpoints(config['users'], config['providers'])
+    context = local_api.Context()
+    while True:
+        task = tasks.get()
+        if task is None:
+            if counter is not None:
+                results.put(('stats', {**counter.stats(), **cache_stats()}))
+            return
+        scheduled, name, i, session = task
+        group, request = requests[name]
+        method, path, body, query = request(i)
+        event = local_api.alb_event(method, path, config['tokens'][session], body=body, query=query)
+        start = time.monotonic()
+        try:
+            status = handlers[group](event, context)['statusCode']
+        except Exception:
+            status = 'exception'
+        finished = time.monotonic()
+        results.put(('request', name, status, scheduled, start, finished))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(histogram_bounds_ms) + 1)
+        self.latencies = []
+        self.service = []
+
+    def add(self, latency_ms: float, service_ms: float):
+        self.latencies.append(latency_ms)
+        self.service.append(service_ms)
+        for position, bound in enumerate(histogram_bounds_ms):
+            if latency_ms <= bound:
+                self.counts[position] += 1
+                return
+        self.counts[-1] += 1
+
+    def report(self):
+        buckets = {f"<={bound}ms": count for bound, count in zip(histogram_bounds_ms, self.counts)}
+        buckets[f">{histogram_bounds_ms[-1]}ms"] = self.counts[-1]
+        return {
+            'requests': len(self.latencies),
+            'latency': local_api.percentiles(self.latencies),
+            'service': local_api.percentiles(self.service),
+            'histogram': buckets,
+        }
+
+
+def run(args, mix: dict, config: dict):
+    if args.pool == 'process':
+        context = multiprocessing.get_context('spawn')
+        tasks, results = context.Queue(), context.Queue()
+        workers = [context.Process(target=work, args=(tasks, results, config), daemon=True)
+                   for _ in range(args.workers)]
+        shared_counter = None
+    else:
+        tasks, results = queue.Queue(), queue.Queue()
+        handlers, shared_counter = setup(config)
+        workers = [threading.Thread(target=work, args=(tasks, results, config, handlers), daemon=True)
+                   for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    if args.pool == 'process':
+        # wait for the workers to import the handlers, the schedule is about requests not process starts
+        time.sleep(args.warmup)
+
+    start = time.monotonic()
+    for offset, name, i, session in schedule(mix, args.rate, args.duration, len(config['tokens'])):
+        delay = start + offset - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        tasks.put((start + offset, name, i, session))
+    for _ in workers:
+        tasks.put(None)
+
+    histograms = {name: Histogram() for name in mix}
+    overall = Histogram()
+    statuses = {}
+    worker_stats = []
+    finished = start
+    expected_stats = len(workers) if args.pool == 'process' else 0
+    outstanding = int(args.rate * args.duration)
+    while outstanding or len(worker_stats) < expected_stats:
+        kind, *payload = results.get()
+        if kind == 'stats':
+            worker_stats.append(payload[0])
+            continue
+        name, status, scheduled, started, done = payload
+        latency_ms, service_ms = (done - scheduled) * 1000, (done - started) * 1000
+        histograms[name].add(latency_ms, service_ms)
+        overall.add(latency_ms, service_ms)
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        finished = max(finished, done)
+        outstanding -= 1
+    for worker in workers:
+        worker.join()
+    if shared_counter is not None:
+        worker_stats.append({**shared_counter.stats(), **cache_stats()})
+    return overall, histograms, statuses, worker_stats, finished - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--endpoint-url', help='DynamoDB Local endpoint, moto when omitted (thread pool only)')
+    parser.add_argument('--users', type=int, default=10000, help='users to seed')
+    parser.add_argument('--providers', type=int, default=10)
+    parser.add_argument('--skip-seed', action='store_true', help='reuse the tables of a previous run')
+    parser.add_argument('--rate', type=float, default=20, help='requests per second')
+    parser.add_argument('--duration', type=float, default=30, help='seconds')
+    parser.add_argument('--workers', type=int, default=4, help='concurrent workers, i.e. Lambda environments')
+    parser.add_argument('--pool', choices=('process', 'thread'), default='process')
+    parser.add_argument('--sessions', type=int, default=5, help='distinct admin tokens')
+    parser.add_argument('--mix', default='user list=40,user get=30,user count=10,user put=5,user delete=5,'
+                                         'idp list=5,idp get=5')
+    parser.add_argument('--jwks-delay', type=float, default=0, help='seconds the JWKS stub takes to answer')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds for process workers to start')
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help='extra function environment, e.g. --env IDP_CACHE_ENABLED=false')
+    parser.add_argument('--output', help='write the report to this JSON file')
+    args = parser.parse_args()
+    if args.pool == 'process' and not args.endpoint_url:
+        parser.error('--pool process needs --endpoint-url, moto tables live in a single process')
+    mix = parse_mix(args.mix)
+
+    resource = local_dynamodb.dynamodb(args.endpoint_url)
+    if not args.skip_seed:
+        users_table, idp_table = local_dynamodb.create_tables(resource, provider_index=local_dynamodb.PROVIDER_INDEX)
+        local_dynamodb.create_version_table(resource)
+        local_dynamodb.seed(users_table, idp_table, args.users, args.providers, workers=8)
+
+    stdout = sys.stdout
+    jwks = LocalJwks()
+    with JwksServer(jwks, delay=args.jwks_delay) as server:
+        config = {
+            'endpoint_url': args.endpoint_url,
+            'jwks_url': server.url,
+            'tokens': [jwks.token() for _ in range(args.sessions)],
+            'users': args.users,
+            'providers': args.providers,
+            'environment': dict(value.split('=', 1) for value in args.env),
+        }
+        overall, histograms, statuses, worker_stats, elapsed = run(args, mix, config)
+        jwks_fetches = server.fetches
+    sys.stdout = stdout
+
+    report = {
+        'dynamodb': args.endpoint_url or 'moto',
+        'pool': args.pool,
+        'workers': args.workers,
+        'target_rate': args.rate,
+        'throughput': round(overall.report()['requests'] / elapsed, 2),
+        'seconds': round(elapsed, 2),
+        'statuses': statuses,
+        'dynamodb_retries': sum(stats['retries'] for stats in worker_stats),
+        'dynamodb_throttles': sum(stats['throttles'] for stats in worker_stats),
+        'jwks_fetches': jwks_fetches,
+        'overall': overall.report(),
+        'endpoints': {name: histogram.report() for name, histogram in histograms.items()},
+        'workers_stats': worker_stats,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
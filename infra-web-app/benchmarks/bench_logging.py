@@ -0,0 +1,116 @@
+"""
+Latency and log volume per request of the API handler at the old DEBUG level and with the current defaults
+(INFO, redaction, a 1% DEBUG sample). Each configuration runs in its own process, as the level is read at import,
+against moto with locally signed tokens.
+
+    python benchmarks/bench_logging.py --requests 2000
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+configurations = {
+    'debug': {'LOG_LEVEL': 'DEBUG', 'LOG_DEBUG_SAMPLE_RATE': '0'},
+    'info, 1% debug sample': {'LOG_LEVEL': 'INFO', 'LOG_DEBUG_SAMPLE_RATE': '0.01'},
+    'info, user list at warning': {'LOG_LEVEL': 'INFO', 'LOG_DEBUG_SAMPLE_RATE': '0.01',
+                                   'ROUTE_LOG_LEVELS': json.dumps({'GET /api/user/': 'WARNING'})},
+}
+
+
+class CountingStream(io.TextIOBase):
+    """
+    Stands in for stdout, where powertools writes, and only counts what is written
+    """
+
+    def __init__(self):
+        self.bytes = 0
+        self.lines = 0
+
+    def write(self, text):
+        self.bytes += len(text.encode('utf-8'))
+        self.lines += text.count('\n')
+        return len(text)
+
+
+class Context:
+    function_name = 'bench_logging'
+    memory_limit_in_mb = 256
+    invoked_function_arn = 'arn:aws:lambda:us-east-1:123456789012:function:bench_logging'
+    aws_request_id = 'bench'
+
+
+def child(name: str, requests: int):
+    import local_jwks
+    import local_dynamodb
+
+    os.environ.update(IDP_TABLE_NAME=local_dynamodb.IDP_TABLE, USER_TABLE_NAME=local_dynamodb.USERS_TABLE,
+                      COGNITO_USER_POOL_CLIENT_ID=local_jwks.CLIENT_ID, POWERTOOLS_TRACE_DISABLED='true',
+                      POWERTOOLS_METRICS_NAMESPACE='bench')
+    resource = local_dynamodb.dynamodb()
+    users, idps = local_dynamodb.create_tables(resource)
+    local_dynamodb.seed(users, idps, users=200, providers=5)
+
+    stdout = sys.stdout
+    stream = sys.stdout = CountingStream()
+    import jwt_token_helper
+    import manage_api
+
+    jwks = local_jwks.LocalJwks()
+    jwt_token_helper.jwks_cache._fetch = jwks.keys
+    headers = {'authorization': f"Bearer {jwks.token()}", 'origin': 'http://localhost:5173'}
+    # provider 1 is a cognito IdP, its users need no password hash
+    user = local_dynamodb.user_item(1, 5)
+    calls = [
+        ('GET', '/api/idp/', None, {}),
+        ('GET', '/api/user/', None, {'limit': '50'}),
+        ('GET', '/api/user/user0000001', None, {'provider': local_dynamodb.provider_name(1)}),
+        ('PUT', '/api/user/', json.dumps(user), {}),
+    ]
+
+    timings = []
+    for i in range(requests):
+        method, path, body, query = calls[i % len(calls)]
+        event = {'httpMethod': method, 'path': path, 'headers': headers, 'queryStringParameters': query,
+                 'body': body, 'isBase64Encoded': False, 'requestContext': {'elb': {'targetGroupArn': 'bench'}}}
+        start = time.perf_counter()
+        response = manage_api.handler(event, Context())
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response['statusCode'] == 200, response
+    sys.stdout = stdout
+    timings.sort()
+    print(json.dumps({
+        'configuration': name,
+        'requests': requests,
+        'p50_ms': round(timings[len(timings) // 2], 3),
+        'p99_ms': round(timings[int(len(timings) * 0.99) - 1], 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'log_bytes_per_request': round(stream.bytes / requests),
+        'log_lines_per_request': round(stream.lines / requests, 2),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.requests)
+        return
+
+    results = []
+    for name, environment in configurations.items():
+        env = {**os.environ, 'ROUTE_LOG_LEVELS': '{}', **environment}
+        output = subprocess.run([sys.executable, __file__, '--child', name, '--requests', str(args.requests)],
+                                env=env, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+The CloudWatch metrics of manage_users.handler and manage_idps.handler per route, read back from the EMF records
+the functions write to stdout, against DynamoDB Local or moto.
+
+    python benchmarks/bench_metrics.py --iterations 20
+    python benchmarks/bench_metrics.py --iterations 20 --raw > emf.ndjson
+
+Exits with 1 when a route misses one of the metrics every routed request publishes. --raw prints the captured
+EMF records instead of the summary.
+"""
+import argparse
+import io
+import json
+import statistics
+import sys
+
+import bench_handlers
+import local_api
+import local_dynamodb
+from local_jwks import LocalJwks, JwksServer
+
+# published by api_router for every request that matched a route
+required_metrics = ('HandlerDuration', 'JwtVerifyDuration', 'ClientErrors', 'ServerErrors')
+
+
+def emf_records(text: str):
+    """
+    The EMF records in captured stdout, skipping log records and anything else that is not a metrics record
+    """
+    records = []
+    for line in text.splitlines():
+        if not line.startswith('{'):
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(record, dict) and '_aws' in record:
+            records.append(record)
+    return records
+
+
+def metric_values(record: dict):
+    """
+    {(dimension values...): {metric name: [values]}} of one EMF record
+    """
+    found = {}
+    for directive in record['_aws']['CloudWatchMetrics']:
+        for dimensions in directive['Dimensions']:
+            key = tuple(f"{name}={record[name]}" for name in dimensions)
+            for metric in directive['Metrics']:
+                value = record.get(metric['Name'])
+                values = value if isinstance(value, list) else [value]
+                found.setdefault(key, {}).setdefault(metric['Name'], []).extend(values)
+    return found
+
+
+def summary(records: list):
+    """
+    Per dimension set, for every metric: how many requests published it, the sum and the mean of its values
+    """
+    totals = {}
+    for record in records:
+        for key, metrics in metric_values(record).items():
+            route = totals.setdefault(key, {'requests': 0, 'metrics': {}})
+            route['requests'] += 1
+            for name, values in metrics.items():
+                entry = route['metrics'].setdefault(name, {'requests': 0, 'values': []})
+                entry['requests'] += 1
+                entry['values'].extend(values)
+    return {
+        ', '.join(key): {
+            'requests': route['requests'],
+            'metrics': {name: {'requests': entry['requests'], 'sum': round(sum(entry['values']), 3),
+                               'mean': round(statistics.fmean(entry['values']), 3)}
+                        for name, entry in sorted(route['metrics'].items())},
+        }
+        for key, route in sorted(totals.items())
+    }
+
+
+def missing_metrics(routes: dict):
+    """
+    {route: [metric names]} of the routed requests that miss a required metric
+    """
+    return {key: missing for key, route in routes.items() if 'route=' in key
+            for missing in [[name for name in required_metrics if name not in route['metrics']]] if missing}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--endpoint-url', help='DynamoDB Local endpoint, moto when omitted')
+    parser.add_argument('--users', type=int, default=200, help='users to seed')
+    parser.add_argument('--providers', type=int, default=5)
+    parser.add_argument('--iterations', type=int, default=10, help='requests per endpoint')
+    parser.add_argument('--raw', action='store_true', help='print the EMF records instead of the summary')
+    args = parser.parse_args()
+
+    resource = local_dynamodb.dynamodb(args.endpoint_url)
+    users_table, idp_table = local_dynamodb.create_tables(resource, provider_index=local_dynamodb.PROVIDER_INDEX)
+    local_dynamodb.create_version_table(resource)
+    local_dynamodb.seed(users_table, idp_table, args.users, args.providers)
+
+    jwks = LocalJwks()
+    token = jwks.token()
+    local_api.handler_environment()
+    stdout = sys.stdout
+    captured = sys.stdout = io.StringIO()
+    try:
+        with JwksServer(jwks) as server:
+            handlers = dict(zip(('idp', 'user'), local_api.load_handlers(server.url)))
+            context = local_api.Context()
+            for name, (group, request) in bench_handlers.endpoints(args.users, args.providers).items():
+                for i in range(args.iterations):
+                    method, path, body, query = request(i)
+                    handlers[group](local_api.alb_event(method, path, token, body=body, query=query), context)
+    finally:
+        sys.stdout = stdout
+
+    records = emf_records(captured.getvalue())
+    if args.raw:
+        for record in records:
+            print(json.dumps(record))
+        return
+    routes = summary(records)
+    missing = missing_metrics(routes)
+    print(json.dumps({'records': len(records), 'routes': routes}, indent=2))
+    if missing:
+        print(json.dumps({'missing_metrics': missing}, indent=2), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Parse and validate cost per item of the IdP and user payload models, next to json.loads alone.
+
+    python benchmarks/bench_models.py --iterations 20000
+"""
+import argparse
+import json
+import statistics
+import time
+
+import local_jwks  # noqa: F401 puts functions on sys.path
+import simplejson
+import models
+
+# bodies as the UI sends them, with the empty fields of the other modules
+payloads = {
+    'idp argon2': {'provider': 'local-users', 'module': 'argon2',
+                   'config': {'attributes': {}, 'ssl': True, 'ssl_verify': True}},
+    'idp ldap': {'provider': 'corp-ad', 'module': 'ldap', 'public_key_support': False,
+                 'config': {'attributes': {'uid': 'uidNumber', 'gid': 'gidNumber', 'role': '', 'policy': ''},
+                            'server': 'ldap.example.com', 'search_base': 'DC=EXAMPLE,DC=COM', 'port': 636,
+                            'ssl': True, 'ssl_verify': True, 'ldap_allowed_groups': ['sftp-users', 'admins'],
+                            'ldap_service_account_secret_arn': 'arn:aws:secretsmanager:us-east-1:111122223333:secret:ldap',
+                            'cognito_client_id': '', 'client_id': '', 'ignore_missing_attributes': False}},
+    'idp cognito': {'provider': 'partner-pool', 'module': 'cognito',
+                    'config': {'attributes': {}, 'cognito_client_id': '5f8b2example', 'mfa': True,
+                               'mfa_token_length': 6, 'cognito_user_pool_region': 'us-east-1'}},
+    'user argon2': {'user': 'jdoe', 'identity_provider_key': 'local-users', 'identity_provider_module': 'argon2',
+                    'ipv4_allow_list': ['10.0.0.0/8', '192.168.0.0/16'],
+                    'config': {'HomeDirectoryDetails': [{'Entry': '/', 'Target': '/bucket/jdoe'}],
+                               'PosixProfile': [{'Uid': '1000', 'Gid': '1000'}], 'PublicKeys': [],
+                               'Role': 'arn:aws:iam::111122223333:role/transfer-user',
+                               'HomeDirectoryType': 'LOGICAL',
+                               'argon2_hash': '$argon2id$v=19$m=65536,t=3,p=4$c2FsdA$aGFzaA'}},
+}
+
+
+def measure(body: str, parse, iterations: int):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        parse(body)
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    timings.sort()
+    return {
+        'p50_us': round(timings[len(timings) // 2], 2),
+        'p99_us': round(timings[int(len(timings) * 0.99) - 1], 2),
+        'mean_us': round(statistics.fmean(timings), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    results = []
+    for name, payload in payloads.items():
+        body = json.dumps(payload)
+        parse_model = models.parse_user if name.startswith('user') else models.parse_idp
+        stored = models.item(parse_model(payload))
+        results.append({
+            'payload': name,
+            'body_bytes': len(body),
+            'stored_bytes': len(simplejson.dumps(stored)),
+            'json_loads': measure(body, lambda text: simplejson.loads(text, use_decimal=True), args.iterations),
+            'json_loads_and_model': measure(
+                body, lambda text: models.item(parse_model(simplejson.loads(text, use_decimal=True))), args.iterations),
+        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Full table read throughput of the parallel scan engine over a synthetic users table.
+
+    # DynamoDB Local on port 8000, the realistic setup
+    python benchmarks/bench_parallel_scan.py --endpoint-url http://localhost:8000 --rows 500000
+    # moto in process, only useful as a smoke test for small tables
+    python benchmarks/bench_parallel_scan.py --rows 5000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+import local_jwks  # noqa: F401 puts the functions package on sys.path
+import local_dynamodb
+
+
+def measure(users_table, segments: int, projection, trace_memory: bool):
+    import parallel_scan
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    count = 0
+    for _ in parallel_scan.parallel_scan(users_table, segments=segments, projection=projection):
+        count += 1
+    elapsed = time.perf_counter() - start
+    result = {
+        'segments': segments,
+        'projection': projection or 'all',
+        'items': count,
+        'seconds': round(elapsed, 3),
+        'items_per_second': round(count / elapsed),
+    }
+    if trace_memory:
+        result['peak_memory_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        tracemalloc.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--endpoint-url', help='DynamoDB Local endpoint, moto when omitted')
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--segments', default='1,2,4,8,16', help='comma separated TotalSegments to compare')
+    parser.add_argument('--trace-memory', action='store_true', help='report peak python memory, slows the scan down')
+    parser.add_argument('--skip-seed', action='store_true', help='reuse the tables of a previous run')
+    args = parser.parse_args()
+
+    resource = local_dynamodb.dynamodb(args.endpoint_url)
+    if args.skip_seed:
+        users_table = resource.Table(local_dynamodb.USERS_TABLE)
+    else:
+        users_table, idp_table = local_dynamodb.create_tables(resource)
+        start = time.perf_counter()
+        local_dynamodb.seed(users_table, idp_table, args.rows)
+        print(f"seeded {args.rows} users in {time.perf_counter() - start:.1f}s")
+
+    results = []
+    for segments in (int(value) for value in args.segments.split(',')):
+        results.append(measure(users_table, segments, None, args.trace_memory))
+        results.append(measure(users_table, segments, ['user', 'identity_provider_key', 'config.Role'],
+                               args.trace_memory))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
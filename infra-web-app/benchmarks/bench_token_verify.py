@@ -0,0 +1,54 @@
+"""
+Verify path latency of jwt_token_helper with the verified-token cache on and off.
+
+    python benchmarks/bench_token_verify.py --iterations 2000 --tokens 10
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from local_jwks import LocalJwks, CLIENT_ID
+
+os.environ.setdefault('COGNITO_USER_POOL_CLIENT_ID', CLIENT_ID)
+
+import jwt_token_helper  # noqa: E402
+
+
+def run(jwks: LocalJwks, tokens, iterations: int, enabled: bool):
+    key_cache = jwt_token_helper.JwksCache(fetch=jwks.keys)
+    cache = jwt_token_helper.TokenCache(key_cache=key_cache, enabled=enabled)
+    timings = []
+    for i in range(iterations):
+        token = tokens[i % len(tokens)]
+        start = time.perf_counter()
+        jwt_token_helper.validate_token_cached(token, cache)
+        timings.append((time.perf_counter() - start) * 1_000_000)
+    timings.sort()
+    return {
+        'token_cache': 'on' if enabled else 'off',
+        'iterations': iterations,
+        'p50_us': round(timings[len(timings) // 2], 1),
+        'p99_us': round(timings[int(len(timings) * 0.99) - 1], 1),
+        'mean_us': round(statistics.fmean(timings), 1),
+        'verifications_per_second': round(iterations / (sum(timings) / 1_000_000)),
+        'cache': cache.stats(),
+        'jwks': key_cache.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--tokens', type=int, default=10, help='distinct tokens, i.e. concurrent admin sessions')
+    args = parser.parse_args()
+
+    jwks = LocalJwks()
+    tokens = [jwks.token() for _ in range(args.tokens)]
+    results = [run(jwks, tokens, args.iterations, enabled) for enabled in (False, True)]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+ALB events and handler setup for benchmarks that call the Lambda handlers in process.
+
+Events have the shape the ALB sends the functions, event.json holds one captured from the UI, and carry a token
+signed by a LocalJwks. The handlers fetch that JWKS from a JwksServer on localhost with jwt_token_helper.fetch_keys,
+so the JWKS fetch is part of the measurement and can be counted.
+"""
+import os
+import statistics
+
+from local_jwks import CLIENT_ID
+import local_dynamodb
+
+# request headers of the UI, from event.json
+browser_headers = {
+    'accept': '*/*',
+    'accept-encoding': 'gzip, deflate, br, zstd',
+    'accept-language': 'en-US,en;q=0.9',
+    'connection': 'keep-alive',
+    'host': 'localhost:8080',
+    'origin': 'http://localhost:5173',
+    'referer': 'http://localhost:5173/',
+    'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) '
+                  'Chrome/131.0.0.0 Safari/537.36',
+    'x-amzn-trace-id': 'Root=1-6771aa3f-4eb091d43da9df797230e814',
+    'x-forwarded-for': '10.0.0.113',
+    'x-forwarded-port': '80',
+    'x-forwarded-proto': 'http',
+}
+target_group_arn = 'arn:aws:elasticloadbalancing:us-east-1:123456789012:targetgroup/Toolkit-API/3147f9537e1d9773'
+
+
+class Context:
+    function_name = 'ToolkitWebAppLocal'
+    memory_limit_in_mb = 1024
+    invoked_function_arn = 'arn:aws:lambda:us-east-1:123456789012:function:ToolkitWebAppLocal'
+    aws_request_id = 'local'
+
+
+def alb_event(method: str, path: str, token: str, body: str = None, query: dict = None, headers: dict = None):
+    """
+    ALB event for a UI request, body is the JSON text the UI sends
+    """
+    request_headers = {**browser_headers, 'authorization': f"Bearer {token}"}
+    if body is not None:
+        request_headers.update({'content-type': 'text/plain;charset=UTF-8', 'content-length': str(len(body))})
+    request_headers.update(headers or {})
+    return {
+        'requestContext': {'elb': {'targetGroupArn': target_group_arn}},
+        'httpMethod': method,
+        'path': path,
+        'queryStringParameters': query or {},
+        'headers': request_headers,
+        'body': body or '',
+        'isBase64Encoded': False,
+    }
+
+
+def handler_environment(**overrides):
+    """
+    Environment of the deployed functions, set before the handler modules are imported
+    """
+    os.environ.update({
+        'IDP_TABLE_NAME': local_dynamodb.IDP_TABLE,
+        'USER_TABLE_NAME': local_dynamodb.USERS_TABLE,
+        'USER_PROVIDER_INDEX': local_dynamodb.PROVIDER_INDEX,
+        'VERSION_TABLE_NAME': local_dynamodb.VERSION_TABLE,
+        'COGNITO_USER_POOL_CLIENT_ID': CLIENT_ID,
+        'POWERTOOLS_SERVICE_NAME': 'ToolkitIdpAdmin',
+        'POWERTOOLS_METRICS_NAMESPACE': 'TransferFamilyToolkit',
+        'POWERTOOLS_TRACE_DISABLED': 'true',
+        'LOG_LEVEL': 'WARNING',
+        **overrides,
+    })
+
+
+def load_handlers(jwks_url: str):
+    """
+    Import the IdP and user handlers, with the JWKS cache of the functions fetching from jwks_url
+    :return: manage_idps.handler and manage_users.handler
+    """
+    import jwt_token_helper
+    import manage_idps
+    import manage_users
+
+    jwt_token_helper.jwks_cache._fetch = lambda: jwt_token_helper.fetch_keys(jwks_url)
+    return manage_idps.handler, manage_users.handler
+
+
+def percentiles(timings_ms: list):
+    timings = sorted(timings_ms)
+    if not timings:
+        return {}
+
+    def at(share: float):
+        return round(timings[min(len(timings) - 1, int(len(timings) * share))], 3)
+
+    return {
+        'p50_ms': at(0.50),
+        'p95_ms': at(0.95),
+        'p99_ms': at(0.99),
+        'max_ms': round(timings[-1], 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+    }
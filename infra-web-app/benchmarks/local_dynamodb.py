@@ -0,0 +1,136 @@
+"""
+DynamoDB stand-in for benchmarks: DynamoDB Local when an endpoint url is given, otherwise moto in process.
+
+DynamoDB Local (https://docs.aws.amazon.com/amazondynamodb/latest/developerguide/DynamoDBLocal.html)
+behaves much closer to the real service for parallel and large reads, moto needs nothing but pip.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+USERS_TABLE = 'transferidp_users'
+IDP_TABLE = 'transferidp_identity_providers'
+VERSION_TABLE = 'toolkit_table_versions'
+PROVIDER_INDEX = 'identity_provider_key-index'
+MODULE_INDEX = 'identity_provider_module-index'
+MODULES = ('argon2', 'cognito', 'ldap', 'okta', 'entra')
+
+
+def dynamodb(endpoint_url: str = None):
+    """
+    DynamoDB resource for the stand-in, boto3 inside the functions package picks up the same endpoint
+    """
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'local')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'local')
+    if endpoint_url:
+        os.environ['AWS_ENDPOINT_URL_DYNAMODB'] = endpoint_url
+    else:
+        from moto import mock_aws
+        mock_aws().start()
+    return boto3.resource('dynamodb')
+
+
+def create_tables(resource, users_table: str = USERS_TABLE, idp_table: str = IDP_TABLE, provider_index: str = None,
+                  module_index: str = None):
+    """
+    Tables with the key schema the toolkit expects, dropped first if they already exist
+    :param provider_index: name of the KEYS_ONLY index on identity_provider_key the stack adds, none when empty
+    :param module_index: name of the KEYS_ONLY index on identity_provider_module a stack owning the tables can add
+    """
+    existing = {table.name for table in resource.tables.all()}
+    for name in (users_table, idp_table):
+        if name in existing:
+            resource.Table(name).delete()
+            resource.Table(name).wait_until_not_exists()
+    attributes = [{'AttributeName': 'user', 'AttributeType': 'S'},
+                  {'AttributeName': 'identity_provider_key', 'AttributeType': 'S'}]
+    indexes = []
+    for index_name, partition_key in ((provider_index, 'identity_provider_key'),
+                                      (module_index, 'identity_provider_module')):
+        if not index_name:
+            continue
+        if partition_key not in {attribute['AttributeName'] for attribute in attributes}:
+            attributes.append({'AttributeName': partition_key, 'AttributeType': 'S'})
+        indexes.append({
+            'IndexName': index_name,
+            'KeySchema': [{'AttributeName': partition_key, 'KeyType': 'HASH'},
+                          {'AttributeName': 'user', 'KeyType': 'RANGE'}],
+            'Projection': {'ProjectionType': 'KEYS_ONLY'},
+        })
+    users = resource.create_table(TableName=users_table,
+                                  KeySchema=[{'AttributeName': 'user', 'KeyType': 'HASH'},
+                                             {'AttributeName': 'identity_provider_key', 'KeyType': 'RANGE'}],
+                                  AttributeDefinitions=attributes, BillingMode='PAY_PER_REQUEST',
+                                  **({'GlobalSecondaryIndexes': indexes} if indexes else {}))
+    idps = resource.create_table(TableName=idp_table,
+                                 KeySchema=[{'AttributeName': 'provider', 'KeyType': 'HASH'}],
+                                 AttributeDefinitions=[{'AttributeName': 'provider', 'AttributeType': 'S'}],
+                                 BillingMode='PAY_PER_REQUEST')
+    users.wait_until_exists()
+    idps.wait_until_exists()
+    return users, idps
+
+
+def create_version_table(resource, name: str = VERSION_TABLE):
+    """
+    Empty version marker table, like ToolkitWebAppTableVersions of the stack
+    """
+    if name in {table.name for table in resource.tables.all()}:
+        resource.Table(name).delete()
+        resource.Table(name).wait_until_not_exists()
+    table = resource.create_table(TableName=name,
+                                  KeySchema=[{'AttributeName': 'table_name', 'KeyType': 'HASH'}],
+                                  AttributeDefinitions=[{'AttributeName': 'table_name', 'AttributeType': 'S'}],
+                                  BillingMode='PAY_PER_REQUEST')
+    table.wait_until_exists()
+    return table
+
+
+def provider_name(index: int):
+    return f"provider-{index:03}"
+
+
+def idp_item(index: int):
+    return {
+        'provider': provider_name(index),
+        'module': MODULES[index % len(MODULES)],
+        'config': {'ssl': True, 'ssl_verify': True, 'attributes': {}},
+    }
+
+
+def user_item(index: int, providers: int):
+    provider = index % providers
+    return {
+        'user': f"user{index:07}",
+        'identity_provider_key': provider_name(provider),
+        'identity_provider_module': MODULES[provider % len(MODULES)],
+        'ipv4_allow_list': ['10.0.0.0/8'],
+        'config': {
+            'Role': f"arn:aws:iam::123456789012:role/transfer-role-{index % 20}",
+            'HomeDirectoryType': 'LOGICAL',
+            'HomeDirectoryDetails': [{'Entry': '/', 'Target': f"/bucket/home/user{index:07}"}],
+            'PosixProfile': [],
+            'PublicKeys': [],
+        },
+    }
+
+
+def seed(users_table, idp_table, users: int, providers: int = 10, workers: int = 1):
+    """
+    Write providers IdPs and users synthetic users spread evenly over them
+    :param workers: threads writing users, each with its own client, for tables of a million users
+    """
+    with idp_table.batch_writer() as batch:
+        for index in range(providers):
+            batch.put_item(Item=idp_item(index))
+
+    def write(worker: int):
+        table = boto3.session.Session().resource('dynamodb').Table(users_table.name) if workers > 1 else users_table
+        with table.batch_writer() as batch:
+            for index in range(worker, users, workers):
+                batch.put_item(Item=user_item(index, providers))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(write, range(workers)))
@@ -0,0 +1,106 @@
+"""
+Locally generated RSA key pair and JWKS for signing Cognito shaped access tokens in benchmarks.
+
+Nothing here talks to AWS, tokens are signed with a throwaway key and verified against a JWKS
+built from it. JwksServer publishes the JWKS over HTTP on localhost, for runs that exercise the fetch.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import rsa
+from jose import jwk, jwt
+from jose.constants import ALGORITHMS
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'functions')
+if FUNCTIONS_DIR not in sys.path:
+    sys.path.insert(0, FUNCTIONS_DIR)
+
+CLIENT_ID = 'local-benchmark-client'
+
+
+class LocalJwks:
+    """
+    One signing key, published under kid in a JWKS document
+    """
+
+    def __init__(self, kid: str = 'local-key-1', bits: int = 2048):
+        self.kid = kid
+        public_key, private_key = rsa.newkeys(bits)
+        self._private_pem = private_key.save_pkcs1().decode('utf-8')
+        public_jwk = jwk.construct(public_key.save_pkcs1().decode('utf-8'), ALGORITHMS.RS256).to_dict()
+        public_jwk.update({'kid': kid, 'use': 'sig'})
+        self.public_jwk = public_jwk
+
+    def keys(self):
+        """
+        Same shape as the 'keys' list of the user pool jwks.json
+        """
+        return [self.public_jwk]
+
+    def document(self):
+        return {'keys': self.keys()}
+
+    def token(self, groups=('IdpAdmins', 'UserAdmins'), ttl: int = 3600, client_id: str = CLIENT_ID, **claims):
+        now = int(time.time())
+        payload = {
+            'sub': str(uuid.uuid4()),
+            'cognito:groups': list(groups),
+            'token_use': 'access',
+            'scope': 'aws.cognito.signin.user.admin',
+            'auth_time': now,
+            'iat': now,
+            'exp': now + ttl,
+            'jti': str(uuid.uuid4()),
+            'client_id': client_id,
+            'username': 'benchmark-admin',
+        }
+        payload.update(claims)
+        return jwt.encode(payload, self._private_pem, algorithm=ALGORITHMS.RS256, headers={'kid': self.kid})
+
+
+class JwksServer:
+    """
+    Serves the JWKS of a LocalJwks at /cognito/.well-known/jwks.json on a free localhost port, counting fetches
+    """
+
+    path = '/cognito/.well-known/jwks.json'
+
+    def __init__(self, jwks: LocalJwks, delay: float = 0):
+        self.jwks = jwks
+        self.delay = delay
+        self.fetches = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != server.path:
+                    self.send_error(404)
+                    return
+                server.fetches += 1
+                if server.delay:
+                    time.sleep(server.delay)
+                body = json.dumps(server.jwks.document()).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self._httpd.server_port}{self.path}"
+
+    def __enter__(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,212 @@
+from aws_lambda_powertools import Logger
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+from collections import Counter
+import os
+import time
+import simplejson as json
+import ddb_helper
+
+# Users per IdP, module and role, and IdPs per module, as counters in the aggregates table, so GET /api/stats
+# reads them with one Query instead of scanning the users table. stats_consumer.py keeps the counters up to date
+# from the DynamoDB streams of the users and IdP tables.
+#
+# A change adds -1 to the counters of the old image and +1 to those of the new image with UpdateItem ADD. Lambda
+# retries stream batches, so a record is applied in one transaction with a marker item keyed by its eventID and
+# skipped when the marker is there already. Markers expire after MARKER_TTL_SECONDS, longer than a stream keeps
+# records (24 hours).
+#
+# After the stream was off, or to correct the counters, recompute them from full scans of both tables:
+#   python functions/aggregates.py --rebuild
+
+logger = Logger(child=True)
+
+table_name = os.environ.get('STATS_TABLE_NAME')
+source_tables = {os.environ.get('USER_TABLE_NAME'): 'users', os.environ.get('IDP_TABLE_NAME'): 'idps'}
+marker_ttl = int(os.environ.get('MARKER_TTL_SECONDS', 2 * 86400))
+
+# partition of the counters, read by one Query, and of the applied stream record markers
+counts_scope = 'counts'
+applied_scope = 'applied'
+# counted attributes per kind of item, as (dimension, attribute path). The counters are named
+# "<kind>" for the total and "<kind>#<dimension>#<value>", e.g. users#module#ldap
+dimensions = {
+    'users': (('provider', 'identity_provider_key'), ('module', 'identity_provider_module'), ('role', 'config.Role')),
+    'idps': (('module', 'module'),),
+}
+
+_deserializer = TypeDeserializer()
+
+
+def _table():
+    return ddb_helper.resource().Table(table_name)
+
+
+def counter_names(kind: str, item: dict):
+    """
+    Counters an item of kind counts towards, none for a missing item
+    """
+    if item is None:
+        return []
+    names = [kind]
+    for dimension, path in dimensions[kind]:
+        value = item
+        for name in path.split('.'):
+            value = value.get(name) if isinstance(value, dict) else None
+        if isinstance(value, str) and value:
+            names.append(f"{kind}#{dimension}#{value}")
+    return names
+
+
+def deltas(kind: str, old: dict, new: dict):
+    """
+    Counter changes for an item going from old to new, either may be None, counters that don't change are left out
+    """
+    changes = Counter(counter_names(kind, new))
+    changes.subtract(counter_names(kind, old))
+    return {name: delta for name, delta in changes.items() if delta}
+
+
+def image(record: dict, name: str):
+    """
+    OldImage or NewImage of a stream record as python values, None when the record has none
+    """
+    attributes = record['dynamodb'].get(name)
+    if attributes is None:
+        return None
+    return {key: _deserializer.deserialize(value) for key, value in attributes.items()}
+
+
+def source_kind(record: dict):
+    """
+    'users' or 'idps' from the table in the eventSourceARN, arn:aws:dynamodb:...:table/<name>/stream/<label>
+    """
+    return source_tables.get(record['eventSourceARN'].split(':table/', 1)[-1].split('/', 1)[0])
+
+
+def apply_record(record: dict):
+    """
+    Apply the counter changes of a stream record once, however often the record is delivered
+    :return: 'applied', 'duplicate', 'unchanged' when no counter changes or 'ignored' for a table that isn't counted
+    """
+    kind = source_kind(record)
+    if kind is None:
+        return 'ignored'
+    changes = deltas(kind, image(record, 'OldImage'), image(record, 'NewImage'))
+    if not changes:
+        # e.g. a new password or allow list, no marker needed as nothing is written
+        return 'unchanged'
+    marker = {
+        'Put': {
+            'TableName': table_name,
+            'Item': {'scope': applied_scope, 'name': record['eventID'], 'expires': int(time.time()) + marker_ttl},
+            'ConditionExpression': 'attribute_not_exists(#n)',
+            'ExpressionAttributeNames': {'#n': 'name'},
+        }
+    }
+    updates = [{
+        'Update': {
+            'TableName': table_name,
+            'Key': {'scope': counts_scope, 'name': name},
+            'UpdateExpression': 'ADD #c :delta',
+            'ExpressionAttributeNames': {'#c': 'count'},
+            'ExpressionAttributeValues': {':delta': delta},
+        }
+    } for name, delta in sorted(changes.items())]
+    try:
+        ddb_helper.resource().meta.client.transact_write_items(TransactItems=[marker, *updates])
+    except ClientError as e:
+        reasons = e.response.get('CancellationReasons') or [{}]
+        if e.response['Error']['Code'] == 'TransactionCanceledException' and reasons[0].get('Code') == 'ConditionalCheckFailed':
+            logger.debug("stream record %s was applied already", record['eventID'])
+            return 'duplicate'
+        raise
+    return 'applied'
+
+
+def read():
+    """
+    All counters with a Query of the counts partition
+    :return: {"users": {"total": n, "provider": {...}, "module": {...}, "role": {...}}, "idps": {"total": n, "module": {...}}}
+    """
+    stats = {kind: {'total': 0, **{dimension: {} for dimension, _ in counted}} for kind, counted in dimensions.items()}
+    kwargs = {'KeyConditionExpression': Key('scope').eq(counts_scope)}
+    while True:
+        response = _table().query(**kwargs)
+        for item in response['Items']:
+            count = int(item.get('count', 0))
+            if count <= 0:
+                continue
+            kind, _, counter = item['name'].partition('#')
+            if not counter:
+                stats.setdefault(kind, {})['total'] = count
+                continue
+            dimension, _, value = counter.partition('#')
+            stats.setdefault(kind, {}).setdefault(dimension, {})[value] = count
+        if 'LastEvaluatedKey' not in response:
+            return stats
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def rebuild(user_table_name: str = None, idp_table_name: str = None, segments: int = None):
+    """
+    Recompute every counter from parallel scans of the users and IdP tables and remove counters of values
+    that are gone. Changes streamed while the scans run may be counted twice or not at all, run it while
+    the tables are quiet or run it again.
+    :return: number of counters written and removed, and the totals
+    """
+    import parallel_scan
+    tables = {'users': user_table_name or os.environ['USER_TABLE_NAME'],
+              'idps': idp_table_name or os.environ['IDP_TABLE_NAME']}
+    counts = Counter()
+    for kind, name in tables.items():
+        projection = [path for _, path in dimensions[kind]]
+        for item in parallel_scan.parallel_scan(ddb_helper.resource().Table(name), segments=segments,
+                                                projection=projection):
+            counts.update(counter_names(kind, item))
+    for kind in tables:
+        # a zero total instead of a missing one
+        counts.setdefault(kind, 0)
+
+    table = _table()
+    existing = set()
+    kwargs = {'KeyConditionExpression': Key('scope').eq(counts_scope), 'ProjectionExpression': '#n',
+              'ExpressionAttributeNames': {'#n': 'name'}}
+    while True:
+        response = table.query(**kwargs)
+        existing.update(item['name'] for item in response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    removed = existing.difference(counts)
+    with table.batch_writer() as batch:
+        for name, count in counts.items():
+            batch.put_item(Item={'scope': counts_scope, 'name': name, 'count': count})
+        for name in removed:
+            batch.delete_item(Key={'scope': counts_scope, 'name': name})
+    return {'counters': len(counts), 'removed': len(removed), **{kind: counts[kind] for kind in tables}}
+
+
+def main():
+    global table_name
+    import argparse
+    parser = argparse.ArgumentParser(description="Read or rebuild the user and IdP statistics")
+    parser.add_argument('--rebuild', action='store_true', help='recompute the counters from full scans')
+    parser.add_argument('--users-table', default=os.environ.get('USER_TABLE_NAME'))
+    parser.add_argument('--idp-table', default=os.environ.get('IDP_TABLE_NAME'))
+    parser.add_argument('--stats-table', default=table_name)
+    parser.add_argument('--segments', type=int, help='parallel scan segments')
+    args = parser.parse_args()
+    if not args.stats_table:
+        parser.error('--stats-table or STATS_TABLE_NAME is required')
+    table_name = args.stats_table
+    if args.rebuild:
+        if not args.users_table or not args.idp_table:
+            parser.error('--rebuild needs --users-table and --idp-table, or USER_TABLE_NAME and IDP_TABLE_NAME')
+        print(json.dumps(rebuild(args.users_table, args.idp_table, args.segments), indent=2))
+    print(json.dumps(read(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,410 @@
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools import Metrics
+from aws_lambda_powertools import Tracer
+from aws_lambda_powertools.metrics import MetricUnit
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable
+import hashlib
+import importlib
+import logging
+import os
+import time
+import ddb_helper
+import jwt_token_helper as jwt
+import log_helper
+import profile_helper
+import response_codec
+
+logger = Logger(child=True)
+metrics = Metrics()
+tracer = Tracer()
+
+default_origin = 'http://localhost:8080/'
+
+# cognito groups of the caller of the request being handled, for routes that need more than their required claim
+request_claims = ContextVar('request_claims', default=())
+# Lambda context of the request being handled, for routes that stop working before the function times out
+request_context = ContextVar('request_context', default=None)
+
+# CORS headers are the same for every response apart from the origin and the allowed methods,
+# build them once per container instead of per request
+cors_headers = {
+    "Content-Type": "application/json",
+    "Access-Control-Allow-Headers": "Content-Type, Authorization, If-None-Match, X-Profile",
+    "Access-Control-Expose-Headers": "ETag",
+    "Access-Control-Allow-Credentials": "true",
+}
+
+
+@dataclass(frozen=True)
+class Route:
+    """
+    A single API operation
+
+    method: HTTP method
+    prefix: path prefix the route serves, the remainder of the path is the resource id. A prefix not ending in /
+        only matches up to a / or the end of the path, /api/stats serves /api/stats but not /api/statsanything
+    handler: function taking the ALB event, returning the http response, raises ValueError for a bad request
+    required_claim: cognito group the caller must belong to
+    """
+    method: str
+    prefix: str
+    handler: Callable
+    required_claim: str
+
+    @property
+    def name(self):
+        """
+        Method and prefix, e.g. "GET /api/user/", as used for log levels, metrics and traces
+        """
+        return f"{self.method} {self.prefix}"
+
+    def serves(self, path: str):
+        """
+        True if path is the prefix, or continues it after a path segment boundary
+        """
+        if not path.startswith(self.prefix):
+            return False
+        return len(path) == len(self.prefix) or self.prefix.endswith('/') or path[len(self.prefix)] == '/'
+
+
+class Router:
+    """
+    Dispatches ALB events to declared routes, handling CORS preflight and JWT validation once for all of them
+    """
+
+    def __init__(self, routes: list, warm_modules: tuple = ()):
+        # longest prefix first, so /api/user/import wins over /api/user/
+        self.routes = sorted(routes, key=lambda route: len(route.prefix), reverse=True)
+        self._allowed_methods = {}
+        for route in self.routes:
+            self._allowed_methods.setdefault(route.prefix, {"OPTIONS"}).add(route.method)
+        # routers are built after the service logger, its handler is there to add redaction to
+        log_helper.configure(logger)
+        # provisioned concurrency initializes environments before they get a request, do the first request's work there
+        if os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE') == 'provisioned-concurrency':
+            self.warm_up(warm_modules)
+
+    def warm_up(self, modules: tuple = ()):
+        """
+        Import the modules routes load lazily and fetch the JWKS, so the first request pays for neither
+        """
+        for name in modules:
+            importlib.import_module(name)
+        try:
+            jwt.jwks_cache.warm()
+        except Exception as e:
+            logger.warning("unable to fetch the JWKS while warming up: %s", e)
+
+    def match(self, path: str, method: str):
+        """
+        Find the route for path and method
+
+        returns the route, or None and the allowed methods of the path if the method is not supported
+        """
+        prefix_found = None
+        for route in self.routes:
+            if route.serves(path):
+                if prefix_found is None:
+                    prefix_found = route.prefix
+                if route.method == method:
+                    return route, None
+        if prefix_found is None:
+            return None, None
+        return None, self._allowed_methods[prefix_found]
+
+    def handle(self, event, context=None):
+        request_context.set(context)
+        http_method = event['httpMethod']
+        path = event['path']
+        route, allowed = (None, None) if http_method == "OPTIONS" else self.match(path, http_method)
+        log_helper.apply_level(log_helper.level_for(route))
+        logger.debug("request %s %s query %s headers %s", http_method, path, event.get('queryStringParameters'),
+                     event['headers'])
+        if http_method == "OPTIONS":
+            return self.options(event)
+
+        if route is None:
+            if allowed is None:
+                return not_found(event, path)
+            return jwt.unsupported_method(http_method)
+
+        # every metric of the request is published with the route as its only dimension besides the service
+        metrics.add_dimension(name="route", value=route.name)
+        # capacity consumed outside of a request, e.g. while warming up, is not charged to this one
+        ddb_helper.capacity.take()
+        start = time.perf_counter()
+        http_response = self.dispatch(route, event, profile_helper.requested(event['headers']))
+        add_request_metrics(http_response["statusCode"], start)
+        return http_response
+
+    def dispatch(self, route: Route, event, profiled: bool = False):
+        """
+        Validate the token and call the route's handler
+        :param profiled: profile the handler when the caller may be profiled, see profile_helper
+        """
+        http_method = event['httpMethod']
+        path = event['path']
+        request_claims.set(())
+        jwks_before = jwt.jwks_cache.stats()
+        start = time.perf_counter()
+        with tracer.provider.in_subsegment("## authorize") as subsegment:
+            try:
+                jwt_token = event['headers']['authorization'].split(' ')[1]
+                claims, cached = jwt.validate_token_cached(jwt_token)
+                subsegment.put_annotation("token_cached", cached)
+                metrics.add_metric(name="TokenCacheHit" if cached else "TokenCacheMiss", unit=MetricUnit.Count, value=1)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("token is valid with claims %s, jwks cache %s", claims, jwt.jwks_cache.stats())
+            except Exception as e:
+                logger.error("error validating token: %s", e)
+                return jwt.invalid_token(e)
+            finally:
+                add_jwt_metrics(start, jwks_before)
+
+        if route.required_claim not in claims:
+            logger.error("token is valid, but missing required claim: %s", route.required_claim)
+            return jwt.invalid_token(f"token is valid, but missing required claim: {route.required_claim}")
+
+        request_claims.set(tuple(claims))
+        # only callers in PROFILE_GROUPS get a profile, and only of the handler, once their token was checked
+        profiler = None
+        if profiled and profile_helper.allowed(claims):
+            # the profile is logged at INFO, whatever the level of the route
+            log_helper.apply_level(min(logger.getEffectiveLevel(), logging.INFO))
+            profiler = profile_helper.start()
+        start = time.perf_counter()
+        # routes add annotations of their own to this subsegment with annotate and add_item_count
+        with tracer.provider.in_subsegment("## route") as subsegment:
+            subsegment.put_annotation("route", route.name)
+            try:
+                return route.handler(event)
+            except ValueError as e:
+                logger.warning("bad request %s %s: %s", http_method, path, e)
+                return bad_request(event, str(e), http_method)
+            except Exception as e:
+                logger.exception("error handling %s %s", http_method, path)
+                return server_error(event, e)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                    log_profile(route, profiler, start)
+
+    def options(self, event):
+        """
+        Support for CORS preflight request for localhost and ELB endpoints
+        :return: formatted http response
+        """
+        logger.debug("OPTIONS")
+        allowed = None
+        for route in self.routes:
+            if route.serves(event['path']):
+                allowed = self._allowed_methods[route.prefix]
+                break
+        methods = ",".join(sorted(allowed)) if allowed else "OPTIONS"
+        return response(event, 200, None, methods)
+
+
+def handler_module():
+    """
+    Module of the Lambda handler of this environment, e.g. manage_users for manage_users.handler, None outside Lambda
+    """
+    handler = os.environ.get('_HANDLER')
+    return handler.rsplit('.', 1)[0] if handler else None
+
+
+jwks_metrics = (("JwksCacheHit", "hits"), ("JwksCacheMiss", "misses"), ("JwksFetch", "refreshes"))
+
+
+def log_profile(route: Route, profiler, start: float):
+    """
+    Log the hot functions of a profiled request
+    """
+    logger.info("profile of %s, %.1f ms under cProfile", route.name, (time.perf_counter() - start) * 1000,
+                extra={"profile": profile_helper.hot_functions(profiler)})
+
+
+def annotate(key: str, value):
+    """
+    Add an X-Ray annotation to the subsegment of the route being handled, for filtering traces
+    """
+    tracer.put_annotation(key=key, value=value)
+
+
+def add_jwt_metrics(start: float, jwks_before: dict):
+    metrics.add_metric(name="JwtVerifyDuration", unit=MetricUnit.Milliseconds,
+                       value=(time.perf_counter() - start) * 1000)
+    # a token served from the token cache does not look up the JWKS at all
+    jwks_after = jwt.jwks_cache.stats()
+    for name, counter in jwks_metrics:
+        if jwks_after[counter] != jwks_before[counter]:
+            metrics.add_metric(name=name, unit=MetricUnit.Count, value=jwks_after[counter] - jwks_before[counter])
+
+
+def add_request_metrics(status_code: int, start: float):
+    """
+    Duration, errors and DynamoDB consumed capacity of the request, errors are 0 or 1 so their average is a rate
+    """
+    metrics.add_metric(name="HandlerDuration", unit=MetricUnit.Milliseconds, value=(time.perf_counter() - start) * 1000)
+    metrics.add_metric(name="ClientErrors", unit=MetricUnit.Count, value=int(400 <= status_code < 500))
+    metrics.add_metric(name="ServerErrors", unit=MetricUnit.Count, value=int(status_code >= 500))
+    read_units, write_units, calls = ddb_helper.capacity.take()
+    if calls:
+        metrics.add_metric(name="DynamoDBCalls", unit=MetricUnit.Count, value=calls)
+        metrics.add_metric(name="ConsumedReadCapacity", unit=MetricUnit.Count, value=read_units)
+        metrics.add_metric(name="ConsumedWriteCapacity", unit=MetricUnit.Count, value=write_units)
+
+
+def add_item_count(count: int):
+    """
+    Number of items a route returned, call once per response that carries items
+    """
+    metrics.add_metric(name="ItemCount", unit=MetricUnit.Count, value=count)
+    tracer.put_annotation(key="item_count", value=count)
+
+
+def response(event, status_code: int, body, methods: str, description: str = None):
+    """
+    Build an ALB response from the prebuilt CORS headers
+    :param event: request event, used for the allowed origin
+    :param status_code: http status code
+    :param body: serialized to JSON unless None or already serialized bytes, compressed when large and the client accepts gzip or br
+    :param methods: value of Access-Control-Allow-Methods
+    :param description: status description, defaults to the standard reason phrase
+    :return: formatted http response
+    """
+    headers = dict(cors_headers)
+    headers["Access-Control-Allow-Origin"] = event['headers'].get('origin', default_origin)  # apply allow list for more control
+    headers["Access-Control-Allow-Methods"] = methods
+    http_response = {
+        "isBase64Encoded": False,
+        "statusCode": status_code,
+        "statusDescription": description or status_descriptions.get(status_code, str(status_code)),
+        "headers": headers,
+    }
+    if body is not None:
+        serialized = body if isinstance(body, bytes) else serialize(body)
+        with tracer.provider.in_subsegment("## encode") as subsegment:
+            encoded, is_base64, encoding = response_codec.encode(serialized, event['headers'].get('accept-encoding'))
+            subsegment.put_metadata("encoding", {"bytes": len(serialized), "content_encoding": encoding})
+        http_response["body"] = encoded
+        http_response["isBase64Encoded"] = is_base64
+        headers["Vary"] = "Origin, Accept-Encoding"
+        if encoding:
+            headers["Content-Encoding"] = encoding
+    return http_response
+
+
+def serialize(body) -> bytes:
+    with tracer.provider.in_subsegment("## serialize"):
+        return response_codec.dumps(body)
+
+
+def deadline(margin: float):
+    """
+    time.monotonic() by which the current request should have stopped working, margin seconds before the
+    function times out, None when the request has no Lambda context
+    """
+    context = request_context.get()
+    if context is None:
+        return None
+    return time.monotonic() + context.get_remaining_time_in_millis() / 1000 - margin
+
+
+def has_claim(claim: str):
+    """
+    True if the caller of the current request belongs to the cognito group
+    """
+    return claim in request_claims.get()
+
+
+def forbidden(event, message: str, method: str):
+    return response(event, 403, {"message": message}, f"OPTIONS,{method}")
+
+
+def query_parameters(event):
+    return event.get('queryStringParameters') or {}
+
+
+def ok(event, body, method: str):
+    return response(event, 200, body, f"OPTIONS,{method}")
+
+
+def cached_ok(event, version, load: Callable, method: str = "GET"):
+    """
+    200 with a strong ETag, or 304 when the If-None-Match of the request still matches
+    :param event: request event
+    :param version: version marker of the data behind the response, None to tag the serialized body instead
+    :param load: returns the response body, not called when the version marker already matches
+    :param method: method for Access-Control-Allow-Methods
+    :return: formatted http response
+    """
+    if version is not None:
+        etag = entity_tag(event, version)
+        if etag_matches(event, etag):
+            return not_modified(event, etag, method)
+        body = serialize(load())
+    else:
+        body = serialize(load())
+        # the compressed and the plain body are different bytes, so they get different strong ETags
+        encoding = response_codec.content_encoding(body, event['headers'].get('accept-encoding'))
+        digest = hashlib.sha256(body)
+        digest.update(f"|{encoding or 'identity'}".encode('ascii'))
+        etag = f'"{digest.hexdigest()[:32]}"'
+        if etag_matches(event, etag):
+            return not_modified(event, etag, method)
+    http_response = response(event, 200, body, f"OPTIONS,{method}")
+    http_response["headers"].update(validator_headers(etag))
+    return http_response
+
+
+def entity_tag(event, version: str):
+    """
+    Strong ETag for a version marker, distinct per path, query and accepted encoding since all of them
+    change the bytes sent
+    """
+    query = sorted(query_parameters(event).items())
+    source = f"{version}|{event['path']}|{query}|{event['headers'].get('accept-encoding', '')}"
+    return f'"{version}-{hashlib.sha256(source.encode("utf-8")).hexdigest()[:24]}"'
+
+
+def etag_matches(event, etag: str):
+    if_none_match = event['headers'].get('if-none-match')
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == '*' or etag in (tag.strip() for tag in if_none_match.split(','))
+
+
+def validator_headers(etag: str):
+    # private and no-cache, the browser keeps the response but revalidates it with If-None-Match every time
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def not_modified(event, etag: str, method: str):
+    http_response = response(event, 304, None, f"OPTIONS,{method}")
+    http_response["headers"].update(validator_headers(etag))
+    return http_response
+
+
+def not_found(event, path: str):
+    return response(event, 404, {"message": f"{path} not found"}, "OPTIONS")
+
+
+def bad_request(event, message: str, method: str):
+    return response(event, 400, {"message": message}, f"OPTIONS,{method}")
+
+
+def server_error(event, error: Exception):
+    return response(event, 500, {"message": f"{type(error).__name__}: {error}"}, "OPTIONS")
+
+
+status_descriptions = {
+    200: "200 OK",
+    304: "304 Not Modified",
+    400: "400 Bad Request",
+    403: "403 Forbidden",
+    404: "404 Not Found",
+    405: "405 Method Not Allowed",
+    500: "500 Internal Server Error",
+}
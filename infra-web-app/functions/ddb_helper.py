@@ -0,0 +1,343 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+import base64
+import boto3
+import os
+import random
+import threading
+import time
+import simplejson as json
+
+
+class CapacityMeter:
+    """
+    Capacity consumed by the DynamoDB calls of a client, requested with ReturnConsumedCapacity=TOTAL on every
+    operation that supports it. Calls made from scan and batch worker threads are counted too.
+    """
+    read_operations = frozenset(('GetItem', 'BatchGetItem', 'Query', 'Scan', 'TransactGetItems'))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.read_units = 0.0
+        self.write_units = 0.0
+        self.calls = 0
+
+    def register(self, client):
+        # the resource copies the parameters before building them, they have to be set there and not earlier
+        client.meta.events.register('before-parameter-build.dynamodb', self._request_capacity,
+                                    unique_id='ddb-helper-request-capacity')
+        client.meta.events.register('after-call.dynamodb', self._add, unique_id='ddb-helper-consumed-capacity')
+
+    def _request_capacity(self, params, model, **kwargs):
+        if 'ReturnConsumedCapacity' in model.input_shape.members:
+            params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+    def _add(self, parsed=None, model=None, **kwargs):
+        consumed = (parsed or {}).get('ConsumedCapacity') or []
+        # a dict for single table operations, a list per table for batches and transactions
+        if isinstance(consumed, dict):
+            consumed = [consumed]
+        units = float(sum(entry.get('CapacityUnits', 0) for entry in consumed))
+        with self._lock:
+            self.calls += 1
+            if model.name in self.read_operations:
+                self.read_units += units
+            else:
+                self.write_units += units
+
+    def take(self):
+        """
+        Read and write capacity units and calls since the last take
+        """
+        with self._lock:
+            taken = self.read_units, self.write_units, self.calls
+            self.read_units = self.write_units = 0.0
+            self.calls = 0
+        return taken
+
+
+capacity = CapacityMeter()
+
+
+@cache
+def resource():
+    """
+    DynamoDB resource shared by every module loaded in the container, so IdP and user routes reuse one connection pool
+    """
+    dynamodb = boto3.resource("dynamodb")
+    capacity.register(dynamodb.meta.client)
+    return dynamodb
+
+
+def query_count(table, index_name: str, key_condition):
+    """
+    Count items matching key_condition with Select=COUNT queries, following LastEvaluatedKey to the last page
+    :param table: boto3 Table resource
+    :param index_name: index to query, None for the table itself
+    :param key_condition: KeyConditionExpression, e.g. Key('identity_provider_key').eq(provider)
+    :return: number of matching items
+    """
+    params = {'KeyConditionExpression': key_condition, 'Select': 'COUNT'}
+    if index_name:
+        params['IndexName'] = index_name
+    count = 0
+    while True:
+        response = table.query(**params)
+        count += response['Count']
+        if 'LastEvaluatedKey' not in response:
+            return count
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def projection(attributes):
+    """
+    ProjectionExpression reading only the given attributes, every name is aliased so reserved words like user are safe
+    :param attributes: attribute names, nested map attributes as dotted paths e.g. config.Role
+    :return: the expression and its ExpressionAttributeNames
+    """
+    aliases = {}
+    paths = []
+    for attribute in attributes:
+        parts = []
+        for name in attribute.split('.'):
+            if name not in aliases:
+                aliases[name] = f"#p{len(aliases)}"
+            parts.append(aliases[name])
+        paths.append('.'.join(parts))
+    return ', '.join(paths), {alias: name for name, alias in aliases.items()}
+
+
+def projection_kwargs(attributes, key_names: tuple = ()):
+    """
+    ProjectionExpression and ExpressionAttributeNames parameters reading attributes and the key attributes,
+    empty when attributes is empty so every attribute is read
+    """
+    if not attributes:
+        return {}
+    expression, names = projection(distinct_paths([*key_names, *attributes]))
+    return {'ProjectionExpression': expression, 'ExpressionAttributeNames': names}
+
+
+def distinct_paths(paths):
+    """
+    Paths without duplicates and without paths inside another one of them, which DynamoDB rejects as overlapping
+    """
+    paths = list(dict.fromkeys(paths))
+    return [path for path in paths if not any(path.startswith(f"{other}.") for other in paths)]
+
+
+def fields_request(query_parameters: dict, allowed):
+    """
+    Read the fields query parameter, comma separated attribute names or paths e.g. fields=user,config.Role
+    :param allowed: attribute names and paths that may be requested
+    :return: the fields, None when all attributes are wanted, raises ValueError on fields not allowed
+    """
+    fields = query_parameters.get('fields')
+    if not fields:
+        return None
+    return checked_fields(fields.split(','), allowed)
+
+
+def checked_fields(fields, allowed):
+    """
+    Validate fields against allowed, raises ValueError on fields not allowed
+    :return: the fields without duplicates and overlapping paths
+    """
+    fields = [field.strip() for field in fields if field.strip()]
+    for field in fields:
+        if field not in allowed:
+            raise ValueError(f"unknown field {field}, fields can be {', '.join(sorted(allowed))}")
+    return distinct_paths(fields)
+
+
+default_page_size = int(os.environ.get('DEFAULT_PAGE_SIZE', 100))
+max_page_size = int(os.environ.get('MAX_PAGE_SIZE', 1000))
+# ALB rejects Lambda responses over 1 MB including headers, keep the items well below that
+max_page_bytes = int(os.environ.get('MAX_PAGE_BYTES', 900 * 1024))
+
+
+def encode_cursor(last_evaluated_key):
+    """
+    Opaque cursor for a LastEvaluatedKey, None when there are no more pages
+    """
+    if not last_evaluated_key:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str):
+    """
+    ExclusiveStartKey for a cursor returned by encode_cursor, raises ValueError when it can't be decoded
+    """
+    if not cursor:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')), use_decimal=True)
+    except Exception:
+        raise ValueError("invalid cursor")
+    if not isinstance(key, dict):
+        raise ValueError("invalid cursor")
+    return key
+
+
+def page_request(query_parameters: dict):
+    """
+    Read limit and cursor query parameters
+    :return: page size capped at MAX_PAGE_SIZE and the ExclusiveStartKey, raises ValueError on bad values
+    """
+    limit = query_parameters.get('limit')
+    if limit is None or limit == '':
+        limit = default_page_size
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError("limit must be a number")
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+    return min(limit, max_page_size), decode_cursor(query_parameters.get('cursor'))
+
+
+def page(operation, key_names: tuple, limit: int, start_key=None, max_bytes: int = None, max_calls: int = None,
+         **kwargs):
+    """
+    Read one page of at most limit items with a table scan or query, following LastEvaluatedKey as needed
+
+    The page is cut short once the serialized items would exceed max_bytes, the cursor then points at the
+    last item returned so the next page continues right after it.
+    :param operation: table.scan or table.query
+    :param key_names: key attributes of the table being read, for a query on an index those of the table and of
+                      the index, used to build the cursor
+    :param limit: maximum number of items
+    :param start_key: ExclusiveStartKey from decode_cursor
+    :param max_bytes: budget for the serialized items, defaults to MAX_PAGE_BYTES
+    :param max_calls: stop after this many calls even if the page is not full, bounds filtered reads that match
+                      few items, unlimited when None
+    :param kwargs: passed on to the operation
+    :return: items and the cursor for the next page, None when the last page was read
+    """
+    max_bytes = max_bytes or max_page_bytes
+    items = []
+    size = 0
+    calls = 0
+    while True:
+        calls += 1
+        params = dict(kwargs, Limit=limit - len(items))
+        if start_key:
+            params['ExclusiveStartKey'] = start_key
+        response = operation(**params)
+        for item in response['Items']:
+            item_size = len(json.dumps(item))
+            if items and size + item_size > max_bytes:
+                return items, encode_cursor({name: items[-1][name] for name in key_names})
+            items.append(item)
+            size += item_size
+        start_key = response.get('LastEvaluatedKey')
+        if not start_key or len(items) >= limit or (max_calls and calls >= max_calls):
+            return items, encode_cursor(start_key)
+
+
+batch_write_size = 25
+
+
+def batch_write(table, requests: list, key_names: tuple, max_attempts: int = 8, base_delay: float = 0.05,
+                deadline: float = None):
+    """
+    BatchWriteItem of up to 25 requests, retrying UnprocessedItems with exponential backoff and full jitter
+    :param table: boto3 Table resource
+    :param requests: PutRequest or DeleteRequest dicts, no two for the same key
+    :param key_names: key attributes of the table, used to report which requests were not processed
+    :param max_attempts: BatchWriteItem calls before giving up on the remaining requests
+    :param base_delay: seconds before the first retry, doubled for every further retry
+    :param deadline: time.monotonic() after which no retry is started
+    :return: keys (as tuples in key_names order) of requests still unprocessed after max_attempts or the deadline
+    """
+    client = table.meta.client
+    pending = requests
+    for attempt in range(max_attempts):
+        response = client.batch_write_item(RequestItems={table.name: pending})
+        pending = response.get('UnprocessedItems', {}).get(table.name, [])
+        if not pending:
+            return []
+        if attempt + 1 < max_attempts:
+            delay = random.uniform(0, base_delay * 2 ** attempt)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                break
+            time.sleep(delay)
+    return [request_key(request, key_names) for request in pending]
+
+
+batch_get_size = 100
+
+
+def batch_get(table, keys: list, key_names: tuple, attributes=None, max_attempts: int = 8, base_delay: float = 0.05):
+    """
+    BatchGetItem of up to 100 keys, retrying UnprocessedKeys with exponential backoff and full jitter
+    :param table: boto3 Table resource
+    :param keys: key dicts, no duplicates
+    :param key_names: key attributes of the table, always read so found items can be matched to their keys
+    :param attributes: attribute names or paths to read, all attributes when empty
+    :param max_attempts: BatchGetItem calls before giving up on the remaining keys
+    :param base_delay: seconds before the first retry, doubled for every further retry
+    :return: items found and keys (as tuples in key_names order) still unprocessed after max_attempts
+    """
+    client = table.meta.client
+    request = projection_kwargs(attributes, key_names)
+    items = []
+    pending = keys
+    for attempt in range(max_attempts):
+        response = client.batch_get_item(RequestItems={table.name: {**request, 'Keys': pending}})
+        items.extend(response['Responses'].get(table.name, []))
+        pending = response.get('UnprocessedKeys', {}).get(table.name, {}).get('Keys', [])
+        if not pending:
+            return items, []
+        if attempt + 1 < max_attempts:
+            time.sleep(random.uniform(0, base_delay * 2 ** attempt))
+    return items, [tuple(key[name] for name in key_names) for key in pending]
+
+
+def in_trace(function):
+    """
+    function wrapped to run in the X-Ray trace entity of the calling thread. X-Ray keeps its context per thread,
+    without it the DynamoDB calls of worker threads hang off the function's segment instead of the request's route.
+    """
+    try:
+        from aws_xray_sdk.core import xray_recorder
+        from aws_xray_sdk.core.lambda_launcher import LambdaContext
+    except ImportError:
+        return function
+    # outside Lambda there is no segment unless one was begun, looking it up would log an error
+    if not isinstance(xray_recorder.context, LambdaContext):
+        return function
+    entity = xray_recorder.get_trace_entity()
+
+    def run(*args, **kwargs):
+        xray_recorder.set_trace_entity(entity)
+        return function(*args, **kwargs)
+    return run
+
+
+def batch_get_all(table, keys: list, key_names: tuple, attributes=None, workers: int = 4):
+    """
+    Any number of keys read with batch_get in chunks of 100, the chunks run concurrently
+    :param keys: key dicts, no duplicates
+    :param workers: concurrent BatchGetItem calls
+    :return: items found, in no particular order, and keys (as tuples in key_names order) still unprocessed
+    """
+    if not keys:
+        return [], []
+    chunks = [keys[start:start + batch_get_size] for start in range(0, len(keys), batch_get_size)]
+    with ThreadPoolExecutor(max_workers=min(len(chunks), workers)) as executor:
+        results = list(executor.map(in_trace(lambda chunk: batch_get(table, chunk, key_names, attributes)), chunks))
+    return [item for found, _ in results for item in found], [key for _, unprocessed in results for key in unprocessed]
+
+
+def request_key(request: dict, key_names: tuple):
+    """
+    Key of a PutRequest or DeleteRequest as a tuple in key_names order
+    """
+    if 'PutRequest' in request:
+        item = request['PutRequest']['Item']
+    else:
+        item = request['DeleteRequest']['Key']
+    return tuple(item[name] for name in key_names)
@@ -0,0 +1,200 @@
+from datetime import datetime, timezone
+import argparse
+import base64
+import gzip
+import hashlib
+import os
+import simplejson as json
+import ddb_helper
+import parallel_scan
+
+# Snapshots of the users and IdP tables as gzip compressed NDJSON, one item per line, with a manifest
+# of item counts and checksums next to them. Items stream from a parallel scan through gzip into an
+# S3 multipart upload (or a local file), so memory use does not grow with the table.
+#
+# Nightly snapshots run as a Lambda function (handler), ad hoc exports from the command line:
+#   python functions/export_tables.py --table transferidp_users --output users.ndjson.gz
+#   python functions/export_tables.py --table transferidp_users --bucket my-bucket --prefix exports/manual
+
+part_size = 8 * 1024 * 1024
+
+
+def _json_default(value):
+    # DynamoDB sets and binary values have no JSON type
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if hasattr(value, 'value') and isinstance(value.value, bytes):
+        return base64.b64encode(value.value).decode('ascii')
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode('ascii')
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class ChecksumWriter:
+    """
+    Passes bytes on to a file like sink, counting them and computing their sha256
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.bytes += len(data)
+        return self.sink.write(data)
+
+    def flush(self):
+        pass
+
+
+class S3MultipartWriter:
+    """
+    File like object uploading to S3 in parts of part_size, holding one part in memory at most
+    """
+
+    def __init__(self, s3_client, bucket: str, key: str, content_type: str = 'application/gzip'):
+        self.client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.buffer = bytearray()
+        self.parts = []
+        # no Content-Encoding, clients would decompress on download and the bytes wouldn't match gzip_sha256
+        self.upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)['UploadId']
+
+    def write(self, data):
+        self.buffer.extend(data)
+        if len(self.buffer) >= part_size:
+            self._upload_part()
+        return len(data)
+
+    def _upload_part(self):
+        part_number = len(self.parts) + 1
+        response = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                           PartNumber=part_number, Body=bytes(self.buffer))
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+        self.buffer = bytearray()
+
+    def close(self):
+        if self.buffer or not self.parts:
+            self._upload_part()
+        self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                              MultipartUpload={'Parts': self.parts})
+
+    def abort(self):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+
+def write_items(items, sink):
+    """
+    Write items as gzip compressed NDJSON to sink
+    :param items: iterable of items
+    :param sink: binary file like object
+    :return: item count, sha256 and size of the uncompressed NDJSON, sha256 and size of the compressed output
+    """
+    compressed = ChecksumWriter(sink)
+    uncompressed_sha256 = hashlib.sha256()
+    uncompressed_bytes = 0
+    count = 0
+    with gzip.GzipFile(fileobj=compressed, mode='wb', mtime=0) as out:
+        for item in items:
+            line = (json.dumps(item, separators=(',', ':'), default=_json_default) + '\n').encode('utf-8')
+            out.write(line)
+            uncompressed_sha256.update(line)
+            uncompressed_bytes += len(line)
+            count += 1
+    return {
+        'items': count,
+        'ndjson_sha256': uncompressed_sha256.hexdigest(),
+        'ndjson_bytes': uncompressed_bytes,
+        'gzip_sha256': compressed.sha256.hexdigest(),
+        'gzip_bytes': compressed.bytes,
+    }
+
+
+def export_table(table_name: str, sink, segments: int = None):
+    """
+    Export every item of a table to sink
+    :return: manifest entry for the table
+    """
+    started = datetime.now(timezone.utc)
+    items = parallel_scan.parallel_scan(ddb_helper.resource().Table(table_name), segments=segments)
+    entry = write_items(items, sink)
+    return {'table': table_name, 'started_at': started.isoformat(),
+            'finished_at': datetime.now(timezone.utc).isoformat(), **entry}
+
+
+def export_to_s3(table_names, bucket: str, prefix: str, segments: int = None, s3_client=None):
+    """
+    Export tables to s3://bucket/prefix/<table>.ndjson.gz and write prefix/manifest.json
+    :return: the manifest
+    """
+    import boto3
+    s3_client = s3_client or boto3.client('s3')
+    prefix = prefix.strip('/')
+    entries = []
+    for table_name in table_names:
+        key = f"{prefix}/{table_name}.ndjson.gz"
+        writer = S3MultipartWriter(s3_client, bucket, key)
+        try:
+            entry = export_table(table_name, writer, segments)
+        except Exception:
+            writer.abort()
+            raise
+        writer.close()
+        entries.append({**entry, 'object': f"s3://{bucket}/{key}"})
+    manifest = {'format': 'ndjson+gzip', 'tables': entries}
+    s3_client.put_object(Bucket=bucket, Key=f"{prefix}/manifest.json", Body=json.dumps(manifest, indent=2).encode('utf-8'),
+                         ContentType='application/json')
+    return manifest
+
+
+def export_to_file(table_name: str, path: str, segments: int = None):
+    """
+    Export a table to a local file, the manifest is written to <path>.manifest.json
+    :return: the manifest
+    """
+    with open(path, 'wb') as sink:
+        entry = export_table(table_name, sink, segments)
+    manifest = {'format': 'ndjson+gzip', 'tables': [{**entry, 'object': path}]}
+    with open(f"{path}.manifest.json", 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return manifest
+
+
+def handler(event, context):
+    """
+    Scheduled snapshot of the users and IdP tables to EXPORT_BUCKET under exports/<date>/
+    """
+    from aws_lambda_powertools import Logger
+    logger = Logger()
+    prefix = f"{os.environ.get('EXPORT_PREFIX', 'exports')}/{datetime.now(timezone.utc):%Y-%m-%d}"
+    manifest = export_to_s3([os.environ['USER_TABLE_NAME'], os.environ['IDP_TABLE_NAME']],
+                            os.environ['EXPORT_BUCKET'], prefix)
+    for entry in manifest['tables']:
+        logger.info("exported %s items of %s to %s", entry['items'], entry['table'], entry['object'])
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a DynamoDB table as gzip compressed NDJSON")
+    parser.add_argument('--table', required=True, action='append', help='table name, repeat for more tables')
+    parser.add_argument('--output', help='local file, only with a single --table')
+    parser.add_argument('--bucket', help='S3 bucket')
+    parser.add_argument('--prefix', default=f"exports/{datetime.now(timezone.utc):%Y-%m-%d}", help='S3 key prefix')
+    parser.add_argument('--segments', type=int, help='parallel scan segments')
+    args = parser.parse_args()
+    if args.output:
+        if len(args.table) != 1:
+            parser.error('--output exports a single --table')
+        manifest = export_to_file(args.table[0], args.output, args.segments)
+    elif args.bucket:
+        manifest = export_to_s3(args.table, args.bucket, args.prefix, args.segments)
+    else:
+        parser.error('either --output or --bucket is required')
+    print(json.dumps(manifest, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+import ddb_helper
+import parallel_scan
+
+# Removes every user of an IdP before the IdP itself. Users are found with a query on the provider
+# index, or a parallel scan when there is no index, and deleted with concurrent BatchWriteItem calls.
+# Work stops once the time budget is spent and the position is returned as a checkpoint, so a large
+# IdP is removed over several invocations without running into the Lambda timeout.
+
+key_names = ('user', 'identity_provider_key')
+time_budget = float(os.environ.get('CASCADE_TIME_BUDGET_SECONDS', 2.0))
+delete_workers = int(os.environ.get('CASCADE_DELETE_WORKERS', 4))
+
+
+class UserDeleter:
+    """
+    Deletes user keys in concurrent batches of 25, keeps the counts for the progress report
+    """
+
+    def __init__(self, users_table, workers: int):
+        self.table = users_table
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cascade-delete')
+        self.futures = []
+        self.pending = []
+        self.deleted = 0
+        self.failed = []
+
+    def add(self, keys):
+        for key in keys:
+            self.pending.append({'DeleteRequest': {'Key': {name: key[name] for name in key_names}}})
+            if len(self.pending) == ddb_helper.batch_write_size:
+                self._submit()
+
+    def _submit(self):
+        requests, self.pending = self.pending, []
+        self.futures.append((len(requests), self.executor.submit(ddb_helper.batch_write, self.table, requests, key_names)))
+
+    def wait(self):
+        """
+        Flush the last partial batch and wait for every submitted batch
+        """
+        if self.pending:
+            self._submit()
+        for size, future in self.futures:
+            try:
+                unprocessed = future.result()
+            except ClientError as e:
+                self.failed.append(e.response['Error'].get('Message', str(e)))
+                continue
+            self.deleted += size - len(unprocessed)
+            self.failed.extend(f"{user}/{provider}" for user, provider in unprocessed)
+        self.futures = []
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def delete_users(users_table, provider: str, checkpoint: dict = None, provider_index: str = None,
+                 budget: float = None, workers: int = None):
+    """
+    Delete users of an IdP until all are gone or the time budget is spent
+    :param users_table: boto3 Table resource of the users table
+    :param provider: identity_provider_key of the IdP being removed
+    :param checkpoint: checkpoint returned by an earlier call, None to start
+    :param provider_index: GSI on identity_provider_key, scans the table when None
+    :param budget: seconds to spend, defaults to CASCADE_TIME_BUDGET_SECONDS
+    :param workers: concurrent BatchWriteItem calls, defaults to CASCADE_DELETE_WORKERS
+    :return: deleted count, failures and the checkpoint to continue from, None when every user was visited
+    """
+    if checkpoint is not None and not isinstance(checkpoint.get('query', {}), dict):
+        # scan checkpoints are checked by parallel_scan
+        raise ValueError("invalid cursor")
+    deadline = time.monotonic() + (budget or time_budget)
+    deleter = UserDeleter(users_table, workers or delete_workers)
+    try:
+        if provider_index and (checkpoint is None or 'query' in checkpoint):
+            next_checkpoint = _delete_queried(users_table, provider, provider_index, checkpoint, deleter, deadline)
+        else:
+            next_checkpoint = _delete_scanned(users_table, provider, checkpoint, deleter, deadline)
+    finally:
+        deleter.close()
+    return {'deleted': deleter.deleted, 'failed': deleter.failed, 'checkpoint': next_checkpoint}
+
+
+def _delete_queried(users_table, provider, provider_index, checkpoint, deleter, deadline):
+    params = {
+        'IndexName': provider_index,
+        'KeyConditionExpression': Key('identity_provider_key').eq(provider),
+    }
+    start_key = (checkpoint or {}).get('query')
+    while True:
+        if start_key:
+            params['ExclusiveStartKey'] = start_key
+        response = users_table.query(**params)
+        deleter.add(response['Items'])
+        start_key = response.get('LastEvaluatedKey')
+        if not start_key:
+            deleter.wait()
+            return None
+        if time.monotonic() >= deadline:
+            deleter.wait()
+            return {'query': start_key}
+
+
+def _delete_scanned(users_table, provider, checkpoint, deleter, deadline):
+    positions = parallel_scan.ScanPositions(parallel_scan.default_segments, (checkpoint or {}).get('scan'))
+    pages = parallel_scan.scan_pages(users_table,
+                                     projection=key_names,
+                                     positions=positions.checkpoint(),
+                                     FilterExpression=Attr('identity_provider_key').eq(provider))
+    try:
+        for page in pages:
+            deleter.add(page['Items'])
+            positions.consumed(page)
+            if time.monotonic() >= deadline:
+                break
+    finally:
+        pages.close()
+    deleter.wait()
+    scan_checkpoint = positions.checkpoint()
+    return {'scan': scan_checkpoint} if scan_checkpoint else None
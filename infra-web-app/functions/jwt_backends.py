@@ -0,0 +1,78 @@
+import base64
+import os
+
+# Signature backends for jwt_token_helper. A backend builds the public key of a JWKS entry and checks an RS256
+# signature, parsing the token and checking its claims stays in jwt_token_helper. JWT_BACKEND selects one:
+#   jose          python-jose, with the pure python rsa package unless cryptography is installed
+#   cryptography  cryptography (OpenSSL), the library PyJWT verifies RS256 with
+# Unset, cryptography is used when it is installed, else jose.
+
+
+def b64decode(segment):
+    """
+    Decode base64url without padding, as used in JWTs and JWKs
+    """
+    if isinstance(segment, str):
+        segment = segment.encode('ascii')
+    return base64.urlsafe_b64decode(segment + b'=' * (-len(segment) % 4))
+
+
+class JoseBackend:
+    name = 'jose'
+
+    def __init__(self):
+        from jose import jwk
+        self._jwk = jwk
+
+    def public_key(self, key: dict):
+        return self._jwk.construct(key)
+
+    def verify(self, public_key, signing_input: bytes, signature: bytes):
+        return public_key.verify(signing_input, signature)
+
+
+class CryptographyBackend:
+    name = 'cryptography'
+
+    def __init__(self):
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding, rsa
+        self._invalid_signature = InvalidSignature
+        self._rsa = rsa
+        self._padding = padding.PKCS1v15()
+        self._hash = hashes.SHA256()
+
+    def public_key(self, key: dict):
+        if key.get('kty') != 'RSA':
+            raise ValueError(f"unsupported key type {key.get('kty')}")
+        return self._rsa.RSAPublicNumbers(int.from_bytes(b64decode(key['e']), 'big'),
+                                          int.from_bytes(b64decode(key['n']), 'big')).public_key()
+
+    def verify(self, public_key, signing_input: bytes, signature: bytes):
+        try:
+            public_key.verify(signature, signing_input, self._padding, self._hash)
+        except self._invalid_signature:
+            return False
+        return True
+
+
+backends = {
+    'jose': JoseBackend,
+    'cryptography': CryptographyBackend,
+}
+
+
+def backend(name: str = None):
+    """
+    Backend by name, JWT_BACKEND when name is empty, cryptography if installed when both are empty
+    """
+    name = name or os.environ.get('JWT_BACKEND')
+    if name:
+        if name not in backends:
+            raise ValueError(f"JWT_BACKEND must be one of {', '.join(backends)}")
+        return backends[name]()
+    try:
+        return CryptographyBackend()
+    except ImportError:
+        return JoseBackend()
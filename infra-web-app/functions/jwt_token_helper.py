@@ -1,11 +1,15 @@
+import hashlib
 import json
 import time
 import os
 import re
+import threading
 import urllib.request
-from jose import jwk, jwt
-from jose.utils import base64url_decode
-from functools import cache
+from collections import OrderedDict
+from aws_lambda_powertools import Tracer
+import jwt_backends
+
+tracer = Tracer()
 
 # JavaScript helper: https://github.com/awslabs/aws-jwt-verify#the-jwks-cache
 # python code is from here: https://github.com/awslabs/aws-support-tools/blob/master/Cognito/decode-verify-jwt/decode-verify-jwt.py
@@ -13,77 +17,292 @@ from functools import cache
 class JwtTokenException(Exception):
     pass
 
-@cache
 def get_keys():
     """
     Get the keys from Cognito user pool, endpoint must be available on ENV variable JWKS_PROXY_ENDPOINT
+
+    This always goes upstream, use the module level jwks_cache instead of calling this on the request path
     """
 
     endpoint = os.environ['JWKS_PROXY_ENDPOINT']
-    print(f"keys url: {endpoint}")
 
-    if re.search("^https:.*execute-api*.*amazonaws\\.com.*cognito/.well-known/jwks\\.json", endpoint):
-        with urllib.request.urlopen(endpoint) as f:
-            response = f.read()
-    else:
+    if not re.search("^https:.*execute-api*.*amazonaws\\.com.*cognito/.well-known/jwks\\.json", endpoint):
         raise JwtTokenException({'message':'Invalid JWKS_PROXY_ENDPOINT', 'code':'00'})
+    return fetch_keys(endpoint)
+
+
+def fetch_keys(endpoint: str):
+    """
+    Get the 'keys' list of the JWKS document at endpoint, without checking the endpoint
+    """
+    with urllib.request.urlopen(endpoint) as f:
+        response = f.read()
 
     # have to format this to hit the cognito proxy in API gateway, then we are green light
     keys = json.loads(response.decode('utf-8'))['keys']
     return keys
 
-def validate_token(jwt_token, keys):
+
+class JwksCache:
     """
-    Validate the JWT token
+    Public keys of the user pool indexed by kid, constructed once per fetch instead of once per request.
 
-    returns claims if valid, else throws an exception
+    Keys are fresh for ttl seconds. After that they are still served for stale_ttl seconds while a
+    single background refresh runs, past that window the refresh is done inline. A kid that is not in
+    the cache triggers a refresh at most once every min_refresh_interval seconds, so junk tokens can't
+    be used to hammer the JWKS endpoint.
     """
 
-    headers = jwt.get_unverified_headers(jwt_token)
+    def __init__(self, fetch=get_keys, ttl: float = None, stale_ttl: float = None, min_refresh_interval: float = None,
+                 backend=None):
+        self._fetch = fetch
+        # builds the public keys and verifies signatures with them, see jwt_backends
+        self.backend = backend or jwt_backends.backend()
+        self.ttl = ttl if ttl is not None else float(os.environ.get('JWKS_CACHE_TTL_SECONDS', 3600))
+        self.stale_ttl = stale_ttl if stale_ttl is not None else float(os.environ.get('JWKS_CACHE_STALE_SECONDS', 86400))
+        self.min_refresh_interval = (min_refresh_interval if min_refresh_interval is not None
+                                     else float(os.environ.get('JWKS_MIN_REFRESH_SECONDS', 30)))
+        self._keys = {}
+        self._fetched_at = None
+        self._last_attempt = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        # the counters change on request threads and the background refresh, _lock is held for a whole fetch
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def get_key(self, kid):
+        """
+        Get the constructed public key for kid
 
-    kid = headers['kid']
-    #print(kid)
+        returns the key, else throws a JwtTokenException
+        """
+        age = self._age()
+        if age is None or age > self.ttl + self.stale_ttl:
+            self._refresh_now()
+        elif age > self.ttl:
+            self._refresh_in_background()
 
-    key_index = -1
-    for i in range(len(keys)):
-        if kid == keys[i]['kid']:
-            key_index = i
-            break
-    if key_index == -1:
-        get_keys.cache_clear() # force a refresh for next attempt
+        key = self._keys.get(kid)
+        if key is not None:
+            self._count('hits')
+            return key
+
+        self._count('misses')
+        if self._may_refresh():
+            self._refresh_now()
+            key = self._keys.get(kid)
+            if key is not None:
+                return key
         raise JwtTokenException({'message':'Public key not found in jwks.json', 'code':'01'})
 
-    # construct the public key
-    public_key = jwk.construct(keys[key_index])
-    # get the last two sections of the token,
-    # message and signature (encoded in base64)
-    message, encoded_signature = str(jwt_token).rsplit('.', 1)
-    # decode the signature
-    decoded_signature = base64url_decode(encoded_signature.encode('utf-8'))
-    # verify the signature
-    if not public_key.verify(message.encode("utf8"), decoded_signature):
+    def warm(self):
+        """
+        Fetch the keys ahead of the first request unless they are there already, raises like get_key
+        """
+        if self._age() is None:
+            # environments are initialized outside of an invocation, there is no trace to add a subsegment to
+            self._refresh_now(trace=False)
+
+    def has_kid(self, kid):
+        """
+        True if kid is in the current key set, does not count as a hit or trigger a refresh
+        """
+        return kid in self._keys
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'refresh_failures': self.refresh_failures,
+                'keys': len(self._keys),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._fetched_at = None
+            self._last_attempt = None
+
+    def _count(self, counter: str):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _age(self):
+        if self._fetched_at is None:
+            return None
+        return time.monotonic() - self._fetched_at
+
+    def _may_refresh(self):
+        return self._last_attempt is None or time.monotonic() - self._last_attempt >= self.min_refresh_interval
+
+    def _refresh_now(self, trace: bool = True):
+        with self._lock:
+            # another thread may have refreshed while we waited on the lock
+            if not self._may_refresh() and self._keys:
+                return
+            if not trace:
+                self._refresh()
+                return
+            with tracer.provider.in_subsegment("## jwks_fetch") as subsegment:
+                self._refresh()
+                subsegment.put_annotation("jwks_keys", len(self._keys))
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing or not self._may_refresh():
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                with self._lock:
+                    self._refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _refresh(self):
+        # caller holds the lock
+        self._last_attempt = time.monotonic()
+        try:
+            keys = {key['kid']: self.backend.public_key(key) for key in self._fetch()}
+        except Exception:
+            self._count('refresh_failures')
+            if not self._keys:
+                raise
+            # keep serving the keys we already have
+            return
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+        self._count('refreshes')
+
+
+jwks_cache = JwksCache()
+
+
+def validate_token(jwt_token, key_cache: JwksCache = jwks_cache):
+    """
+    Validate the JWT token
+
+    returns claims if valid, else throws an exception
+    """
+    kid, claims = verify_token(jwt_token, key_cache)
+    return claims['cognito:groups']
+
+def verify_token(jwt_token, key_cache: JwksCache = jwks_cache):
+    """
+    Verify signature, expiry, audience and use of the JWT token, parsing it once
+
+    returns the kid that signed the token and the full claims, else throws an exception
+    """
+    try:
+        header_segment, claims_segment, signature_segment = jwt_token.split('.')
+        header = json.loads(jwt_backends.b64decode(header_segment))
+        claims = json.loads(jwt_backends.b64decode(claims_segment))
+        signature = jwt_backends.b64decode(signature_segment)
+        kid = header['kid']
+    except (AttributeError, KeyError, TypeError, ValueError):
+        raise JwtTokenException({'message':'Malformed token', 'code':'05'})
+    # cognito signs with RS256 only, never let the token pick the algorithm
+    if header.get('alg') != 'RS256':
+        raise JwtTokenException({'message':'Unsupported token algorithm', 'code':'06'})
+
+    # the public key is constructed once per JWKS fetch
+    public_key = key_cache.get_key(kid)
+    signing_input = f"{header_segment}.{claims_segment}".encode('ascii')
+    if not key_cache.backend.verify(public_key, signing_input, signature):
         raise JwtTokenException({'message':'Signature verification failed', 'code':'02'})
-    print('Signature successfully verified')
-
-    # since we passed the verification, we can now safely
-    # use the unverified claims
-    claims = jwt.get_unverified_claims(jwt_token)
-    print(claims)
-    # additionally, we can verify the token expiration
-    if time.time() > claims['exp']:
-        raise JwtTokenException({'message':'Token is expired', 'code':'03'})
 
-    # and the Audience (use claims['client_id'] if verifying an access token)
-    app_client_id = os.environ['COGNITO_USER_POOL_CLIENT_ID']
-    if claims['client_id'] != app_client_id:
+    if not isinstance(claims, dict):
+        raise JwtTokenException({'message':'Malformed token', 'code':'05'})
+    # an exp that is missing or not a number can't be compared, the token is rejected like an expired one
+    exp = claims.get('exp')
+    if isinstance(exp, bool) or not isinstance(exp, (int, float)) or time.time() > exp:
+        raise JwtTokenException({'message':'Token is expired', 'code':'03'})
+    # access tokens carry the app client in client_id, id tokens have aud instead and are not accepted
+    if claims.get('client_id') != os.environ['COGNITO_USER_POOL_CLIENT_ID']:
         raise JwtTokenException({'message':'Token was not issued for this audience', 'code':'04'})
+    if claims.get('token_use') != 'access':
+        raise JwtTokenException({'message':'Token is not an access token', 'code':'07'})
 
-    # now we can use the claims
-    print(claims)
+    return kid, claims
 
-    # compare group membership right here?
 
-    return claims['cognito:groups']
+class TokenCache:
+    """
+    Bounded LRU of tokens that already passed verify_token, keyed by a sha256 digest of the token.
+
+    An entry is only returned while the token is not expired and the kid that signed it is still
+    published in the JWKS, so a rotated key drops every token it signed.
+    """
+
+    def __init__(self, key_cache: JwksCache = jwks_cache, max_size: int = None, enabled: bool = None):
+        self.key_cache = key_cache
+        self.max_size = max_size if max_size is not None else int(os.environ.get('TOKEN_CACHE_SIZE', 256))
+        self.enabled = enabled if enabled is not None else os.environ.get('TOKEN_CACHE_ENABLED', 'true') == 'true'
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, jwt_token):
+        """
+        Get the cached groups for the token, None if the token has to be verified
+        """
+        digest = hashlib.sha256(jwt_token.encode('utf-8')).digest()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                kid, exp, groups = entry
+                if time.time() <= exp and self.key_cache.has_kid(kid):
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    return groups
+                del self._entries[digest]
+            self.misses += 1
+        return None
+
+    def put(self, jwt_token, kid, claims):
+        digest = hashlib.sha256(jwt_token.encode('utf-8')).digest()
+        with self._lock:
+            self._entries[digest] = (kid, claims['exp'], claims['cognito:groups'])
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+def validate_token_cached(jwt_token, cache: TokenCache = token_cache):
+    """
+    Validate the JWT token, skipping signature verification for a token this container already verified
+
+    returns claims and True when served from cache, else throws an exception
+    """
+    if cache.enabled:
+        groups = cache.get(jwt_token)
+        if groups is not None:
+            return groups, True
+    kid, claims = verify_token(jwt_token, cache.key_cache)
+    if cache.enabled:
+        cache.put(jwt_token, kid, claims)
+    return claims['cognito:groups'], False
 
 def invalid_token(error):
     if  isinstance(error, Exception):
@@ -0,0 +1,91 @@
+import json
+import logging
+import os
+import random
+import re
+
+# Logging on the request path. Messages are formatted lazily (logger.debug("... %s", value)), so a message
+# below the level costs no formatting. The level is decided per request: the route's level from
+# ROUTE_LOG_LEVELS, else LOG_LEVEL, and a sample of LOG_DEBUG_SAMPLE_RATE requests logs at DEBUG.
+# Tokens, argon2 hashes and secrets are redacted from every record before it is written.
+
+service = os.environ.get('POWERTOOLS_SERVICE_NAME', 'service_undefined')
+service_level = logging.getLevelName(os.environ.get('LOG_LEVEL', 'INFO').upper())
+# {"GET /api/user/": "WARNING"}, keys are the method and prefix of a route
+route_levels = {route: logging.getLevelName(level.upper())
+                for route, level in json.loads(os.environ.get('ROUTE_LOG_LEVELS') or '{}').items()}
+debug_sample_rate = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 0))
+
+redacted = '[REDACTED]'
+redacted_keys = frozenset(('authorization', 'cookie', 'argon2_hash', 'password', 'token', 'access_token',
+                           'id_token', 'refresh_token', 'client_secret'))
+redacted_patterns = (
+    re.compile(r'eyJ[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]*'),  # JWT
+    re.compile(r'\$argon2(?:id|i|d)\$[^\s\'",}]+'),  # argon2 hash
+)
+bearer_pattern = re.compile(r'(?i)(bearer\s+)\S+')
+
+_current_level = None
+
+
+def redact(value):
+    """
+    Copy of value with secrets replaced, dict values by key name and strings by pattern
+    """
+    if isinstance(value, str):
+        value = bearer_pattern.sub(rf'\g<1>{redacted}', value)
+        for pattern in redacted_patterns:
+            value = pattern.sub(redacted, value)
+        return value
+    if isinstance(value, dict):
+        return {key: redacted if isinstance(key, str) and key.lower() in redacted_keys else redact(item)
+                for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(redact(item) for item in value)
+    return value
+
+
+class RedactFilter(logging.Filter):
+    """
+    Redacts the message and arguments of every record passing the handler it is added to
+    """
+
+    def filter(self, record: logging.LogRecord):
+        if isinstance(record.msg, (str, dict)):
+            record.msg = redact(record.msg)
+        if record.args:
+            record.args = redact(record.args) if isinstance(record.args, tuple) else redact(dict(record.args))
+        return True
+
+
+def configure(logger):
+    """
+    Add redaction to the handler of a powertools logger, the handler is shared by the child loggers of the service
+    """
+    handler = logger.registered_handler
+    if handler is not None and not any(isinstance(f, RedactFilter) for f in handler.filters):
+        handler.addFilter(RedactFilter())
+
+
+def level_for(route=None):
+    """
+    Log level for a request to route, DEBUG for the sampled requests
+    """
+    if debug_sample_rate and random.random() < debug_sample_rate:
+        return logging.DEBUG
+    if route is not None:
+        return route_levels.get(route.name, service_level)
+    return service_level
+
+
+def apply_level(level: int):
+    """
+    Set the level of the service logger and its children, which powertools gives a level of their own
+    """
+    global _current_level
+    if level == _current_level:
+        return
+    for name, logger in list(logging.Logger.manager.loggerDict.items()):
+        if (name == service or name.startswith(f"{service}.")) and isinstance(logger, logging.Logger):
+            logger.setLevel(level)
+    _current_level = level
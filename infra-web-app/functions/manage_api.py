@@ -0,0 +1,25 @@
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from aws_lambda_powertools.utilities.data_classes import event_source, ALBEvent
+from aws_lambda_powertools import Tracer
+from aws_lambda_powertools import Metrics
+import api_router
+import manage_idps
+import manage_users
+
+# Single function serving both /api/idp/ and /api/user/, needs IDP_TABLE_NAME and USER_TABLE_NAME
+
+logger = Logger()
+metrics = Metrics()
+tracer = Tracer()
+
+lazy_modules = manage_idps.lazy_modules + manage_users.lazy_modules
+# the only router of this function, the per-table modules build theirs only as the handler's module
+router = api_router.Router(manage_idps.routes + manage_users.routes, warm_modules=lazy_modules)
+
+
+@tracer.capture_lambda_handler
+@metrics.log_metrics
+@event_source(data_class=ALBEvent)
+def handler(event: ALBEvent, context: LambdaContext):
+    return router.handle(event, context)
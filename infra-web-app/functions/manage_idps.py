@@ -3,85 +3,88 @@ from aws_lambda_powertools.utilities.typing import LambdaContext
 from aws_lambda_powertools.utilities.data_classes import event_source, ALBEvent
 from aws_lambda_powertools import Tracer
 from aws_lambda_powertools import Metrics
-from dataclasses import dataclass
-import boto3
+from aws_lambda_powertools.metrics import MetricUnit
+from functools import cache
 import simplejson as json
 import os
-import jwt_token_helper as jwt
+import api_router
+import ddb_helper
+import read_cache
+import table_indexes
+import table_versions
 
 logger = Logger()
 metrics = Metrics()
 tracer = Tracer()
 
 table_name = os.environ['IDP_TABLE_NAME']
+# users table and its provider index, needed for cascade deletes only. The index is detected, this name
+# is used when it can't be, see table_indexes
+user_table_name = os.environ.get('USER_TABLE_NAME')
+provider_index = os.environ.get('USER_PROVIDER_INDEX')
 required_claim = "IdpAdmins"
+cascade_claim = "UserAdmins"
+path_prefix = "/api/idp/"
+key_names = ('provider',)
+# attributes the fields parameter may ask for
+allowed_fields = (
+    'provider', 'module', 'config', 'config.attributes', 'config.ignore_missing_attributes',
+    'config.cognito_client_id', 'config.cognito_user_pool_region', 'config.mfa', 'config.mfa_token_length',
+    'config.server', 'config.search_base', 'config.port', 'config.ssl', 'config.ssl_verify',
+    'config.ldap_service_account_secret_arn', 'config.ldap_ssl_ca_secret_arn', 'config.ldap_allowed_groups',
+    'config.client_id', 'config.app_secret_arn', 'config.authority_url',
+)
+# only writes and cascade deletes need these, they are imported there to keep them off the cold start of reads
+lazy_modules = ('models', 'idp_cascade')
+
+ddb_client = ddb_helper.resource()
+# IdPs are read far more often than written, most reads are served from the warm container
+idp_cache = read_cache.VersionedCache(table_name)
 
-ddb_client = boto3.resource("dynamodb")
-
-
-@tracer.capture_lambda_handler
-@metrics.log_metrics
-@event_source(data_class=ALBEvent)
-def handler(event: ALBEvent, context: LambdaContext):
-    for key in event:
-        logger.debug(f"{key}: {event[key]}")
-
-    http_method = event['httpMethod']
-    if http_method == "OPTIONS":
-        return options(event)
-
-    keys = jwt.get_keys()
-    jwt_token = event['headers']['authorization'].split(' ')[1]
-
-    try:
-        claims = jwt.validate_token(jwt_token, keys)
-        logger.info(f"token is valid with claims: {claims}")
-
-        if (required_claim in claims):
-            if http_method == "GET":
-                return get(event)
-            elif http_method == "PUT":
-                return put(event)
-            elif http_method == "DELETE":
-                return delete(event)
-            else:
-                return jwt.unsupported_method(http_method)
-        else:
-            logger.error(f"token is valid, but missing required claim: {required_claim}")
-            return jwt.invalid_token(f"token is valid, but missing required claim: {required_claim}")
-    except Exception as e:
-        logger.error(f"error validating token: {e}")
-        return jwt.invalid_token(e)
 
 def get(event):
-    provider = event['path'].replace("/api/idp/", "")
-    logger.info(f"get request parameters: {provider}")
     """
-    Get all IDPs, or single IDP by ID
-    :param event: if contains a single ID, it will be returned, otherwise a list returned
+    Get a page of IDPs, or single IDP by ID
+    :param event: if contains a single ID, it will be returned, otherwise a page of items and the next_cursor,
+                  limit and cursor query parameters select the page, fields limits the attributes returned
     :return: http response with IDP(s)
     """
-    body = None
+    provider = event['path'].replace(path_prefix, "")
+    logger.debug("get request parameters: %s", provider)
+    query_parameters = api_router.query_parameters(event)
+    fields = ddb_helper.fields_request(query_parameters, allowed_fields)
+    projection = ddb_helper.projection_kwargs(fields, key_names)
+    fields_key = tuple(fields or ())
     table = ddb_client.Table(table_name)
     if provider:
-        response = table.get_item(Key={'provider':provider})
-        body = response['Item']
-    else:
-        response = table.scan()
-        body = response['Items']
-    return {
-        "isBase64Encoded": False,
-        "statusCode": 200,
-        "statusDescription": "200 OK",
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": event['headers'].get('origin','http://localhost:8080/'),  # apply allow list for more control
-            "Access-Control-Allow-Headers": "Content-Type, Authorization",
-            "Access-Control-Allow-Credentials": "true",
-            "Access-Control-Allow-Methods": "OPTIONS,GET"
-        },
-        "body": json.dumps(body)
-    }
+        api_router.annotate("provider", provider)
+        item, cached = idp_cache.get(('item', provider, fields_key),
+                                     lambda: table.get_item(Key={'provider':provider}, **projection).get('Item'))
+        add_cache_metric(cached)
+        if item is None:
+            return api_router.not_found(event, event['path'])
+        api_router.add_item_count(1)
+        return api_router.cached_ok(event, None, lambda: item)
+
+    limit, start_key = ddb_helper.page_request(query_parameters)
+
+    def load_page():
+        items, next_cursor = ddb_helper.page(table.scan, key_names, limit, start_key, **projection)
+        return {'items': items, 'next_cursor': next_cursor}
+
+    def load():
+        body, cached = idp_cache.get(('page', limit, query_parameters.get('cursor'), fields_key), load_page)
+        add_cache_metric(cached)
+        api_router.add_item_count(len(body['items']))
+        return body
+    # unchanged table, answered from the version marker without scanning. The marker the cache checked at most
+    # IDP_CACHE_VERSION_CHECK_SECONDS ago, like the cached pages, so a write in another container shows up in the
+    # ETag within that time, writes in this container right away
+    version = idp_cache.version() if idp_cache.enabled else table_versions.current(table_name)
+    return api_router.cached_ok(event, version, load)
+
+def add_cache_metric(cached: bool):
+    metrics.add_metric(name="IdpCacheHit" if cached else "IdpCacheMiss", unit=MetricUnit.Count, value=1)
 
 def put(event):
     """
@@ -90,86 +93,100 @@ def put(event):
     :param event: must contain an IDP provider name (partition key)
     :return: http response indicating success or failure
     """
-    body = json.loads(event['body'])
-    logger.info(f"put request: {body}")
-    # Todo implement dataclass by provider module to enforce payload structure validation
+    body = json.loads(event['body'], use_decimal=True)
+    logger.debug("put request: %s", body)
+    # validated against the model of its module before anything is written, ModelError is a 400
+    import models
+    idp = models.item(models.parse_idp(body))
+    api_router.annotate("provider", idp['provider'])
     table = ddb_client.Table(table_name)
-    response = table.put_item(Item=body)
-    dumps = json.dumps(response)
-    logger.info(f"return put result: {dumps}")
-    return {
-        "isBase64Encoded": False,
-        "statusCode": 200,
-        "statusDescription": "200 OK",
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": event['headers'].get('origin','http://localhost:8080/'),  # apply allow list for more control
-            "Access-Control-Allow-Headers": "Content-Type, Authorization",
-            "Access-Control-Allow-Credentials": "true",
-            "Access-Control-Allow-Methods": "OPTIONS,PUT"
-        },
-        "body": dumps
-    }
+    response = table.put_item(Item=idp)
+    idp_cache.invalidate(table_versions.bump(table_name))
+    logger.debug("return put result: %s", response)
+    return api_router.ok(event, response, "PUT")
 
 def delete(event):
     """
     Delete IDP record specified in event
-    :param event: must contain an IDP provider name (partition key)
+    :param event: must contain an IDP provider name (partition key), cascade=true deletes its users as well
     :return: http response indicating success or failure
-    """""
-    provider = event['path'].replace("/api/idp/", "")
-    logger.info(f"delete request parameters: {provider}")
+    """
+    provider = event['path'].replace(path_prefix, "")
+    logger.info("delete request parameters: %s", provider)
+    api_router.annotate("provider", provider)
+    query_parameters = api_router.query_parameters(event)
+    if query_parameters.get('cascade') == 'true':
+        return delete_cascade(event, provider, query_parameters.get('cursor'))
     table = ddb_client.Table(table_name)
     response = table.delete_item(Key={'provider':provider})
-    return {
-        "isBase64Encoded": False,
-        "statusCode": 200,
-        "statusDescription": "200 OK",
-        "headers": {
-            "Content-Type": "application/json",  # this should be ELB URL
-            "Access-Control-Allow-Origin": event['headers'].get('origin','http://localhost:8080/'),  # apply allow list for more control
-            "Access-Control-Allow-Headers": "Content-Type, Authorization",
-            "Access-Control-Allow-Credentials": "true",
-            "Access-Control-Allow-Methods": "OPTIONS,DELETE"
-        },
-        "body": json.dumps(response)
-    }
+    idp_cache.invalidate(table_versions.bump(table_name))
+    return api_router.ok(event, response, "DELETE")
 
-def options(event):
+def delete_cascade(event, provider, cursor):
     """
-    Support for CORS preflight request for localhost and ELB endpoints
-    :return: formatted http response
+    Delete the users of an IDP, then the IDP itself
+
+    Each call works for CASCADE_TIME_BUDGET_SECONDS at most. While status is in_progress call again with the
+    returned cursor, the IDP record is deleted by the call that finds no users left.
+    :param event: request event
+    :param provider: IDP provider name
+    :param cursor: cursor from the previous call, empty to start
+    :return: http response with status, deleted and failed users and the cursor to continue with
     """
-    logger.debug("OPTIONS")
-    return {
-        "isBase64Encoded": False,
-        "statusCode": 200,
-        "statusDescription": "200 OK",
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": event['headers'].get('origin','http://localhost:8080/'),  # apply allow list for more control
-            "Access-Control-Allow-Headers": "Content-Type, Authorization",
-            "Access-Control-Allow-Credentials": "true",
-            "Access-Control-Allow-Methods": "OPTIONS,PUT,DELETE,GET",
-        }
+    if not user_table_name:
+        raise ValueError("cascade delete is not configured, USER_TABLE_NAME is not set")
+    if not api_router.has_claim(cascade_claim):
+        return api_router.forbidden(event, f"cascade delete also requires the {cascade_claim} claim", "DELETE")
+    import idp_cascade
+    checkpoint = ddb_helper.decode_cursor(cursor)
+    index_name = table_indexes.index_for(user_table_name, 'identity_provider_key', fallback=provider_index)
+    result = idp_cascade.delete_users(ddb_client.Table(user_table_name), provider, checkpoint, index_name)
+    logger.info("cascade delete of %s: deleted %s, failed %s", provider, result['deleted'], len(result['failed']))
+    if result['deleted']:
+        table_versions.bump(user_table_name)
+    if result['failed']:
+        # the failed users are behind the cursor now, start over to pick them up
+        status = 'failed'
+    elif result['checkpoint']:
+        status = 'in_progress'
+    else:
+        ddb_client.Table(table_name).delete_item(Key={'provider':provider})
+        idp_cache.invalidate(table_versions.bump(table_name))
+        status = 'complete'
+    body = {
+        'provider': provider,
+        'status': status,
+        'deleted': result['deleted'],
+        'failed': result['failed'],
+        'cursor': ddb_helper.encode_cursor(result['checkpoint']) if status == 'in_progress' else None,
     }
+    return api_router.ok(event, body, "DELETE")
+
 
+routes = [
+    api_router.Route("GET", path_prefix, get, required_claim),
+    api_router.Route("PUT", path_prefix, put, required_claim),
+    api_router.Route("DELETE", path_prefix, delete, required_claim),
+]
 
-@dataclass
-class BaseIdp:
-    module: str
-    provider: str
+
+@cache
+def router():
+    """
+    Router of the IdP routes, built once per container. manage_api builds one router over these routes and
+    those of the other table instead, so importing this module builds none
+    """
+    return api_router.Router(routes, warm_modules=lazy_modules)
 
 
-@dataclass
-class ArgonConfig:
-    ssl: str
-    ssl_verify: str
+# as the handler's module, build it during init, where provisioned concurrency warms it up
+if api_router.handler_module() == __name__:
+    router()
 
 
-@dataclass
-class CognitoConfig(BaseIdp):
-    cognito_client_id: str
-    cognito_user_pool_region: str
-    domain: str
-    scope: str
\ No newline at end of file
+@tracer.capture_lambda_handler
+@metrics.log_metrics
+@event_source(data_class=ALBEvent)
+def handler(event: ALBEvent, context: LambdaContext):
+    return router().handle(event, context)
+
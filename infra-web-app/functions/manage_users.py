@@ -3,99 +3,124 @@ from aws_lambda_powertools.utilities.typing import LambdaContext
 from aws_lambda_powertools.utilities.data_classes import event_source, ALBEvent
 from aws_lambda_powertools import Tracer
 from aws_lambda_powertools import Metrics
-import boto3
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from functools import cache
 import simplejson as json
+import base64
 import os
-import jwt_token_helper as jwt
+import aggregates
+import api_router
+import ddb_helper
+import parallel_scan
+import table_indexes
+import table_versions
+import user_search
 
 logger = Logger()
 metrics = Metrics()
 tracer = Tracer()
 
 table_name = os.environ['USER_TABLE_NAME']
+# GSI with identity_provider_key as partition key, counts per IdP fall back to a parallel scan without it.
+# The indexes of the table are detected, this name is used when they can't be, see table_indexes
+provider_index = os.environ.get('USER_PROVIDER_INDEX')
 required_claim = "UserAdmins"
+path_prefix = "/api/user/"
+stats_path = "/api/stats"
+key_names = ('user', 'identity_provider_key')
+# attributes the fields parameter may ask for
+allowed_fields = (
+    'user', 'identity_provider_key', 'identity_provider_module', 'ipv4_allow_list', 'config',
+    'config.Role', 'config.HomeDirectoryType', 'config.HomeDirectory', 'config.HomeDirectoryDetails',
+    'config.PosixProfile', 'config.PublicKeys', 'config.argon2_hash',
+)
+max_batch_get_keys = int(os.environ.get('MAX_BATCH_GET_KEYS', 500))
+batch_get_workers = int(os.environ.get('BATCH_GET_WORKERS', 4))
+# only writes and imports need these, they are imported there to keep them off the cold start of reads
+lazy_modules = ('models', 'user_import')
 
-ddb_client = boto3.resource("dynamodb")
+ddb_client = ddb_helper.resource()
 
-@tracer.capture_lambda_handler
-@metrics.log_metrics
-@event_source(data_class=ALBEvent)
-def handler(event: ALBEvent, context: LambdaContext):
-    for key in event:
-        logger.debug(f"{key}: {event[key]}")
 
-    http_method = event['httpMethod']
-    if http_method == "OPTIONS":
-        return options(event)
+def get(event):
+    """
+    Get a page of users, or single user by username
+    :param event: if contains a single ID, it will be returned, otherwise a page of items, the next_cursor and the
+                  access_path used. limit and cursor query parameters select the page, prefix, provider, module,
+                  role and sort filter and order it, fields limits the attributes returned
+    :return: http response with User(s)
+    """
+    user = event['path'].replace(path_prefix, "")
+    logger.debug("get request parameters: %s", user)
+    query_parameters = api_router.query_parameters(event)
+    if query_parameters.get('provider'):
+        api_router.annotate("provider", query_parameters['provider'])
+    fields = ddb_helper.fields_request(query_parameters, allowed_fields)
+    table = ddb_client.Table(table_name)
+    if user:
+        provider = required_provider(query_parameters)
+        response = table.get_item(Key={'user':user, 'identity_provider_key':provider},
+                                  **ddb_helper.projection_kwargs(fields, key_names))
+        if 'Item' not in response:
+            return api_router.not_found(event, event['path'])
+        api_router.add_item_count(1)
+        return api_router.cached_ok(event, None, lambda: response['Item'])
 
-    keys = jwt.get_keys()
-    jwt_token = event['headers']['authorization'].split(' ')[1]
+    # if query string count=true scan by idp, then get the count
+    count = query_parameters.get('count', 'false') == 'true'
+    provider = required_provider(query_parameters) if count else None
 
-    try:
-        claims = jwt.validate_token(jwt_token, keys)
-        logger.info(f"token is valid with claims: {claims}")
-
-        if (required_claim in claims):
-            if http_method == "GET":
-                return get(event)
-            elif http_method == "PUT":
-                return put(event)
-            elif http_method == "DELETE":
-                return delete(event)
-            else:
-                return jwt.unsupported_method(http_method)
-        else:
-            logger.error(f"token is valid, but missing required claim: {required_claim}")
-            return jwt.invalid_token(f"token is valid, but missing required claim: {required_claim}")
-    except Exception as e:
-        logger.error(f"error validating token: {e}")
-        return jwt.invalid_token(e)
+    def load():
+        if count:
+            return count_users(table, provider)
+        result = user_search.search(table, query_parameters, user_index('identity_provider_key'), fields,
+                                    module_index=user_index('identity_provider_module'))
+        api_router.add_item_count(len(result['items']))
+        return result
+    # unchanged table, answered from the version marker without scanning
+    return api_router.cached_ok(event, table_versions.current(table_name), load)
 
+def required_provider(query_parameters: dict):
+    """
+    identity_provider_key of the request, part of the key of every user, raises ValueError (400) when missing
+    """
+    provider = query_parameters.get('provider')
+    if not provider:
+        raise ValueError("provider query parameter is required")
+    return provider
 
+def user_index(partition_key: str, sort_key: str = 'user'):
+    """
+    Usable GSI of the users table on partition_key, the configured provider index when indexes can't be detected
+    """
+    fallback = provider_index if partition_key == 'identity_provider_key' else None
+    return table_indexes.index_for(table_name, partition_key, sort_key, fallback)
 
-def get(event):
-    user = event['path'].replace("/api/user/", "")
-    logger.info(f"get request parameters: {user}")
+def count_users(table, provider: str):
     """
-    Get all users, or single user by username
-    :param event: if contains a single ID, it will be returned, otherwise a list returned
-    :return: http response with User(s)
+    Number of users of an IdP, from the provider index when there is one
+    :param table: users table
+    :param provider: identity_provider_key
+    :return: user count
     """
-    body = None
-    table = ddb_client.Table(table_name)
-    if user:
-        provider = event['queryStringParameters']['provider']
-        response = table.get_item(Key={'user':user, 'identity_provider_key':provider})
-        body = response['Item']
-    else:
-        # if query string count=true scan by idp, then get the count
-        count = event['queryStringParameters'].get('count', 'false')
-        if count == 'true':
-            provider = event['queryStringParameters']['provider']
-            response = table.scan(
-                FilterExpression=f'identity_provider_key = :provider',
-                ExpressionAttributeValues={
-                    ':provider': provider
-                },
-                Select='COUNT'
-            )
-            body = response['Count']
-        else:
-            response = table.scan()
-            body = response['Items']
-    return {
-        "isBase64Encoded": False,
-        "statusCode": 200,
-        "statusDescription": "200 OK",
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": event['headers'].get('origin','http://localhost:8080/'),  # apply allow list for more control
-            "Access-Control-Allow-Headers": "Content-Type, Authorization",
-            "Access-Control-Allow-Credentials": "true",
-            "Access-Control-Allow-Methods": "OPTIONS,GET"
-        },
-        "body": json.dumps(body)
-    }
+    # any sort key will do for counting
+    index_name = user_index('identity_provider_key', sort_key=None)
+    if index_name:
+        try:
+            return ddb_helper.query_count(table, index_name, Key('identity_provider_key').eq(provider))
+        except ClientError as e:
+            # index missing or still backfilling
+            if e.response['Error']['Code'] not in ('ValidationException', 'ResourceNotFoundException'):
+                raise
+            logger.warning("count query on %s failed, falling back to scan: %s", index_name, e)
+    return parallel_scan.parallel_count(
+        table,
+        FilterExpression='identity_provider_key = :provider',
+        ExpressionAttributeValues={
+            ':provider': provider
+        }
+    )
 
 def put(event):
     """
@@ -104,70 +129,137 @@ def put(event):
     :param event: must contain an Username (partition key)
     :return: http response indicating success or failure
     """
-    body = json.loads(event['body'])
-    logger.info(f"put request: {body}")
-    # Todo implement dataclass by provider module to enforce payload structure validation
+    body = json.loads(event['body'], use_decimal=True)
+    logger.debug("put request: %s", body)
+    # validated against the user model before anything is written, ModelError is a 400
+    import models
+    user = models.item(models.parse_user(body))
+    api_router.annotate("provider", user['identity_provider_key'])
     table = ddb_client.Table(table_name)
-    response = table.put_item(Item=body)
-    dumps = json.dumps(response)
-    logger.info(f"return put result: {dumps}")
-    return {
-        "isBase64Encoded": False,
-        "statusCode": 200,
-        "statusDescription": "200 OK",
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": event['headers'].get('origin','http://localhost:8080/'),  # apply allow list for more control
-            "Access-Control-Allow-Headers": "Content-Type, Authorization",
-            "Access-Control-Allow-Credentials": "true",
-            "Access-Control-Allow-Methods": "OPTIONS,PUT"
-        },
-        "body": dumps
-    }
+    response = table.put_item(Item=user)
+    table_versions.bump(table_name)
+    logger.debug("return put result: %s", response)
+    return api_router.ok(event, response, "PUT")
+
+def import_users(event):
+    """
+    Bulk import users
+    :param event: body is CSV (text/csv) or JSONL (application/x-ndjson), or set the format query parameter
+    :return: http response with imported, invalid and failed totals and a result per row
+    """
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+    import user_import
+    row_format = user_import.content_format(event['headers'].get('content-type'),
+                                            api_router.query_parameters(event).get('format'))
+    table = ddb_client.Table(table_name)
+    report = user_import.import_users(table, user_import.parse_rows(body, row_format),
+                                      deadline=api_router.deadline(user_import.deadline_margin))
+    if report['imported']:
+        table_versions.bump(table_name)
+    logger.info("import result: imported %s, invalid %s, failed %s", report['imported'], report['invalid'], report['failed'])
+    return api_router.ok(event, report, "POST")
+
+def batch_get(event):
+    """
+    Get many users by key, in BatchGetItem calls of 100 keys run concurrently
+    :param event: body is {"keys": [{"user": ..., "identity_provider_key": ...}], "fields": [...]},
+                  fields is optional and limits the attributes read
+    :return: http response with the items found, the keys missing and the keys left unprocessed after retries
+    """
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+    keys, fields = batch_get_request(body)
+    table = ddb_client.Table(table_name)
+    items, unprocessed = ddb_helper.batch_get_all(table, keys, key_names, fields, batch_get_workers)
+    read = {tuple(item[name] for name in key_names) for item in items}.union(unprocessed)
+    missing = [key for key in keys if tuple(key[name] for name in key_names) not in read]
+    api_router.add_item_count(len(items))
+    logger.info("batch get of %s keys: found %s, missing %s, unprocessed %s", len(keys), len(items), len(missing), len(unprocessed))
+    return api_router.ok(event, {
+        'items': items,
+        'missing': missing,
+        'unprocessed': [dict(zip(key_names, key)) for key in unprocessed],
+    }, "POST")
+
+def batch_get_request(body: str):
+    """
+    Keys and fields of a batch get request, duplicate keys removed, raises ValueError when invalid
+    """
+    try:
+        request = json.loads(body or '')
+    except ValueError:
+        raise ValueError("body must be JSON with a keys list")
+    if not isinstance(request, dict) or not isinstance(request.get('keys'), list) or not request['keys']:
+        raise ValueError("body must be JSON with a keys list")
+    keys = {}
+    for key in request['keys']:
+        if not isinstance(key, dict) or not all(isinstance(key.get(name), str) and key[name] for name in key_names):
+            raise ValueError(f"every key needs {' and '.join(key_names)}")
+        keys[tuple(key[name] for name in key_names)] = {name: key[name] for name in key_names}
+    if len(keys) > max_batch_get_keys:
+        raise ValueError(f"at most {max_batch_get_keys} keys per request")
+    fields = request.get('fields')
+    if fields is not None:
+        if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields):
+            raise ValueError("fields must be a list of attribute names")
+        fields = ddb_helper.checked_fields(fields, allowed_fields)
+    return list(keys.values()), fields
 
 def delete(event):
     """
     Delete User record specified in event
     :param event: must contain an Username (partition key)
     :return: http response indicating success or failure
-    """""
-    user = event['path'].replace("/api/user/", "")
-    logger.info(f"delete request parameters: {user}")
-    provider = event['queryStringParameters']['provider']  # safe check?
-    logger.info(f"delete query provider: {provider}")
+    """
+    user = event['path'].replace(path_prefix, "")
+    logger.info("delete request parameters: %s", user)
+    provider = required_provider(api_router.query_parameters(event))
+    logger.info("delete query provider: %s", provider)
+    api_router.annotate("provider", provider)
     table = ddb_client.Table(table_name)
     response = table.delete_item(Key={'user':user, 'identity_provider_key':provider})
-    return {
-        "isBase64Encoded": False,
-        "statusCode": 200,
-        "statusDescription": "200 OK",
-        "headers": {
-            "Content-Type": "application/json",  # this should be ELB URL
-            "Access-Control-Allow-Origin": event['headers'].get('origin','http://localhost:8080/'),  # apply allow list for more control
-            "Access-Control-Allow-Headers": "Content-Type, Authorization",
-            "Access-Control-Allow-Credentials": "true",
-            "Access-Control-Allow-Methods": "OPTIONS,DELETE"
-        },
-        "body": json.dumps(response)
-    }
-
-def options(event):
-    """
-    Support for CORS preflight request for localhost and ELB endpoints
-    :return: formatted http response
-    """
-    logger.debug("OPTIONS")
-    http_response = {
-        "isBase64Encoded": False,
-        "statusCode": 200,
-        "statusDescription": "200 OK",
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": event['headers'].get('origin','http://localhost:8080/'),  # apply allow list for more control
-            "Access-Control-Allow-Headers": "Content-Type, Authorization",
-            "Access-Control-Allow-Methods": "OPTIONS, PUT, DELETE, GET",
-            "Access-Control-Allow-Credentials": "true"
-        }
-    }
-    logger.debug(f"return get result: {http_response}")
-    return http_response
\ No newline at end of file
+    table_versions.bump(table_name)
+    return api_router.ok(event, response, "DELETE")
+
+def stats(event):
+    """
+    Users per IdP, module and role and IdPs per module, from the counters the stream consumer keeps
+    :return: http response with the statistics, 404 when the stack keeps none
+    """
+    if not aggregates.table_name:
+        return api_router.not_found(event, event['path'])
+    return api_router.cached_ok(event, None, aggregates.read)
+
+
+routes = [
+    api_router.Route("GET", path_prefix, get, required_claim),
+    api_router.Route("PUT", path_prefix, put, required_claim),
+    api_router.Route("DELETE", path_prefix, delete, required_claim),
+    api_router.Route("POST", f"{path_prefix}import", import_users, required_claim),
+    api_router.Route("POST", f"{path_prefix}batch-get", batch_get, required_claim),
+    api_router.Route("GET", stats_path, stats, required_claim),
+]
+
+
+@cache
+def router():
+    """
+    Router of the user routes, built once per container. manage_api builds one router over these routes and
+    those of the other table instead, so importing this module builds none
+    """
+    return api_router.Router(routes, warm_modules=lazy_modules)
+
+
+# as the handler's module, build it during init, where provisioned concurrency warms it up
+if api_router.handler_module() == __name__:
+    router()
+
+
+@tracer.capture_lambda_handler
+@metrics.log_metrics
+@event_source(data_class=ALBEvent)
+def handler(event: ALBEvent, context: LambdaContext):
+    return router().handle(event, context)
@@ -0,0 +1,378 @@
+from dataclasses import dataclass, field, fields, is_dataclass
+from decimal import Decimal
+import re
+
+# Payload models for IdPs and users. Each IdP module has its own slotted dataclass, registered by module name,
+# and the validator of every model is compiled once at import. A body is parsed, converted and validated in
+# a single pass over its keys and every error is reported at once, before anything is written.
+#
+# Items are stored in the shape the models define: empty values and attributes of other IdP modules are
+# dropped, so the UI can keep sending every field of its form, apart from the lists the user form reads back,
+# which are stored empty. Attributes no model defines and bad values raise ModelError, a ValueError, which the
+# router answers with 400.
+
+
+class ModelError(ValueError):
+    def __init__(self, errors: list):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+
+# value checks, they return the converted value or raise ValueError with the reason
+
+def text(max_length: int = 1024, pattern: str = None, message: str = None):
+    compiled = re.compile(pattern) if pattern else None
+
+    def check(value):
+        if not isinstance(value, str):
+            raise ValueError("must be a string")
+        if len(value) > max_length:
+            raise ValueError(f"must be at most {max_length} characters")
+        if compiled and not compiled.match(value):
+            raise ValueError(message or f"must match {pattern}")
+        return value
+    return check
+
+
+def boolean(value):
+    if isinstance(value, bool):
+        return value
+    if value in ('true', 'false'):
+        return value == 'true'
+    raise ValueError("must be true or false")
+
+
+def integer(minimum: int = None, maximum: int = None):
+    def check(value):
+        if isinstance(value, bool):
+            raise ValueError("must be a whole number")
+        try:
+            number = Decimal(str(value).strip())
+        except ArithmeticError:
+            raise ValueError("must be a whole number")
+        if number != number.to_integral_value():
+            raise ValueError("must be a whole number")
+        if (minimum is not None and number < minimum) or (maximum is not None and number > maximum):
+            raise ValueError(f"must be between {minimum} and {maximum}")
+        return int(number)
+    return check
+
+
+def list_of(check, max_items: int = 100):
+    def check_list(value):
+        if not isinstance(value, list):
+            raise ValueError("must be a list")
+        values = [check(item) for item in value if not _empty(item)]
+        if len(values) > max_items:
+            raise ValueError(f"must have at most {max_items} entries")
+        return values
+    return check_list
+
+
+def nested(model):
+    validator = _validators.setdefault(model, Validator(model))
+
+    def check(value):
+        return validator.parse(value)
+    return check
+
+
+arn = text(2048, r'^arn:aws[a-z-]*:', "must be an ARN")
+url = text(2048, r'^https?://[^\s/$.?#].[^\s]*$', "must be a URL")
+cidr = text(18, r'^(?:(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}'
+                r'(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)/(?:[0-2]?[0-9]|3[0-2])$', "must be a CIDR address")
+
+
+def spec(check, required: bool = False, empty=None):
+    """
+    Model attribute with its check, optional attributes default to None and are not stored
+    :param empty: returns the value stored when the attribute is not set, e.g. list, instead of leaving it out
+    """
+    return field(default=None, metadata={'check': check, 'required': required, 'empty': empty})
+
+
+def _empty(value):
+    if value is None or value == '':
+        return True
+    if isinstance(value, dict):
+        return all(_empty(item) for item in value.values())
+    if isinstance(value, list):
+        return all(_empty(item) for item in value)
+    return False
+
+
+class Validator:
+    """
+    Checks of a model, compiled once from its fields
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.checks = {f.name: f.metadata['check'] for f in fields(model)}
+        self.required = tuple(f.name for f in fields(model) if f.metadata.get('required'))
+        # attributes of sibling models, dropped instead of rejected, see tolerate_siblings
+        self.tolerated = frozenset()
+        _field_names[model] = tuple(self.checks)
+        _empty_values[model] = {f.name: f.metadata['empty'] for f in fields(model) if f.metadata.get('empty')}
+
+    def parse(self, payload):
+        """
+        Model instance for payload, raises ModelError listing every problem found
+        """
+        if not isinstance(payload, dict):
+            raise ModelError(["must be an object"])
+        values = {}
+        errors = []
+        for name, value in payload.items():
+            check = self.checks.get(name)
+            if check is None:
+                if name not in self.tolerated:
+                    errors.append(f"{name} is not a known attribute")
+                continue
+            if _empty(value):
+                continue
+            try:
+                values[name] = check(value)
+            except ModelError as e:
+                errors.extend(f"{name}.{error}" if not error.startswith('must') else f"{name} {error}"
+                              for error in e.errors)
+            except ValueError as e:
+                errors.append(f"{name} {e}")
+        # a required attribute with a bad value already has its error
+        errors.extend(f"{name} is required" for name in self.required
+                      if name not in values and _empty(payload.get(name)))
+        if errors:
+            raise ModelError(errors)
+        return self.model(**values)
+
+
+_validators = {}
+_field_names = {}
+_empty_values = {}
+
+
+def tolerate_siblings(models):
+    """
+    Let the validators of models drop the attributes of each other instead of rejecting them
+    """
+    names = frozenset(f.name for model in models for f in fields(model))
+    for model in models:
+        validator = _validators.setdefault(model, Validator(model))
+        validator.tolerated = names.difference(validator.checks)
+
+
+def item(model) -> dict:
+    """
+    DynamoDB item of a model instance, without the attributes that are not set and have no empty value
+    """
+    result = {}
+    empty_values = _empty_values[type(model)]
+    for name in _field_names[type(model)]:
+        value = getattr(model, name)
+        if value is None:
+            if name in empty_values:
+                result[name] = empty_values[name]()
+            continue
+        if is_dataclass(value):
+            value = item(value)
+        elif isinstance(value, list):
+            value = [item(entry) if is_dataclass(entry) else entry for entry in value]
+        result[name] = value
+    return result
+
+
+# IdPs
+
+@dataclass(slots=True)
+class Attributes:
+    gid: str = spec(text(256))
+    uid: str = spec(text(256))
+    role: str = spec(text(256))
+    policy: str = spec(text(256))
+
+
+@dataclass(slots=True)
+class ArgonConfig:
+    pass
+
+
+@dataclass(slots=True)
+class CognitoConfig:
+    cognito_client_id: str = spec(text(128), required=True)
+    cognito_user_pool_region: str = spec(text(32, r'^[a-z]{2}(-[a-z]+)+-\d$', "must be an AWS region"))
+    mfa: bool = spec(boolean)
+    mfa_token_length: int = spec(integer(4, 8))
+
+
+@dataclass(slots=True)
+class EntraConfig:
+    client_id: str = spec(text(128), required=True)
+    app_secret_arn: str = spec(arn, required=True)
+    authority_url: str = spec(url)
+
+
+@dataclass(slots=True)
+class LdapConfig:
+    server: str = spec(text(512), required=True)
+    search_base: str = spec(text(1024), required=True)
+    port: int = spec(integer(1, 65535))
+    ssl: bool = spec(boolean)
+    ssl_verify: bool = spec(boolean)
+    ldap_ssl_ca_secret_arn: str = spec(arn)
+    ldap_service_account_secret_arn: str = spec(arn)
+    ldap_allowed_groups: list = spec(list_of(text(512)))
+    attributes: Attributes = spec(nested(Attributes))
+    ignore_missing_attributes: bool = spec(boolean)
+
+
+@dataclass(slots=True)
+class OktaConfig:
+    mfa: bool = spec(boolean)
+    mfa_token_length: int = spec(integer(4, 8))
+    attributes: Attributes = spec(nested(Attributes))
+    ignore_missing_attributes: bool = spec(boolean)
+
+
+@dataclass(slots=True)
+class PublicKeyConfig:
+    pass
+
+
+provider_check = text(100, r'^[^\s/]+$', "must not contain spaces or /")
+
+
+@dataclass(slots=True)
+class Idp:
+    provider: str = spec(provider_check, required=True)
+    module: str = spec(text(32), required=True)
+
+
+@dataclass(slots=True)
+class ArgonIdp(Idp):
+    config: ArgonConfig = spec(nested(ArgonConfig))
+
+
+@dataclass(slots=True)
+class CognitoIdp(Idp):
+    config: CognitoConfig = spec(nested(CognitoConfig), required=True)
+
+
+@dataclass(slots=True)
+class EntraIdp(Idp):
+    config: EntraConfig = spec(nested(EntraConfig), required=True)
+
+
+@dataclass(slots=True)
+class LdapIdp(Idp):
+    config: LdapConfig = spec(nested(LdapConfig), required=True)
+    public_key_support: bool = spec(boolean)
+
+
+@dataclass(slots=True)
+class OktaIdp(Idp):
+    config: OktaConfig = spec(nested(OktaConfig))
+    okta_domain: str = spec(url, required=True)
+    okta_app_client_id: str = spec(text(128))
+    okta_redirect_url: str = spec(url)
+
+
+@dataclass(slots=True)
+class PublicKeyIdp(Idp):
+    config: PublicKeyConfig = spec(nested(PublicKeyConfig))
+    public_key_support: bool = spec(boolean)
+
+
+idp_models = {
+    'argon2': ArgonIdp,
+    'cognito': CognitoIdp,
+    'entra': EntraIdp,
+    'ldap': LdapIdp,
+    'okta': OktaIdp,
+    'public_key': PublicKeyIdp,
+}
+idp_validators = {module: _validators.setdefault(model, Validator(model)) for module, model in idp_models.items()}
+# the IdP form has the fields of every module and sends them all, with the defaults of the hidden ones
+tolerate_siblings(idp_models.values())
+tolerate_siblings((ArgonConfig, CognitoConfig, EntraConfig, LdapConfig, OktaConfig, PublicKeyConfig))
+
+
+def parse_idp(payload):
+    """
+    IdP model for a request body, by its module, raises ModelError when invalid
+    """
+    if not isinstance(payload, dict):
+        raise ModelError(["body must be a JSON object"])
+    validator = idp_validators.get(payload.get('module'))
+    if validator is None:
+        raise ModelError([f"module must be one of {', '.join(idp_models)}"])
+    return validator.parse(payload)
+
+
+# users
+
+@dataclass(slots=True)
+class HomeDirectoryMapping:
+    Entry: str = spec(text(1024, r'^/', "must start with /"), required=True)
+    Target: str = spec(text(1024, r'^/', "must start with /"), required=True)
+
+
+@dataclass(slots=True)
+class PosixProfile:
+    Uid: int = spec(integer(0, 4294967295), required=True)
+    Gid: int = spec(integer(0, 4294967295), required=True)
+    SecondaryGids: list = spec(list_of(integer(0, 4294967295), 16))
+
+
+posix_profile = nested(PosixProfile)
+
+
+def posix_profile_check(value):
+    # the UI edits the profile as a list with a single entry and reads it back in that shape
+    if isinstance(value, list):
+        value = [entry for entry in value if not _empty(entry)]
+        if len(value) != 1:
+            raise ValueError("must be a single profile")
+        value = value[0]
+    return [posix_profile(value)]
+
+
+@dataclass(slots=True)
+class UserConfig:
+    Role: str = spec(arn, required=True)
+    HomeDirectoryType: str = spec(text(8, r'^(LOGICAL|PATH)$', "must be LOGICAL or PATH"), required=True)
+    HomeDirectory: str = spec(text(1024))
+    HomeDirectoryDetails: list = spec(list_of(nested(HomeDirectoryMapping)))
+    PosixProfile: list = spec(posix_profile_check, empty=list)
+    PublicKeys: list = spec(list_of(text(8192), 50), empty=list)
+    Policy: str = spec(text(2048))
+    argon2_hash: str = spec(text(512, r'^\$argon2(id|i|d)\$', "must be an argon2 hash"))
+
+
+@dataclass(slots=True)
+class User:
+    user: str = spec(text(100, r'^\S+$', "must not contain spaces"), required=True)
+    identity_provider_key: str = spec(provider_check, required=True)
+    identity_provider_module: str = spec(text(32), required=True)
+    ipv4_allow_list: list = spec(list_of(cidr), empty=list)
+    config: UserConfig = spec(nested(UserConfig), required=True)
+
+
+user_validator = _validators.setdefault(User, Validator(User))
+
+
+def parse_user(payload):
+    """
+    User model for a request body, raises ModelError when invalid
+    """
+    if not isinstance(payload, dict):
+        raise ModelError(["body must be a JSON object"])
+    user = user_validator.parse(payload)
+    errors = []
+    config = user.config
+    if config.HomeDirectoryType == 'LOGICAL' and not (config.HomeDirectory or config.HomeDirectoryDetails):
+        errors.append("config.HomeDirectory or config.HomeDirectoryDetails is required when type is LOGICAL")
+    if user.identity_provider_module == 'argon2' and not config.argon2_hash:
+        errors.append("config.argon2_hash is required when IdP module is argon2")
+    if errors:
+        raise ModelError(errors)
+    return user
@@ -0,0 +1,181 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import queue
+import threading
+import ddb_helper
+
+# Full table reads go through here: listing everything, exports, counts, integrity checks.
+# Each segment of a Segment/TotalSegments scan runs on its own thread with the client behind the
+# DynamoDB resource, which unlike the resource itself is thread safe and still converts to and
+# from python values. Pages are handed over through a bounded queue, so at
+# most max_in_flight pages are held in memory no matter how fast the segments read.
+
+default_segments = int(os.environ.get('SCAN_SEGMENTS', 4))
+# most segments a checkpoint may resume, checkpoints come back from clients in cursors and every segment is a thread
+max_segments = max(default_segments, 32)
+
+_done = object()
+
+
+def _scan_kwargs(table_name: str, projection, page_size, kwargs: dict):
+    params = dict(kwargs, TableName=table_name)
+    if projection:
+        expression, names = ddb_helper.projection(projection)
+        params['ProjectionExpression'] = expression
+        params['ExpressionAttributeNames'] = {**params.get('ExpressionAttributeNames', {}), **names}
+    if page_size:
+        params['Limit'] = page_size
+    return params
+
+
+def _scan_segment(client, params: dict, segment: int, total_segments: int, start_key, pages: queue.Queue,
+                  stop: threading.Event):
+    try:
+        while not stop.is_set():
+            request = dict(params, Segment=segment, TotalSegments=total_segments)
+            if start_key:
+                request['ExclusiveStartKey'] = start_key
+            response = client.scan(**request)
+            response['Segment'] = segment
+            _put(pages, response, stop)
+            start_key = response.get('LastEvaluatedKey')
+            if not start_key:
+                break
+    except Exception as e:
+        _put(pages, e, stop)
+    finally:
+        _put(pages, _done, stop)
+
+
+def _put(pages: queue.Queue, value, stop: threading.Event):
+    # block while the consumer is behind, but give up once it has gone away
+    while not stop.is_set():
+        try:
+            pages.put(value, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def scan_pages(table, segments: int = None, projection=None, page_size: int = None, max_in_flight: int = None,
+               positions: dict = None, **kwargs):
+    """
+    Parallel scan of a table, yielding raw scan responses as segments return them
+
+    Every response carries the Segment it was read from. Pages of one segment are yielded in order, so a
+    ScanPositions fed with each consumed page can resume the scan later through the positions parameter.
+
+    :param table: boto3 Table resource, or table name
+    :param segments: TotalSegments, defaults to SCAN_SEGMENTS
+    :param projection: attribute names or paths to read, all attributes when empty
+    :param page_size: Limit per scan call
+    :param max_in_flight: pages buffered between the segment threads and the caller, defaults to 2 per segment
+    :param positions: ScanPositions.checkpoint() of an earlier scan to resume, segments must match
+    :param kwargs: passed on to scan, e.g. FilterExpression, Select, ExpressionAttributeValues
+    :return: generator of scan responses
+    """
+    if positions:
+        segments, start_keys = checked_positions(positions)
+    else:
+        segments = segments or default_segments
+        start_keys = {segment: None for segment in range(segments)}
+    max_in_flight = max_in_flight or segments * 2
+    table_name = table if isinstance(table, str) else table.name
+    client = ddb_helper.resource().meta.client if isinstance(table, str) else table.meta.client
+    params = _scan_kwargs(table_name, projection, page_size, kwargs)
+
+    pages = queue.Queue(maxsize=max_in_flight)
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=max(len(start_keys), 1), thread_name_prefix='scan-segment')
+    scan_segment = ddb_helper.in_trace(_scan_segment)
+    for segment, start_key in start_keys.items():
+        executor.submit(scan_segment, client, params, segment, segments, start_key, pages, stop)
+    try:
+        running = len(start_keys)
+        while running:
+            page = pages.get()
+            if page is _done:
+                running -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield page
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def checked_positions(positions: dict):
+    """
+    TotalSegments and start key per segment of a ScanPositions.checkpoint() read back from a cursor
+    :raises ValueError: unless segments is an int in 1..max_segments and the keys are start keys of some of them
+    """
+    try:
+        segments = positions['segments']
+        if isinstance(segments, bool) or not isinstance(segments, int) or not 1 <= segments <= max_segments:
+            raise ValueError
+        start_keys = {int(segment): key for segment, key in positions['keys'].items()}
+    except (AttributeError, KeyError, TypeError, ValueError):
+        raise ValueError("invalid cursor")
+    if (not start_keys or not set(start_keys).issubset(range(segments))
+            or not all(key is None or isinstance(key, dict) for key in start_keys.values())):
+        raise ValueError("invalid cursor")
+    return segments, start_keys
+
+
+class ScanPositions:
+    """
+    Where each segment of a scan_pages scan got to, for resuming the scan in a later invocation
+    """
+
+    def __init__(self, segments: int, positions: dict = None):
+        if positions:
+            self.segments, self.keys = checked_positions(positions)
+        else:
+            self.segments = segments
+            self.keys = {segment: None for segment in range(segments)}
+
+    def consumed(self, page: dict):
+        """
+        Record a page as fully processed, its segment continues after the page's LastEvaluatedKey
+        """
+        if 'LastEvaluatedKey' in page:
+            self.keys[page['Segment']] = page['LastEvaluatedKey']
+        else:
+            # segment finished
+            self.keys.pop(page['Segment'], None)
+
+    @property
+    def finished(self):
+        return not self.keys
+
+    def checkpoint(self):
+        """
+        JSON friendly positions for scan_pages, None once every segment is finished
+        """
+        if self.finished:
+            return None
+        return {'segments': self.segments, 'keys': {str(segment): key for segment, key in self.keys.items()}}
+
+
+def parallel_scan(table, segments: int = None, projection=None, page_size: int = None, max_in_flight: int = None,
+                  **kwargs):
+    """
+    Parallel scan of a table, yielding items one at a time
+
+    Items come back in no particular order. Stop iterating (or close the generator) to abort the scan.
+    Parameters are the same as scan_pages.
+    :return: generator of items
+    """
+    for page in scan_pages(table, segments, projection, page_size, max_in_flight, **kwargs):
+        yield from page.get('Items', [])
+
+
+def parallel_count(table, segments: int = None, **kwargs):
+    """
+    Count items with a parallel Select=COUNT scan, following every page of every segment
+
+    :param kwargs: passed on to scan, e.g. FilterExpression and ExpressionAttributeValues
+    :return: number of items matching the filter
+    """
+    return sum(page['Count'] for page in scan_pages(table, segments, Select='COUNT', **kwargs))
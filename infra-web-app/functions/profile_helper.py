@@ -0,0 +1,63 @@
+import os
+
+# Opt-in profiling of API requests with cProfile, the functions taking the most time are logged at INFO.
+# PROFILE_REQUESTS=true profiles every request. Otherwise a request with the header "x-profile: true" is profiled
+# when the caller belongs to one of the cognito groups in PROFILE_GROUPS (comma separated, none by default).
+# cProfile slows the request down severalfold, durations in the profile are relative, not what callers see.
+# cProfile and pstats are imported by the first profiled request, they are not needed on the cold start.
+
+header = 'x-profile'
+enabled = os.environ.get('PROFILE_REQUESTS', 'false') == 'true'
+allowed_groups = frozenset(group.strip() for group in os.environ.get('PROFILE_GROUPS', '').split(',') if group.strip())
+top = int(os.environ.get('PROFILE_TOP', 25))
+# cumulative shows which phase the time went to, tottime the functions that spent it themselves
+sort = os.environ.get('PROFILE_SORT', 'cumulative')
+
+
+def requested(headers: dict):
+    """
+    True if the request is to be profiled, the caller's groups are checked once the token was validated
+    """
+    return enabled or (bool(allowed_groups) and headers.get(header) == 'true')
+
+
+def allowed(groups):
+    """
+    True if the profile of a request made by a member of groups may be logged
+    """
+    return enabled or not allowed_groups.isdisjoint(groups)
+
+
+def start():
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def hot_functions(profiler, limit: int = None, sort_key: str = None):
+    """
+    The functions of a stopped cProfile.Profile that took the most time, as dicts for a structured log record
+    """
+    import pstats
+    stats = pstats.Stats(profiler)
+    stats.sort_stats(sort_key or sort)
+    functions = []
+    for function in stats.fcn_list[:limit or top]:
+        primitive_calls, calls, own_time, cumulative_time, _ = stats.stats[function]
+        functions.append({
+            'function': label(function),
+            'calls': calls,
+            'own_ms': round(own_time * 1000, 3),
+            'cumulative_ms': round(cumulative_time * 1000, 3),
+        })
+    return functions
+
+
+def label(function: tuple):
+    file_name, line, name = function
+    if file_name == '~':
+        # built-in, e.g. <built-in method _hashlib.openssl_sha256>
+        return name
+    # the last two path parts, enough to tell site-packages apart from the function code
+    return f"{'/'.join(file_name.split(os.sep)[-2:])}:{line}({name})"
@@ -0,0 +1,98 @@
+from collections import OrderedDict
+import os
+import threading
+import time
+import table_versions
+
+# Read-through cache for small, rarely written tables (the IdP table), kept in the warm container.
+# Entries expire after a TTL and the cache is bounded in size. Writes in this container invalidate it
+# right away, writes in other containers are picked up through the table's version marker, which is
+# read at most once every version_check seconds, so between checks a cached read costs no DynamoDB call.
+
+_missing = object()
+
+
+class VersionedCache:
+    """
+    Bounded LRU of loaded values with a TTL, dropped whenever the version marker of the table changes
+    """
+
+    def __init__(self, table_name: str, ttl: float = None, max_size: int = None, version_check: float = None,
+                 enabled: bool = None):
+        self.table_name = table_name
+        self.ttl = ttl if ttl is not None else float(os.environ.get('IDP_CACHE_TTL_SECONDS', 60))
+        self.max_size = max_size if max_size is not None else int(os.environ.get('IDP_CACHE_SIZE', 512))
+        self.version_check = version_check if version_check is not None \
+            else float(os.environ.get('IDP_CACHE_VERSION_CHECK_SECONDS', 5))
+        self.enabled = enabled if enabled is not None else os.environ.get('IDP_CACHE_ENABLED', 'true') == 'true'
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked = 0.0
+        # bumped on every clear, a value loaded across a clear is not stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def version(self):
+        """
+        Version marker of the table as last checked, re-read once version_check seconds have passed.
+        Entries cached under an older version are dropped.
+        """
+        if time.monotonic() - self._version_checked < self.version_check:
+            return self._version
+        version = table_versions.current(self.table_name)
+        with self._lock:
+            if version != self._version:
+                self._clear()
+                self._version = version
+            self._version_checked = time.monotonic()
+        return version
+
+    def get(self, key, load):
+        """
+        Cached value for key, calling load on a miss
+        :param key: hashable key, e.g. ('item', provider)
+        :param load: returns the value, None is cached as well
+        :return: value and True when served from cache
+        """
+        if not self.enabled:
+            return load(), False
+        self.version()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key, _missing)
+            if entry is not _missing:
+                expires, value = entry
+                if now < expires:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value, True
+                del self._entries[key]
+            self.misses += 1
+            generation = self._generation
+        value = load()
+        with self._lock:
+            if generation != self._generation:
+                return value, False
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value, False
+
+    def invalidate(self, version: str = None):
+        """
+        Drop every entry after a write, version is the bumped marker of the write when known
+        """
+        with self._lock:
+            self._clear()
+            self._version = version
+            self._version_checked = time.monotonic() if version is not None else 0.0
+
+    def _clear(self):
+        self._entries.clear()
+        self._generation += 1
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'version': self._version}
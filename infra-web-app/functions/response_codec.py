@@ -0,0 +1,127 @@
+from decimal import Decimal
+import base64
+import gzip
+import os
+
+# JSON encoding and compression of response bodies. orjson and brotli are optional, they ship in the
+# Lambda layer (see README) and the plain simplejson and gzip paths are used where they are missing.
+#
+# DynamoDB returns every number as a Decimal. simplejson writes those out itself, orjson calls
+# _json_default, which turns them into int or float without an intermediate string. A Decimal that
+# a float can't hold exactly sends the whole body through simplejson instead, so no digit is lost.
+
+import simplejson
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the layer
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the layer
+    brotli = None
+
+# below this size compression costs more CPU than it saves on the wire
+min_compress_bytes = int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
+gzip_level = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 5))
+brotli_quality = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4))
+
+
+class InexactNumber(TypeError):
+    """
+    A Decimal with more digits than a float holds
+    """
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        if value == value.to_integral_value():
+            return int(value)
+        number = float(value)
+        if Decimal(repr(number)) != value:
+            raise InexactNumber(value)
+        return number
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(body) -> bytes:
+    """
+    Serialize a response body to UTF-8 JSON
+    """
+    if orjson is not None:
+        inexact = []
+
+        def default(value):
+            try:
+                return _json_default(value)
+            except InexactNumber:
+                inexact.append(value)
+                raise
+
+        try:
+            return orjson.dumps(body, default=default, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # orjson wraps the error of default in its own, the flag tells the two apart
+            if not inexact:
+                raise
+    return simplejson.dumps(body, default=_json_default).encode('utf-8')
+
+
+def accepted_encodings(accept_encoding: str):
+    """
+    Content codings the client accepts, from the Accept-Encoding header, dropping those with q=0
+    """
+    accepted = set()
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding)
+    return accepted
+
+
+def choose_encoding(accept_encoding: str):
+    """
+    Best supported content coding for the client, None to send the body as is
+    """
+    accepted = accepted_encodings(accept_encoding)
+    if brotli is not None and ('br' in accepted or '*' in accepted):
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+def content_encoding(body: bytes, accept_encoding: str):
+    """
+    Content-Encoding encode sends a serialized body with, None when it is sent as is
+    """
+    return choose_encoding(accept_encoding) if len(body) >= min_compress_bytes else None
+
+
+def encode(body: bytes, accept_encoding: str):
+    """
+    Compress a serialized body when it is large enough and the client accepts it
+    :param body: serialized body
+    :param accept_encoding: Accept-Encoding request header
+    :return: ALB body, isBase64Encoded and the Content-Encoding, None when not compressed
+    """
+    encoding = content_encoding(body, accept_encoding)
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=brotli_quality)
+    elif encoding == 'gzip':
+        compressed = gzip.compress(body, compresslevel=gzip_level, mtime=0)
+    else:
+        return body.decode('utf-8'), False, None
+    return base64.b64encode(compressed).decode('ascii'), True, encoding
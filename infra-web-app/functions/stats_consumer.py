@@ -0,0 +1,58 @@
+from aws_lambda_powertools import Logger
+from aws_lambda_powertools.utilities.typing import LambdaContext
+from aws_lambda_powertools import Tracer
+from collections import Counter
+import argparse
+import simplejson as json
+import aggregates
+
+# Consumer of the DynamoDB streams of the users and IdP tables, keeps the counters of aggregates.py up to date.
+# Needs STATS_TABLE_NAME, USER_TABLE_NAME and IDP_TABLE_NAME. Invoked with {"rebuild": true} it recomputes the
+# counters from full scans instead.
+#
+# Recorded stream events can be replayed locally, e.g. against DynamoDB Local:
+#   AWS_ENDPOINT_URL_DYNAMODB=http://localhost:8000 python functions/stats_consumer.py events.json
+
+logger = Logger()
+tracer = Tracer()
+
+
+def process(event: dict):
+    """
+    Apply the records of a stream batch in order
+    :return: partial batch response, with the sequence number of the first record that failed
+    """
+    if event.get('rebuild'):
+        result = aggregates.rebuild()
+        logger.info("rebuilt statistics: %s", result)
+        return result
+    results = Counter()
+    for record in event['Records']:
+        try:
+            results[aggregates.apply_record(record)] += 1
+        except Exception:
+            logger.exception("unable to apply stream record %s", record.get('eventID'))
+            # Lambda retries the batch from this record, the records before it are done
+            logger.info("stream batch results: %s", dict(results))
+            return {'batchItemFailures': [{'itemIdentifier': record['dynamodb']['SequenceNumber']}]}
+    logger.info("stream batch results: %s", dict(results))
+    return {'batchItemFailures': []}
+
+
+@tracer.capture_lambda_handler
+def handler(event: dict, context: LambdaContext):
+    return process(event)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feed recorded DynamoDB stream events to the statistics consumer")
+    parser.add_argument('events', nargs='+', help='JSON files of stream events, {"Records": [...]}')
+    args = parser.parse_args()
+    for path in args.events:
+        with open(path) as events:
+            print(path, json.dumps(process(json.load(events))))
+    print(json.dumps(aggregates.read(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
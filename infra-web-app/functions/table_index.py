@@ -0,0 +1,46 @@
+from botocore.exceptions import ClientError
+import boto3
+
+# CloudFormation custom resource adding a KEYS_ONLY index to a users table the stack does not own, run by the
+# custom resource provider framework, which reports the result to CloudFormation. An index of the same name is
+# left as it is, and the index is kept when the resource is deleted, other tools may query it by then.
+
+
+def handler(event, context):
+    properties = event['ResourceProperties']
+    if event['RequestType'] != 'Delete':
+        add_index(boto3.client('dynamodb'), properties['TableName'], properties['IndexName'],
+                  properties['PartitionKey'], int(properties['ReadCapacity']), int(properties['WriteCapacity']))
+    return {'PhysicalResourceId': f"{properties['TableName']}-{properties['IndexName']}"}
+
+
+def add_index(client, table_name: str, index_name: str, partition_key: str, read_capacity: int,
+              write_capacity: int):
+    """
+    Create the index with user as its sort key, with the given throughput when the table uses provisioned capacity
+    :return: True if the index was created, False if it was there already
+    """
+    table = client.describe_table(TableName=table_name)['Table']
+    if any(index['IndexName'] == index_name for index in table.get('GlobalSecondaryIndexes', [])):
+        return False
+    create = {
+        'IndexName': index_name,
+        'KeySchema': [{'AttributeName': partition_key, 'KeyType': 'HASH'},
+                      {'AttributeName': 'user', 'KeyType': 'RANGE'}],
+        'Projection': {'ProjectionType': 'KEYS_ONLY'},
+    }
+    # tables created before on-demand capacity existed have no billing mode summary, they are provisioned
+    if table.get('BillingModeSummary', {}).get('BillingMode', 'PROVISIONED') == 'PROVISIONED':
+        create['ProvisionedThroughput'] = {'ReadCapacityUnits': read_capacity, 'WriteCapacityUnits': write_capacity}
+    try:
+        client.update_table(TableName=table_name,
+                            AttributeDefinitions=[{'AttributeName': partition_key, 'AttributeType': 'S'},
+                                                  {'AttributeName': 'user', 'AttributeType': 'S'}],
+                            GlobalSecondaryIndexUpdates=[{'Create': create}])
+    except ClientError as e:
+        # created since the DescribeTable call, any other validation error fails the deployment
+        error = e.response['Error']
+        if error['Code'] == 'ValidationException' and 'already exists' in error.get('Message', ''):
+            return False
+        raise
+    return True
@@ -0,0 +1,75 @@
+from aws_lambda_powertools import Logger
+from botocore.exceptions import ClientError
+import os
+import threading
+import time
+import ddb_helper
+
+# Global secondary indexes of the tables, read with DescribeTable so the handlers query the indexes a table
+# actually has, e.g. the ones the stack creates when it owns the tables. Only ACTIVE indexes that are done
+# backfilling are used. The description is read again every INDEX_CHECK_SECONDS, so warm containers pick up an
+# index added later. When the table can't be described the configured index name is used, as before.
+
+logger = Logger(child=True)
+
+enabled = os.environ.get('INDEX_DETECTION', 'true') == 'true'
+check_interval = float(os.environ.get('INDEX_CHECK_SECONDS', 300))
+
+_lock = threading.Lock()
+# table name -> (monotonic time described, {(partition key, sort key): index name}), None when not describable
+_described = {}
+
+
+def index_for(table_name: str, partition_key: str, sort_key: str = None, fallback: str = None):
+    """
+    Name of a usable GSI of table_name keyed on partition_key, and sort_key when given
+    :param fallback: index name to use when detection is off or the table can't be described
+    :return: the index name, None when the table has no such index
+    """
+    indexes = describe(table_name)
+    if indexes is None:
+        return fallback
+    if sort_key is not None:
+        return indexes.get((partition_key, sort_key))
+    return next((name for (partition, _), name in indexes.items() if partition == partition_key), None)
+
+
+def describe(table_name: str):
+    """
+    {(partition key, sort key): index name} of the usable GSIs of table_name, None when it can't be described
+    """
+    if not enabled or not table_name:
+        return None
+    now = time.monotonic()
+    with _lock:
+        described = _described.get(table_name)
+        if described is not None and now - described[0] < check_interval:
+            return described[1]
+    try:
+        table = ddb_helper.resource().meta.client.describe_table(TableName=table_name)['Table']
+        indexes = usable_indexes(table)
+    except ClientError as e:
+        # e.g. no dynamodb:DescribeTable permission, keep to the configured index until the next check
+        logger.warning("unable to describe %s, using the configured indexes: %s", table_name, e)
+        indexes = None
+    with _lock:
+        _described[table_name] = (now, indexes)
+    return indexes
+
+
+def usable_indexes(table: dict):
+    """
+    {(partition key, sort key): index name} of the ACTIVE, not backfilling GSIs of a DescribeTable result
+    """
+    indexes = {}
+    for index in table.get('GlobalSecondaryIndexes', []):
+        if index.get('IndexStatus') != 'ACTIVE' or index.get('Backfilling'):
+            continue
+        keys = {key['KeyType']: key['AttributeName'] for key in index['KeySchema']}
+        indexes.setdefault((keys['HASH'], keys.get('RANGE')), index['IndexName'])
+    return indexes
+
+
+def clear():
+    with _lock:
+        _described.clear()
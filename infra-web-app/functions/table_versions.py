@@ -0,0 +1,55 @@
+from botocore.exceptions import ClientError
+from aws_lambda_powertools import Logger
+import os
+import ddb_helper
+
+# Version markers for the users and IdP tables, one item per table in a small table owned by this stack.
+# Every write through the API bumps the marker of the table it changed, so list responses can be tagged
+# with the marker and a conditional GET costs one GetItem instead of a scan.
+#
+# Changes made outside the API (console, scripts) do not bump the marker, run bump() after those.
+
+logger = Logger(child=True)
+
+table_name = os.environ.get('VERSION_TABLE_NAME')
+
+
+def _table():
+    return ddb_helper.resource().Table(table_name)
+
+
+def current(name: str):
+    """
+    Version marker of a table, None when versions are not configured or cannot be read
+    """
+    if not table_name:
+        return None
+    try:
+        response = _table().get_item(Key={'table_name': name}, ConsistentRead=True,
+                                     ProjectionExpression='#v', ExpressionAttributeNames={'#v': 'version'})
+    except ClientError as e:
+        logger.warning("unable to read version of %s: %s", name, e)
+        return None
+    return str(response.get('Item', {}).get('version', 0))
+
+
+def bump(name: str):
+    """
+    Mark a table as changed, call after the write succeeded
+    :return: the new version, None when versions are not configured
+    """
+    if not table_name:
+        return None
+    response = _table().update_item(Key={'table_name': name},
+                                    UpdateExpression='ADD #v :one',
+                                    ExpressionAttributeNames={'#v': 'version'},
+                                    ExpressionAttributeValues={':one': 1},
+                                    ReturnValues='UPDATED_NEW')
+    return str(response['Attributes']['version'])
+
+
+if __name__ == '__main__':
+    # python functions/table_versions.py transferidp_users, after changing a table outside the API
+    import sys
+    for name in sys.argv[1:]:
+        print(name, bump(name))
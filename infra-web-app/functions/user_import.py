@@ -0,0 +1,172 @@
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import io
+import os
+import time
+import simplejson as json
+import ddb_helper
+import models
+
+# Bulk user import from CSV or JSONL. Rows are parsed one at a time and written in BatchWriteItem
+# chunks of 25 as they fill, so the upload is never held as a list of items. Chunks are written
+# concurrently, and once the deadline passes the rows left are reported as failed instead of written.
+#
+# CSV uses one column per attribute, nested config attributes as dotted names (config.Role),
+# list attributes separated by ; (ipv4_allow_list, config.PublicKeys) and JSON for anything more
+# complex (config.HomeDirectoryDetails). JSONL has one user item per line, as sent by the UI.
+
+key_names = ('user', 'identity_provider_key')
+write_workers = int(os.environ.get('IMPORT_WRITE_WORKERS', 4))
+# seconds before the function times out at which the import stops writing, left for the response
+deadline_margin = float(os.environ.get('IMPORT_DEADLINE_MARGIN_SECONDS', 0.5))
+deadline_error = 'not written before the request deadline'
+list_columns = ('ipv4_allow_list', 'config.PublicKeys')
+
+
+def content_format(content_type: str, requested: str = None):
+    """
+    csv or jsonl, from the format query parameter or else the content type, raises ValueError when unknown
+    """
+    if requested:
+        if requested not in ('csv', 'jsonl'):
+            raise ValueError(f"unsupported format {requested}, use csv or jsonl")
+        return requested
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines', 'application/json'):
+        return 'jsonl'
+    raise ValueError(f"unsupported content type {content_type}, send text/csv or application/x-ndjson")
+
+
+def parse_rows(body: str, row_format: str):
+    """
+    Lazily parse the upload
+    :return: generator of (row number, item, error), item is None when the row could not be parsed
+    """
+    if row_format == 'csv':
+        reader = csv.DictReader(io.StringIO(body))
+        for row_number, row in enumerate(reader, start=1):
+            try:
+                yield row_number, csv_item(row), None
+            except ValueError as e:
+                yield row_number, None, str(e)
+    else:
+        for row_number, line in enumerate(io.StringIO(body), start=1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line, use_decimal=True)
+            except ValueError as e:
+                yield row_number, None, f"invalid JSON: {e}"
+                continue
+            if not isinstance(item, dict):
+                yield row_number, None, "row must be a JSON object"
+                continue
+            yield row_number, item, None
+
+
+def csv_item(row: dict):
+    item = {}
+    for column, value in row.items():
+        if column is None:
+            raise ValueError("row has more values than the header")
+        value = (value or '').strip()
+        if not value:
+            continue
+        if column in list_columns:
+            value = [part.strip() for part in value.split(';') if part.strip()]
+        elif value[0] in '[{':
+            try:
+                value = json.loads(value, use_decimal=True)
+            except ValueError:
+                raise ValueError(f"{column} is not valid JSON")
+        target = item
+        *parents, name = column.split('.')
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[name] = value
+    return item
+
+
+def import_users(table, rows, deadline: float = None, workers: int = None):
+    """
+    Validate users against the user model and write them, chunked into BatchWriteItem calls of 25 run concurrently
+    :param table: users table
+    :param rows: (row number, item, error) tuples from parse_rows
+    :param deadline: time.monotonic() after which no chunk is written, its rows are reported as failed
+    :param workers: concurrent BatchWriteItem calls, defaults to IMPORT_WRITE_WORKERS
+    :return: report with totals and a result for every row
+    """
+    results = []
+    chunk = {}
+    futures = []
+    workers = workers or write_workers
+    write = ddb_helper.in_trace(lambda written: write_chunk(table, written, deadline))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='user-import') as executor:
+        def flush():
+            if deadline is not None and time.monotonic() >= deadline:
+                results.extend(chunk_results(chunk, set(chunk), deadline_error))
+            else:
+                futures.append(executor.submit(write, dict(chunk)))
+            chunk.clear()
+            # a few chunks in flight per worker, the rest of the upload is not parsed ahead of the writes
+            while len(futures) > 2 * workers:
+                results.extend(futures.pop(0).result())
+
+        for row_number, item, error in rows:
+            errors = [error] if error else []
+            if not errors:
+                try:
+                    item = models.item(models.parse_user(item))
+                except models.ModelError as e:
+                    errors = e.errors
+            if errors:
+                results.append({'row': row_number, 'user': (item or {}).get('user'), 'status': 'invalid',
+                                'errors': errors})
+                continue
+            key = tuple(item[name] for name in key_names)
+            # the same key twice in one BatchWriteItem call is rejected, the later row wins
+            if key in chunk:
+                flush()
+            chunk[key] = (row_number, item)
+            if len(chunk) == ddb_helper.batch_write_size:
+                flush()
+        if chunk:
+            flush()
+        for future in futures:
+            results.extend(future.result())
+
+    results.sort(key=lambda result: result['row'])
+    summary = {status: 0 for status in ('imported', 'invalid', 'failed')}
+    for result in results:
+        summary[result['status']] += 1
+    return {**summary, 'rows': results}
+
+
+def write_chunk(table, chunk: dict, deadline: float = None):
+    """
+    Write one chunk of validated rows
+    :param chunk: (row number, item) by key tuple, at most 25
+    :return: result of every row of the chunk
+    """
+    requests = [{'PutRequest': {'Item': item}} for _, item in chunk.values()]
+    try:
+        unprocessed = set(ddb_helper.batch_write(table, requests, key_names, deadline=deadline))
+        error = 'not processed after retries'
+    except ClientError as e:
+        unprocessed = set(chunk)
+        error = e.response['Error'].get('Message', str(e))
+    return chunk_results(chunk, unprocessed, error)
+
+
+def chunk_results(chunk: dict, unprocessed: set, error: str):
+    results = []
+    for key, (row_number, _) in chunk.items():
+        if key in unprocessed:
+            results.append({'row': row_number, 'user': key[0], 'status': 'failed', 'errors': [error]})
+        else:
+            results.append({'row': row_number, 'user': key[0], 'status': 'imported'})
+    return results
@@ -0,0 +1,141 @@
+from aws_lambda_powertools import Logger
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+import os
+import simplejson as json
+import ddb_helper
+
+# Server side filtering of the users list. With a provider the users come from a Query on the provider
+# index, which has user as sort key, so a username prefix and the sort order are part of the key condition.
+# A module filter without a provider queries the module index the same way when the table has one.
+# The indexes only project keys, the page of keys is read with BatchGetItem and the remaining filters are
+# applied to the items. Without either (or without the index) it is a filtered scan, pages are then
+# sorted on their own and may come back short, as a scan reads at most scan_max_calls pages per request.
+
+logger = Logger(child=True)
+
+key_names = ('user', 'identity_provider_key')
+# query parameter -> attribute path
+filter_attributes = {
+    'prefix': 'user',
+    'provider': 'identity_provider_key',
+    'module': 'identity_provider_module',
+    'role': 'config.Role',
+}
+# filters that can be the partition key of an index query, in order of preference
+index_filters = ('provider', 'module')
+sort_orders = ('user', '-user')
+scan_max_calls = int(os.environ.get('SEARCH_SCAN_MAX_CALLS', 10))
+
+
+def search_request(query_parameters: dict):
+    """
+    Filters and sort order of a users list request, raises ValueError on an unknown sort order
+    :return: filters by query parameter name, without empty ones, and the sort order or None
+    """
+    filters = {name: query_parameters[name] for name in filter_attributes if query_parameters.get(name)}
+    sort = query_parameters.get('sort') or None
+    if sort is not None and sort not in sort_orders:
+        raise ValueError(f"sort must be one of {', '.join(sort_orders)}")
+    return filters, sort
+
+
+def search(table, query_parameters: dict, provider_index: str = None, attributes=None, module_index: str = None):
+    """
+    One page of users matching the filter query parameters
+    :param table: users table
+    :param query_parameters: prefix, provider, module, role, sort, limit and cursor
+    :param provider_index: GSI on identity_provider_key with user as sort key, scans when None
+    :param attributes: attribute names or paths to read, all attributes when empty
+    :param module_index: GSI on identity_provider_module with user as sort key, for module filters without a provider
+    :return: items, next_cursor and the access_path used
+    """
+    filters, sort = search_request(query_parameters)
+    limit, start_key = ddb_helper.page_request(query_parameters)
+    indexes = {'provider': provider_index, 'module': module_index}
+    partition = next((name for name in index_filters if name in filters and indexes[name]), None)
+    if partition:
+        try:
+            return _query(table, filters, sort, limit, start_key, indexes[partition], attributes, partition)
+        except ClientError as e:
+            # index missing or still backfilling
+            if e.response['Error']['Code'] not in ('ValidationException', 'ResourceNotFoundException'):
+                raise
+            logger.warning("query on %s failed, falling back to scan: %s", indexes[partition], e)
+    return _scan(table, filters, sort, limit, start_key, attributes)
+
+
+def _query(table, filters, sort, limit, start_key, index_name, attributes, partition='provider'):
+    key_condition = Key(filter_attributes[partition]).eq(filters[partition])
+    if 'prefix' in filters:
+        key_condition = key_condition & Key('user').begins_with(filters['prefix'])
+    # a query on an index continues from the table and the index keys, so a cursor needs both
+    index_key_names = tuple(dict.fromkeys((*key_names, filter_attributes[partition])))
+    keys, cursor = ddb_helper.page(table.query, index_key_names, limit, start_key,
+                                   IndexName=index_name,
+                                   KeyConditionExpression=key_condition,
+                                   ScanIndexForward=sort != '-user')
+    read_attributes = [*attributes, *(filter_attributes[name] for name in filters)] if attributes else None
+    found, unprocessed = ddb_helper.batch_get_all(table, keys, key_names, read_attributes)
+    if unprocessed:
+        raise RuntimeError(f"{len(unprocessed)} users not read after retries, try again")
+    found = {tuple(item[name] for name in key_names): item for item in found}
+
+    # keep the index order, the page may shrink once the items are filtered or the byte budget runs out
+    item_filters = {name: value for name, value in filters.items() if name not in (partition, 'prefix')}
+    items = []
+    size = 0
+    for position, key in enumerate(keys):
+        item = found.get(tuple(key[name] for name in key_names))
+        if item is None or not _matches(item, item_filters):
+            continue
+        item_size = len(json.dumps(item))
+        if items and size + item_size > ddb_helper.max_page_bytes:
+            cursor = ddb_helper.encode_cursor(keys[position - 1])
+            break
+        items.append(_project(item, attributes))
+        size += item_size
+    return {
+        'items': items,
+        'next_cursor': cursor,
+        'access_path': {'operation': 'query', 'index': index_name, 'sort': 'index' if sort else None},
+    }
+
+
+def _scan(table, filters, sort, limit, start_key, attributes):
+    params = {}
+    conditions = [Attr('user').begins_with(filters['prefix'])] if 'prefix' in filters else []
+    conditions += [Attr(filter_attributes[name]).eq(value) for name, value in filters.items() if name != 'prefix']
+    if conditions:
+        condition = conditions[0]
+        for other in conditions[1:]:
+            condition = condition & other
+        params['FilterExpression'] = condition
+    params.update(ddb_helper.projection_kwargs(attributes, key_names))
+    items, cursor = ddb_helper.page(table.scan, key_names, limit, start_key,
+                                    max_calls=scan_max_calls if conditions else None, **params)
+    if sort:
+        items.sort(key=lambda item: item['user'], reverse=sort == '-user')
+    return {
+        'items': items,
+        'next_cursor': cursor,
+        'access_path': {'operation': 'scan', 'index': None, 'sort': 'page' if sort else None},
+    }
+
+
+def _matches(item: dict, filters: dict):
+    for name, value in filters.items():
+        current = item
+        for part in filter_attributes[name].split('.'):
+            current = current.get(part) if isinstance(current, dict) else None
+        if current != value:
+            return False
+    return True
+
+
+def _project(item: dict, attributes):
+    # drop attributes read only to apply the filters
+    if not attributes:
+        return item
+    wanted = {*key_names, *(attribute.split('.')[0] for attribute in attributes)}
+    return {name: value for name, value in item.items() if name in wanted}
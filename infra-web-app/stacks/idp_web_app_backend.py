@@ -8,13 +8,21 @@ from aws_cdk import (
     aws_elasticloadbalancingv2 as elbv2,
     aws_elasticloadbalancingv2_targets as elbv2_targets,
     aws_lambda as lambda_,
+    aws_lambda_event_sources as lambda_event_sources,
     aws_dynamodb as ddb,
     aws_iam as iam,
     aws_route53 as route53,
     aws_route53_targets as route53_targets,
-    aws_s3 as s3
+    aws_s3 as s3,
+    aws_sns as sns,
+    aws_cloudwatch as cloudwatch,
+    aws_cloudwatch_actions as cloudwatch_actions,
+    aws_events as events,
+    aws_events_targets as events_targets,
+    custom_resources as cr
 )
 import aws_cdk as cdk
+import json
 import os
 import jsii
 
@@ -43,9 +51,39 @@ class IdpWebAppBackend(Stack):
                  users_table: str = 'transferidp_users',
                  idp_table: str = 'transferidp_identity_providers',
                  alb_domain: str = 'toolkit.transferfamily.aws.com',
+                 single_function: bool = False,
+                 user_provider_index: str = 'identity_provider_key-index',
+                 nightly_export: bool = False,
+                 log_level: str = 'INFO',
+                 route_log_levels: dict = None,
+                 debug_sample_rate: float = 0.01,
+                 lambda_memory_size: int = 128,
+                 lambda_architecture: str = 'x86_64',
+                 provisioned_concurrency: int = 0,
+                 api_timeout_seconds: int = 3,
+                 monitoring: bool = False,
+                 latency_alarm_ms: int = 1000,
+                 error_rate_alarm: float = 0.05,
+                 alarm_topic_arn: str = None,
+                 profile_requests: bool = False,
+                 profile_groups: list = None,
+                 manage_tables: bool = False,
+                 add_provider_index: bool = False,
+                 user_module_index: str = None,
+                 table_billing: str = 'PAY_PER_REQUEST',
+                 table_read_capacity: int = 5,
+                 table_write_capacity: int = 5,
+                 table_max_read_capacity: int = 100,
+                 table_max_write_capacity: int = 100,
+                 table_target_utilization: int = 70,
+                 table_streams: bool = False,
+                 table_stats: bool = False,
                  **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        if table_stats and not manage_tables:
+            raise ValueError("table_stats needs manage_tables, the statistics are kept from the streams of the tables")
+
         vpc = ec2.Vpc.from_lookup(self, 'ToolkitUiVpc', vpc_name=vpc_name)
 
         cluster = ecs.Cluster(self, "ToolkitWebAppCluster", vpc=vpc, enable_fargate_capacity_providers=True, container_insights=True)
@@ -92,76 +130,264 @@ class IdpWebAppBackend(Stack):
         cdk.Aspects.of(self).add(HotfixCapacityProviderDependencies())
 
         runtime = lambda_.Runtime.PYTHON_3_13
+        # startup profile of the API functions: CPU scales with memory, imports and the first JWKS fetch run
+        # several times faster at 1024 MB than at the 128 MB default. arm64 needs the arm64 build of the jwt layer.
+        arm64 = lambda_architecture == 'arm64'
+        architecture = lambda_.Architecture.ARM_64 if arm64 else lambda_.Architecture.X86_64
 
         # Todo: enable application signals -> https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch-Application-Signals-Enable-Lambda.html
 
         jwt_layer = lambda_.LayerVersion(self, id='python_jwt_layer',
-                                            code=lambda_.Code.from_asset("./lambda_layers/python_jwt_layer/python_jwt.zip"),
+                                            code=lambda_.Code.from_asset(
+                                                "./lambda_layers/python_jwt_layer_arm64/python_jwt.zip" if arm64
+                                                else "./lambda_layers/python_jwt_layer/python_jwt.zip"),
                                             compatible_runtimes=[runtime],
+                                            compatible_architectures=[architecture],
                                             description="python jwt validation layer",
                                             layer_version_name="python_jwt_layer"
                                         )
 
-        idp_function = lambda_.Function(self, 'ToolkitWebAppLambda',
-                                        runtime=runtime,
-                                        handler='manage_idps.handler',
-                                        code=lambda_.Code.from_asset(
-                                            os.path.join(os.path.dirname("./functions/"))),
-                                        vpc=vpc,
-                                        environment={
-                                            'POWERTOOLS_METRICS_NAMESPACE': 'TransferFamilyToolkit',
-                                            'POWERTOOLS_SERVICE_NAME': "ToolkitIdpAdmin",
-                                            "LOG_LEVEL": "DEBUG",
-                                            'IDP_TABLE_NAME': idp_table,
-                                            "COGNITO_USER_POOL_CLIENT_ID": user_pool_client_id,
-                                            "JWKS_PROXY_ENDPOINT": jwks_proxy_endpoint
-                                        },
-                                        tracing=lambda_.Tracing.ACTIVE,
-                                        log_retention=cdk.aws_logs.RetentionDays.FIVE_DAYS,
-                                        timeout=cdk.Duration.seconds(3),
-                                        layers=[jwt_layer])
-
-        user_function = lambda_.Function(self, 'ToolkitWebAppUsersLambda',
-                                         runtime=runtime,
-                                         handler='manage_users.handler',
-                                         code=lambda_.Code.from_asset(
-                                             os.path.join(os.path.dirname("./functions/"))),
-                                         vpc=vpc,
-                                         environment={
-                                            'POWERTOOLS_METRICS_NAMESPACE': 'TransferFamilyToolkit',
-                                            'POWERTOOLS_SERVICE_NAME': "ToolkitIdpAdmin",
-                                            "LOG_LEVEL": "DEBUG",
-                                            'USER_TABLE_NAME': users_table,
-                                            "COGNITO_USER_POOL_CLIENT_ID": user_pool_client_id,
-                                            "JWKS_PROXY_ENDPOINT": jwks_proxy_endpoint
-                                         },
-                                         tracing=lambda_.Tracing.ACTIVE,
-                                         log_retention=cdk.aws_logs.RetentionDays.FIVE_DAYS,
-                                         timeout=cdk.Duration.seconds(3),
-                                         layers=[jwt_layer])
+        # version markers of the users and IdP tables, bumped by every write through the API for ETags
+        version_table = ddb.Table(self, 'ToolkitWebAppTableVersions',
+                                  partition_key=ddb.Attribute(name='table_name', type=ddb.AttributeType.STRING),
+                                  billing_mode=ddb.BillingMode.PAY_PER_REQUEST,
+                                  point_in_time_recovery_specification=ddb.PointInTimeRecoverySpecification(
+                                      point_in_time_recovery_enabled=True),
+                                  removal_policy=cdk.RemovalPolicy.DESTROY)
+
+        metrics_namespace = 'TransferFamilyToolkit'
+        service_name = 'ToolkitIdpAdmin'
+        common_environment = {
+            'POWERTOOLS_METRICS_NAMESPACE': metrics_namespace,
+            'POWERTOOLS_SERVICE_NAME': service_name,
+            "LOG_LEVEL": log_level,
+            # {"GET /api/user/": "WARNING"}, routes not listed log at LOG_LEVEL
+            "ROUTE_LOG_LEVELS": json.dumps(route_log_levels or {}),
+            # share of requests logged at DEBUG whatever the level
+            "LOG_DEBUG_SAMPLE_RATE": str(debug_sample_rate),
+            # cProfile of every request, or of requests with "x-profile: true" by members of these cognito groups
+            "PROFILE_REQUESTS": "true" if profile_requests else "false",
+            "PROFILE_GROUPS": ",".join(profile_groups or []),
+            "COGNITO_USER_POOL_CLIENT_ID": user_pool_client_id,
+            "JWKS_PROXY_ENDPOINT": jwks_proxy_endpoint,
+            "VERSION_TABLE_NAME": version_table.table_name
+        }
 
         powertools_layer = lambda_.LayerVersion.from_layer_version_arn(self, id='lambdapowertools',
-                                                                       layer_version_arn=f"arn:aws:lambda:{cdk.Stack.of(self).region}:017000801446:layer:AWSLambdaPowertoolsPythonV3-python313-x86_64:12")
+                                                                       layer_version_arn=f"arn:aws:lambda:{cdk.Stack.of(self).region}:017000801446:layer:AWSLambdaPowertoolsPythonV3-python313-{'arm64' if arm64 else 'x86_64'}:12")
+
+        def python_function(construct_id: str, handler: str, environment: dict,
+                            memory_size: int = lambda_memory_size,
+                            timeout: cdk.Duration = cdk.Duration.seconds(api_timeout_seconds)):
+            return lambda_.Function(self, construct_id,
+                                    runtime=runtime,
+                                    architecture=architecture,
+                                    handler=handler,
+                                    code=lambda_.Code.from_asset(
+                                        os.path.join(os.path.dirname("./functions/"))),
+                                    vpc=vpc,
+                                    environment={**common_environment, **environment},
+                                    tracing=lambda_.Tracing.ACTIVE,
+                                    log_retention=cdk.aws_logs.RetentionDays.FIVE_DAYS,
+                                    memory_size=memory_size,
+                                    timeout=timeout,
+                                    layers=[jwt_layer, powertools_layer])
+
+        def alb_target(function: lambda_.Function):
+            # with provisioned concurrency the ALB invokes the live alias, its environments are initialized ahead
+            if not provisioned_concurrency:
+                return elbv2_targets.LambdaTarget(function)
+            alias = lambda_.Alias(self, f"{function.node.id}Live",
+                                  alias_name='live',
+                                  version=function.current_version,
+                                  provisioned_concurrent_executions=provisioned_concurrency)
+            return elbv2_targets.LambdaTarget(alias)
+
+        if manage_tables:
+            # the stack owns the users and IdP tables. Tables of the same name must not exist yet, or have to be
+            # brought into the stack with `cdk import`. RETAIN keeps them and their data when the stack is deleted.
+            provisioned = table_billing == 'PROVISIONED'
+            capacity = dict(read_capacity=table_read_capacity, write_capacity=table_write_capacity) if provisioned else {}
+            table_settings = dict(billing_mode=ddb.BillingMode.PROVISIONED if provisioned else ddb.BillingMode.PAY_PER_REQUEST,
+                                  point_in_time_recovery_specification=ddb.PointInTimeRecoverySpecification(
+                                      point_in_time_recovery_enabled=True),
+                                  # old and new images, a consumer can tell what an update or delete changed
+                                  stream=ddb.StreamViewType.NEW_AND_OLD_IMAGES if table_streams or table_stats else None,
+                                  removal_policy=cdk.RemovalPolicy.RETAIN,
+                                  **capacity)
+            idp_table = ddb.Table(self, 'ToolkitWebAppIdpTable', table_name=idp_table,
+                                  partition_key=ddb.Attribute(name='provider', type=ddb.AttributeType.STRING),
+                                  **table_settings)
+            user_table = ddb.Table(self, 'ToolkitWebAppUserTable', table_name=users_table,
+                                   partition_key=ddb.Attribute(name='user', type=ddb.AttributeType.STRING),
+                                   sort_key=ddb.Attribute(name='identity_provider_key', type=ddb.AttributeType.STRING),
+                                   **table_settings)
+            # KEYS_ONLY like the index added to an existing table, the handlers detect which of them exist.
+            # A role index is not possible, the role is nested in the config map and GSI keys are top level attributes
+            user_indexes = {user_provider_index: 'identity_provider_key'}
+            if user_module_index:
+                user_indexes[user_module_index] = 'identity_provider_module'
+            for index_name, partition_key in user_indexes.items():
+                user_table.add_global_secondary_index(index_name=index_name,
+                                                      partition_key=ddb.Attribute(name=partition_key,
+                                                                                  type=ddb.AttributeType.STRING),
+                                                      sort_key=ddb.Attribute(name='user', type=ddb.AttributeType.STRING),
+                                                      projection_type=ddb.ProjectionType.KEYS_ONLY,
+                                                      **capacity)
+            if provisioned:
+                # the capacities above are the minimum, autoscaling keeps consumption at the target utilization
+                read = dict(min_capacity=table_read_capacity, max_capacity=table_max_read_capacity)
+                write = dict(min_capacity=table_write_capacity, max_capacity=table_max_write_capacity)
+                scalable = [attribute for table in (idp_table, user_table)
+                            for attribute in (table.auto_scale_read_capacity(**read), table.auto_scale_write_capacity(**write))]
+                for index_name in user_indexes:
+                    scalable += [user_table.auto_scale_global_secondary_index_read_capacity(index_name, **read),
+                                 user_table.auto_scale_global_secondary_index_write_capacity(index_name, **write)]
+                for attribute in scalable:
+                    attribute.scale_on_utilization(target_utilization_percent=table_target_utilization)
+        else:
+            idp_table = ddb.Table.from_table_name(self, 'idpTable', table_name=idp_table)
+            user_table = ddb.Table.from_table_attributes(self, 'userTable', table_name=users_table,
+                                                         global_indexes=[user_provider_index])
+
+            if add_provider_index:
+                # the users table is not owned by this stack, add the index for per IdP queries with an UpdateTable
+                # call. Opt-in, the index changes a table other tools may manage, e.g. with CloudFormation
+                index_function = python_function('ToolkitWebAppTableIndexLambda', 'table_index.handler', {},
+                                                 timeout=cdk.Duration.minutes(1))
+                index_function.add_to_role_policy(iam.PolicyStatement(
+                    actions=['dynamodb:DescribeTable', 'dynamodb:UpdateTable'],
+                    resources=[user_table.table_arn]))
+                index_provider = cr.Provider(self, 'UserProviderIndexProvider', on_event_handler=index_function)
+                cdk.CustomResource(self, 'UserProviderIndex',
+                                   service_token=index_provider.service_token,
+                                   resource_type='Custom::TableIndex',
+                                   properties={
+                                       'TableName': users_table,
+                                       'IndexName': user_provider_index,
+                                       'PartitionKey': 'identity_provider_key',
+                                       # only used when the table has provisioned capacity
+                                       'ReadCapacity': table_read_capacity,
+                                       'WriteCapacity': table_write_capacity,
+                                   })
+
+        stats_environment = {}
+        if table_stats:
+            # counters of users per IdP, module and role and IdPs per module, kept from the table streams by
+            # functions/stats_consumer.py. Markers of applied stream records expire with the TTL
+            stats_table = ddb.Table(self, 'ToolkitWebAppStats',
+                                    partition_key=ddb.Attribute(name='scope', type=ddb.AttributeType.STRING),
+                                    sort_key=ddb.Attribute(name='name', type=ddb.AttributeType.STRING),
+                                    billing_mode=ddb.BillingMode.PAY_PER_REQUEST,
+                                    time_to_live_attribute='expires',
+                                    point_in_time_recovery_specification=ddb.PointInTimeRecoverySpecification(
+                                        point_in_time_recovery_enabled=True),
+                                    # the counters can be rebuilt from the tables
+                                    removal_policy=cdk.RemovalPolicy.DESTROY)
+            stats_environment = {'STATS_TABLE_NAME': stats_table.table_name}
+
+        if single_function:
+            # one function behind both path patterns, IdP and user traffic share warm containers,
+            # the JWKS and token caches and the DynamoDB connection pool
+            api_function = python_function('ToolkitWebAppApiLambda', 'manage_api.handler', {
+                'IDP_TABLE_NAME': idp_table.table_name,
+                'USER_TABLE_NAME': user_table.table_name,
+                'USER_PROVIDER_INDEX': user_provider_index,
+                **stats_environment,
+            })
+            idp_table.grant_read_write_data(api_function)
+            user_table.grant_read_write_data(api_function)
+            functions = [api_function]
+            stats_reader = api_function
+        else:
+            idp_function = python_function('ToolkitWebAppLambda', 'manage_idps.handler', {
+                'IDP_TABLE_NAME': idp_table.table_name,
+                # cascade deletes of an IdP's users
+                'USER_TABLE_NAME': user_table.table_name,
+                'USER_PROVIDER_INDEX': user_provider_index,
+            })
+            user_function = python_function('ToolkitWebAppUsersLambda', 'manage_users.handler', {
+                'USER_TABLE_NAME': user_table.table_name,
+                'USER_PROVIDER_INDEX': user_provider_index,
+                # GET /api/stats
+                **stats_environment,
+            })
+            idp_table.grant_read_write_data(idp_function)
+            user_table.grant_read_write_data(idp_function)
+            user_table.grant_read_write_data(user_function)
+            functions = [idp_function, user_function]
+            stats_reader = user_function
 
-        idp_function.add_layers(powertools_layer)
-        user_function.add_layers(powertools_layer)
+        logs_bucket = s3.Bucket(self, 'LogsBucket',
+                                                 bucket_name="toolkit-web-app-logs",
+                                                 block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+                                                 encryption=s3.BucketEncryption.S3_MANAGED,
+                                                 enforce_ssl=True,
+                                                 removal_policy=cdk.RemovalPolicy.RETAIN
+                                                 )
 
-        idp_table = ddb.Table.from_table_name(self, 'idpTable', table_name=idp_table)
-        idp_table.grant_read_write_data(idp_function)
-        user_table = ddb.Table.from_table_name(self, 'userTable', table_name=users_table)
-        user_table.grant_read_write_data(user_function)
+        if nightly_export:
+            # gzip NDJSON snapshots of both tables with a manifest, see functions/export_tables.py
+            export_bucket = s3.Bucket(self, 'ExportBucket',
+                                      block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+                                      encryption=s3.BucketEncryption.S3_MANAGED,
+                                      enforce_ssl=True,
+                                      server_access_logs_bucket=logs_bucket,
+                                      server_access_logs_prefix="exports",
+                                      removal_policy=cdk.RemovalPolicy.RETAIN
+                                      )
+            export_function = python_function('ToolkitWebAppExportLambda', 'export_tables.handler', {
+                'IDP_TABLE_NAME': idp_table.table_name,
+                'USER_TABLE_NAME': user_table.table_name,
+                'EXPORT_BUCKET': export_bucket.bucket_name,
+            }, memory_size=512, timeout=cdk.Duration.minutes(15))
+            idp_table.grant_read_data(export_function)
+            user_table.grant_read_data(export_function)
+            export_bucket.grant_put(export_function)
+            events.Rule(self, 'NightlyExportRule',
+                        schedule=events.Schedule.cron(minute='0', hour='3'),
+                        targets=[events_targets.LambdaFunction(export_function)])
+            functions.append(export_function)
+
+        for function in functions:
+            version_table.grant_read_write_data(function)
+
+        if table_stats:
+            stats_table.grant_read_data(stats_reader)
+            stats_function = python_function('ToolkitWebAppStatsLambda', 'stats_consumer.handler', {
+                'STATS_TABLE_NAME': stats_table.table_name,
+                'USER_TABLE_NAME': user_table.table_name,
+                'IDP_TABLE_NAME': idp_table.table_name,
+            }, memory_size=512, timeout=cdk.Duration.minutes(5))
+            stats_table.grant_read_write_data(stats_function)
+            # invoked with {"rebuild": true} it scans both tables
+            user_table.grant_read_data(stats_function)
+            idp_table.grant_read_data(stats_function)
+            for table in (user_table, idp_table):
+                # a failed record is retried with the rest of the batch after it, applied records are skipped
+                stats_function.add_event_source(lambda_event_sources.DynamoEventSource(
+                    table,
+                    starting_position=lambda_.StartingPosition.TRIM_HORIZON,
+                    batch_size=100,
+                    max_batching_window=cdk.Duration.seconds(5),
+                    report_batch_item_failures=True,
+                    retry_attempts=10))
+            functions.append(stats_function)
 
         ddb_endpoint = vpc.add_gateway_endpoint("DynamoDbGatewayEndpoint",
                                                      service=ec2.GatewayVpcEndpointAwsService.DYNAMODB)
         ddb_endpoint.add_to_policy(iam.PolicyStatement(
             actions=['dynamodb:DeleteItem', 'dynamodb:GetItem', 'dynamodb:UpdateItem', 'dynamodb:PutItem',
-                     'dynamodb:Query', 'dynamodb:Scan'],
-            principals=[iam.ArnPrincipal(idp_function.role.role_arn),
-                        iam.ArnPrincipal(user_function.role.role_arn),
+                     'dynamodb:Query', 'dynamodb:Scan', 'dynamodb:BatchWriteItem', 'dynamodb:BatchGetItem',
+                     # index detection, see functions/table_indexes.py
+                     'dynamodb:DescribeTable'],
+            principals=[*[iam.ArnPrincipal(function.role.role_arn) for function in functions],
                         iam.ServicePrincipal('lambda.amazonaws.com'),
                         iam.AnyPrincipal() # because I'm stuck
                         ],
-            resources=[idp_table.table_arn, user_table.table_arn]  # if multi-region add regional ARNs
+            resources=[idp_table.table_arn, user_table.table_arn, version_table.table_arn,
+                       f"{user_table.table_arn}/index/*",
+                       *([stats_table.table_arn] if table_stats else [])]  # if multi-region add regional ARNs
         ))
 
         # needed to pull ECR images
@@ -177,14 +403,6 @@ class IdpWebAppBackend(Stack):
             resources=['*']  # scope to needed buckets
         ))
 
-        logs_bucket = s3.Bucket(self, 'LogsBucket',
-                                                 bucket_name="toolkit-web-app-logs",
-                                                 block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
-                                                 encryption=s3.BucketEncryption.S3_MANAGED,
-                                                 enforce_ssl=True,
-                                                 removal_policy=cdk.RemovalPolicy.RETAIN
-                                                 )
-
         alb_sg = ec2.SecurityGroup(self, "alb_sg", security_group_name="ToolkitWebAppApiSg",
                                         description="ToolkitWebApp access to ALB, vpc=self.vpc",
                                         vpc=vpc,
@@ -223,16 +441,92 @@ class IdpWebAppBackend(Stack):
                                     #protocol=elbv2.ApplicationProtocol.HTTPS),
                                     protocol=elbv2.ApplicationProtocol.HTTP)
         listener.add_targets("TargetGroup", port=80, targets=[service])
-        listener.add_targets("IdpLambdaTargetGroup", health_check=elbv2.HealthCheck(enabled=False),
-                             priority=10,
-                             target_group_name="IdP-API",
-                             conditions=[elbv2.ListenerCondition.path_patterns(["/api/idp/*"])],
-                             targets=[elbv2_targets.LambdaTarget(idp_function)])
-        listener.add_targets("UserLambdaTargetGroup", health_check=elbv2.HealthCheck(enabled=False),
-                             priority=5,
-                             target_group_name="User-API",
-                             conditions=[elbv2.ListenerCondition.path_patterns(["/api/user/*"])],
-                             targets=[elbv2_targets.LambdaTarget(user_function)])
+        if single_function:
+            listener.add_targets("ApiLambdaTargetGroup", health_check=elbv2.HealthCheck(enabled=False),
+                                 priority=5,
+                                 target_group_name="Toolkit-API",
+                                 conditions=[elbv2.ListenerCondition.path_patterns(["/api/idp/*", "/api/user/*", "/api/stats"])],
+                                 targets=[alb_target(api_function)])
+        else:
+            listener.add_targets("IdpLambdaTargetGroup", health_check=elbv2.HealthCheck(enabled=False),
+                                 priority=10,
+                                 target_group_name="IdP-API",
+                                 conditions=[elbv2.ListenerCondition.path_patterns(["/api/idp/*"])],
+                                 targets=[alb_target(idp_function)])
+            listener.add_targets("UserLambdaTargetGroup", health_check=elbv2.HealthCheck(enabled=False),
+                                 priority=5,
+                                 target_group_name="User-API",
+                                 conditions=[elbv2.ListenerCondition.path_patterns(["/api/user/*", "/api/stats"])],
+                                 targets=[alb_target(user_function)])
+
+        if monitoring:
+            # per route metrics of functions/api_router.py, published with the service and route dimensions.
+            # keep in step with the routes of functions/manage_idps.py and functions/manage_users.py
+            api_routes = ['GET /api/idp/', 'PUT /api/idp/', 'DELETE /api/idp/',
+                          'GET /api/user/', 'PUT /api/user/', 'DELETE /api/user/',
+                          'POST /api/user/import', 'POST /api/user/batch-get', 'GET /api/stats']
+
+            def route_metrics(metric_name: str, statistic: str):
+                return [cloudwatch.Metric(namespace=metrics_namespace, metric_name=metric_name,
+                                          dimensions_map={'service': service_name, 'route': route},
+                                          statistic=statistic, label=route, period=cdk.Duration.minutes(5))
+                        for route in api_routes]
+
+            def route_graph(title: str, metric_name: str, statistic: str, unit: str = None):
+                return cloudwatch.GraphWidget(title=title, left=route_metrics(metric_name, statistic),
+                                              left_y_axis=cloudwatch.YAxisProps(label=unit, show_units=False),
+                                              width=12)
+
+            dashboard = cloudwatch.Dashboard(self, 'ToolkitWebAppApiDashboard',
+                                             dashboard_name='ToolkitWebAppApi',
+                                             default_interval=cdk.Duration.hours(3))
+            dashboard.add_widgets(route_graph('Handler duration p99', 'HandlerDuration', 'p99', 'ms'),
+                                  route_graph('Handler duration p50', 'HandlerDuration', 'p50', 'ms'))
+            dashboard.add_widgets(route_graph('Server error rate', 'ServerErrors', 'Average'),
+                                  route_graph('Client error rate', 'ClientErrors', 'Average'))
+            dashboard.add_widgets(route_graph('JWT verify duration p99', 'JwtVerifyDuration', 'p99', 'ms'),
+                                  cloudwatch.GraphWidget(title='JWKS cache', width=12, left=[
+                                      cloudwatch.MathExpression(
+                                          expression=f"SUM(SEARCH('{{{metrics_namespace},route,service}} "
+                                                     f"MetricName=\"{metric_name}\"', 'Sum', 300))",
+                                          label=metric_name, period=cdk.Duration.minutes(5), using_metrics={})
+                                      for metric_name in ('JwksCacheHit', 'JwksCacheMiss', 'JwksFetch')]))
+            dashboard.add_widgets(route_graph('DynamoDB read capacity units', 'ConsumedReadCapacity', 'Sum'),
+                                  route_graph('DynamoDB write capacity units', 'ConsumedWriteCapacity', 'Sum'))
+            dashboard.add_widgets(route_graph('Items returned p99', 'ItemCount', 'p99'),
+                                  route_graph('DynamoDB calls per request p99', 'DynamoDBCalls', 'p99'))
+
+            alarm_action = (cloudwatch_actions.SnsAction(sns.Topic.from_topic_arn(self, 'AlarmTopic', alarm_topic_arn))
+                            if alarm_topic_arn else None)
+            route_ids = {route: ''.join(part.title() for part in route.replace(' ', '/').replace('-', '/').split('/') if part)
+                         for route in api_routes}
+            for route in api_routes:
+                dimensions = {'service': service_name, 'route': route}
+                alarms = [
+                    cloudwatch.Alarm(self, f"{route_ids[route]}LatencyAlarm",
+                                     alarm_description=f"{route} p99 above {latency_alarm_ms} ms",
+                                     metric=cloudwatch.Metric(namespace=metrics_namespace,
+                                                              metric_name='HandlerDuration',
+                                                              dimensions_map=dimensions, statistic='p99',
+                                                              period=cdk.Duration.minutes(5)),
+                                     threshold=latency_alarm_ms,
+                                     evaluation_periods=3,
+                                     comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
+                                     treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING),
+                    cloudwatch.Alarm(self, f"{route_ids[route]}ErrorRateAlarm",
+                                     alarm_description=f"{route} server errors above {error_rate_alarm:.0%} of requests",
+                                     metric=cloudwatch.Metric(namespace=metrics_namespace,
+                                                              metric_name='ServerErrors',
+                                                              dimensions_map=dimensions, statistic='Average',
+                                                              period=cdk.Duration.minutes(5)),
+                                     threshold=error_rate_alarm,
+                                     evaluation_periods=2,
+                                     comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
+                                     treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING),
+                ]
+                if alarm_action:
+                    for alarm in alarms:
+                        alarm.add_alarm_action(alarm_action)
 
         # todo --> add cognito stack with verified permissions to web app, admin and user management groups.
         # https://docs.aws.amazon.com/cdk/api/v2/python/aws_cdk.aws_verifiedpermissions/README.html
@@ -248,41 +542,24 @@ class IdpWebAppBackend(Stack):
                                                   ],
                                                   apply_to_children=True)
 
-        NagSuppressions.add_resource_suppressions(idp_function.role,
-                                                  [
-                                                      {
-                                                          "id": "AwsSolutions-IAM5",
-                                                          "reason": "Allow all VPC and basic managed policies",
-                                                          "appliesTo": [f"Policy::arn:{self.region}:iam::aws:policy/AWSLambdaBasicExecutionRole",
-                                                                        f"Policy::arn:{self.region}:iam::aws:policy/AWSLambdaVPCAccessExecutionRole",
-                                                                        "Resource::*"]
-                                                      },
-                                                      {
-                                                          "id": "AwsSolutions-IAM4",
-                                                          "reason": "Allow all VPC and basic managed policies",
-                                                          "appliesTo": [f"Policy::arn:{self.region}:iam::aws:policy/AWSLambdaBasicExecutionRole",
-                                                                        f"Policy::arn:{self.region}:iam::aws:policy/AWSLambdaVPCAccessExecutionRole",]
-                                                      },
-                                                  ],
-                                                  apply_to_children=True)
-
-        NagSuppressions.add_resource_suppressions(user_function.role,
-                                                  [
-                                                      {
-                                                          "id": "AwsSolutions-IAM5",
-                                                          "reason": "Allow all VPC and basic managed policies",
-                                                          "appliesTo": [f"Policy::arn:{self.region}:iam::aws:policy/AWSLambdaBasicExecutionRole",
-                                                                        f"Policy::arn:{self.region}:iam::aws:policy/AWSLambdaVPCAccessExecutionRole",
-                                                                        "Resource::*"]
-                                                      },
-                                                      {
-                                                          "id": "AwsSolutions-IAM4",
-                                                          "reason": "Allow all VPC and basic managed policies",
-                                                          "appliesTo": [f"Policy::arn:{self.region}:iam::aws:policy/AWSLambdaBasicExecutionRole",
-                                                                        f"Policy::arn:{self.region}:iam::aws:policy/AWSLambdaVPCAccessExecutionRole",]
-                                                      },
-                                                  ],
-                                                  apply_to_children=True)
+        for function in functions:
+            NagSuppressions.add_resource_suppressions(function.role,
+                                                      [
+                                                          {
+                                                              "id": "AwsSolutions-IAM5",
+                                                              "reason": "Allow all VPC and basic managed policies",
+                                                              "appliesTo": [f"Policy::arn:{self.region}:iam::aws:policy/AWSLambdaBasicExecutionRole",
+                                                                            f"Policy::arn:{self.region}:iam::aws:policy/AWSLambdaVPCAccessExecutionRole",
+                                                                            "Resource::*"]
+                                                          },
+                                                          {
+                                                              "id": "AwsSolutions-IAM4",
+                                                              "reason": "Allow all VPC and basic managed policies",
+                                                              "appliesTo": [f"Policy::arn:{self.region}:iam::aws:policy/AWSLambdaBasicExecutionRole",
+                                                                            f"Policy::arn:{self.region}:iam::aws:policy/AWSLambdaVPCAccessExecutionRole",]
+                                                          },
+                                                      ],
+                                                      apply_to_children=True)
 
         NagSuppressions.add_resource_suppressions(logs_bucket,
                                                   [
@@ -301,6 +578,10 @@ class IdpWebAppBackend(Stack):
                                                           "id": "AwsSolutions-IAM4",
                                                           "reason": "AWSLambdaBasicExecutionRole and AWSLambdaVPCAccessExecutionRole are sufficient",
                                                       },
+                                                      {
+                                                          "id": "AwsSolutions-L1",
+                                                          "reason": "Runtime of the CDK managed custom resource provider is set by CDK"
+                                                      },
                                                   ])
 
         NagSuppressions.add_resource_suppressions(alb_sg,
@@ -0,0 +1,217 @@
+import base64
+import gzip
+import json
+import os
+import sys
+import time
+import uuid
+from unittest import mock
+
+import boto3
+import pytest
+from moto import mock_aws
+
+functions_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'functions')
+if functions_dir not in sys.path:
+    sys.path.insert(0, functions_dir)
+
+USERS_TABLE = 'transferidp_users'
+IDP_TABLE = 'transferidp_identity_providers'
+VERSION_TABLE = 'toolkit_table_versions'
+PROVIDER_INDEX = 'identity_provider_key-index'
+MODULE_INDEX = 'identity_provider_module-index'
+CLIENT_ID = 'unit-test-client'
+PROVIDER = 'partner-a'
+ROLE = 'arn:aws:iam::123456789012:role/transfer-user'
+
+# environment of the deployed API functions, the handler modules read it when they are imported
+handler_environment = {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+    'IDP_TABLE_NAME': IDP_TABLE,
+    'USER_TABLE_NAME': USERS_TABLE,
+    'USER_PROVIDER_INDEX': PROVIDER_INDEX,
+    'VERSION_TABLE_NAME': VERSION_TABLE,
+    'COGNITO_USER_POOL_CLIENT_ID': CLIENT_ID,
+    'POWERTOOLS_SERVICE_NAME': 'ToolkitIdpAdmin',
+    'POWERTOOLS_METRICS_NAMESPACE': 'TransferFamilyToolkit',
+    'POWERTOOLS_TRACE_DISABLED': 'true',
+    'LOG_LEVEL': 'WARNING',
+}
+
+
+def b64encode(data: bytes):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+class Signer:
+    """
+    RSA key pair signing Cognito shaped access tokens, published as a one key JWKS
+    """
+
+    def __init__(self, kid: str = 'unit-key-1'):
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        self.kid = kid
+        self._private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        numbers = self._private_key.public_key().public_numbers()
+        self.jwk = {'kty': 'RSA', 'alg': 'RS256', 'use': 'sig', 'kid': kid,
+                    'n': b64encode(numbers.n.to_bytes((numbers.n.bit_length() + 7) // 8, 'big')),
+                    'e': b64encode(numbers.e.to_bytes(3, 'big'))}
+
+    def keys(self):
+        """
+        Same shape as the 'keys' list of the user pool jwks.json
+        """
+        return [self.jwk]
+
+    def claims(self, groups=('IdpAdmins', 'UserAdmins'), ttl: int = 3600, **claims):
+        now = int(time.time())
+        return {'sub': str(uuid.uuid4()), 'cognito:groups': list(groups), 'token_use': 'access',
+                'auth_time': now, 'iat': now, 'exp': now + ttl, 'jti': str(uuid.uuid4()),
+                'client_id': CLIENT_ID, 'username': 'unit-admin', **claims}
+
+    def sign(self, header: dict, claims: dict):
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding
+        signing_input = f"{b64encode(json.dumps(header).encode())}.{b64encode(json.dumps(claims).encode())}"
+        signature = self._private_key.sign(signing_input.encode('ascii'), padding.PKCS1v15(), hashes.SHA256())
+        return f"{signing_input}.{b64encode(signature)}"
+
+    def token(self, groups=('IdpAdmins', 'UserAdmins'), ttl: int = 3600, kid: str = None, **claims):
+        return self.sign({'alg': 'RS256', 'typ': 'JWT', 'kid': kid or self.kid}, self.claims(groups, ttl, **claims))
+
+
+@pytest.fixture(scope='session')
+def signer():
+    return Signer()
+
+
+class Api:
+    """
+    The IdP and user handlers called with ALB events, against the tables of create_tables
+    """
+
+    def __init__(self, token: str):
+        import manage_idps
+        import manage_users
+        self.token = token
+        self.handlers = {'idps': manage_idps.handler, 'users': manage_users.handler}
+
+    def event(self, method: str, path: str, body: str = None, query: dict = None, headers: dict = None):
+        request_headers = {'accept-encoding': 'gzip, deflate, br', 'origin': 'http://localhost:5173',
+                           'authorization': f"Bearer {self.token}"}
+        if body is not None:
+            request_headers['content-length'] = str(len(body))
+        request_headers.update(headers or {})
+        return {
+            'requestContext': {'elb': {'targetGroupArn': 'arn:aws:elasticloadbalancing:us-east-1:123456789012:'
+                                                          'targetgroup/Toolkit-API/3147f9537e1d9773'}},
+            'httpMethod': method,
+            'path': path,
+            'queryStringParameters': query or {},
+            'headers': request_headers,
+            'body': body or '',
+            'isBase64Encoded': False,
+        }
+
+    def call(self, handler: str, method: str, path: str, body: str = None, query: dict = None, headers: dict = None,
+             context=None):
+        return self.handlers[handler](self.event(method, path, body, query, headers), context or Context())
+
+    @staticmethod
+    def json_body(response):
+        body = response['body']
+        if response['isBase64Encoded']:
+            body = base64.b64decode(body)
+            if response['headers'].get('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+        return json.loads(body)
+
+    @staticmethod
+    def create_tables(provider_index: str = PROVIDER_INDEX, module_index: str = MODULE_INDEX):
+        """
+        Empty users, IdP and version tables, the users table with the given KEYS_ONLY indexes
+        """
+        import manage_idps
+        import table_indexes
+        resource = boto3.resource('dynamodb')
+        attributes = {'user', 'identity_provider_key'}
+        indexes = []
+        for index_name, partition_key in ((provider_index, 'identity_provider_key'),
+                                          (module_index, 'identity_provider_module')):
+            if index_name:
+                attributes.add(partition_key)
+                indexes.append({'IndexName': index_name,
+                                'KeySchema': [{'AttributeName': partition_key, 'KeyType': 'HASH'},
+                                              {'AttributeName': 'user', 'KeyType': 'RANGE'}],
+                                'Projection': {'ProjectionType': 'KEYS_ONLY'}})
+        for name in (USERS_TABLE, IDP_TABLE, VERSION_TABLE):
+            if name in resource.meta.client.list_tables()['TableNames']:
+                resource.Table(name).delete()
+        users = resource.create_table(TableName=USERS_TABLE,
+                                      KeySchema=[{'AttributeName': 'user', 'KeyType': 'HASH'},
+                                                 {'AttributeName': 'identity_provider_key', 'KeyType': 'RANGE'}],
+                                      AttributeDefinitions=[{'AttributeName': name, 'AttributeType': 'S'}
+                                                            for name in sorted(attributes)],
+                                      BillingMode='PAY_PER_REQUEST',
+                                      **({'GlobalSecondaryIndexes': indexes} if indexes else {}))
+        idps = resource.create_table(TableName=IDP_TABLE,
+                                     KeySchema=[{'AttributeName': 'provider', 'KeyType': 'HASH'}],
+                                     AttributeDefinitions=[{'AttributeName': 'provider', 'AttributeType': 'S'}],
+                                     BillingMode='PAY_PER_REQUEST')
+        resource.create_table(TableName=VERSION_TABLE,
+                              KeySchema=[{'AttributeName': 'table_name', 'KeyType': 'HASH'}],
+                              AttributeDefinitions=[{'AttributeName': 'table_name', 'AttributeType': 'S'}],
+                              BillingMode='PAY_PER_REQUEST')
+        table_indexes.clear()
+        manage_idps.idp_cache.invalidate()
+        return users, idps
+
+
+class Context:
+    function_name = 'ToolkitWebAppUnit'
+    memory_limit_in_mb = 128
+    invoked_function_arn = 'arn:aws:lambda:us-east-1:123456789012:function:ToolkitWebAppUnit'
+    aws_request_id = 'unit'
+
+    def __init__(self, remaining_ms: int = 3000):
+        self._deadline = time.monotonic() + remaining_ms / 1000
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+
+@pytest.fixture(scope='module')
+def api(signer):
+    """
+    Handlers of the test module against moto, verifying tokens of signer
+    """
+    with mock.patch.dict(os.environ, handler_environment), mock_aws():
+        import ddb_helper
+        import jwt_token_helper
+        ddb_helper.resource.cache_clear()
+        jwt_token_helper.jwks_cache.clear()
+        jwt_token_helper.token_cache.clear()
+        with mock.patch.object(jwt_token_helper.jwks_cache, '_fetch', signer.keys):
+            yield Api(signer.token())
+        ddb_helper.resource.cache_clear()
+        jwt_token_helper.jwks_cache.clear()
+
+
+@pytest.fixture
+def tables(api):
+    return api.create_tables()
+
+
+def user_item(name: str, provider: str = PROVIDER, module: str = 'ldap', **config):
+    return {'user': name, 'identity_provider_key': provider, 'identity_provider_module': module,
+            'config': {'Role': ROLE, 'HomeDirectoryType': 'PATH', **config}}
+
+
+@pytest.fixture
+def user():
+    """
+    Builds minimal valid user items
+    """
+    return user_item
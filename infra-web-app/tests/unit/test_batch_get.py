@@ -0,0 +1,59 @@
+import json
+
+from .conftest import PROVIDER, USERS_TABLE
+
+
+def keys(*names):
+    return [{'user': name, 'identity_provider_key': PROVIDER} for name in names]
+
+
+def test_batch_get(api, tables, user):
+    users, _ = tables
+    for name in ('alice', 'bob'):
+        users.put_item(Item=user(name))
+    response = api.call('users', 'POST', '/api/user/batch-get',
+                        body=json.dumps({'keys': keys('alice', 'bob', 'alice'), 'fields': ['config.Role']}))
+    assert response['statusCode'] == 200
+    result = api.json_body(response)
+    assert sorted(result['items'], key=lambda item: item['user']) == [
+        {'user': name, 'identity_provider_key': PROVIDER, 'config': {'Role': user(name)['config']['Role']}}
+        for name in ('alice', 'bob')]
+    assert result['missing'] == result['unprocessed'] == []
+
+
+def test_missing_and_unprocessed_keys_are_reported(api, tables, user, monkeypatch):
+    users, _ = tables
+    users.put_item(Item=user('found'))
+    users.put_item(Item=user('throttled'))
+    import ddb_helper
+    import manage_users
+    client = manage_users.ddb_client.meta.client
+    batch_get_item = client.batch_get_item
+
+    def throttling(RequestItems, **kwargs):
+        # DynamoDB hands back the keys it had no capacity for, every time for this one
+        request = RequestItems[USERS_TABLE]
+        throttled = [key for key in request['Keys'] if key['user'] == 'throttled']
+        served = [key for key in request['Keys'] if key['user'] != 'throttled']
+        response = {'Responses': {}}
+        if served:
+            response = batch_get_item(RequestItems={USERS_TABLE: {**request, 'Keys': served}}, **kwargs)
+        response['UnprocessedKeys'] = {USERS_TABLE: {'Keys': throttled}} if throttled else {}
+        return response
+
+    monkeypatch.setattr(client, 'batch_get_item', throttling)
+    monkeypatch.setattr(ddb_helper.random, 'uniform', lambda low, high: 0)
+    response = api.call('users', 'POST', '/api/user/batch-get',
+                        body=json.dumps({'keys': keys('found', 'throttled', 'gone')}))
+    assert response['statusCode'] == 200
+    result = api.json_body(response)
+    assert [item['user'] for item in result['items']] == ['found']
+    assert result['missing'] == keys('gone')
+    assert result['unprocessed'] == keys('throttled')
+
+
+def test_bad_request(api, tables):
+    for body in ('', '{"keys": []}', json.dumps({'keys': [{'user': 'alice'}]}),
+                 json.dumps({'keys': keys('alice'), 'fields': ['password']})):
+        response = api.call('users', 'POST', '/api/user/batch-get', body=body)
+        assert response['statusCode'] == 400, body
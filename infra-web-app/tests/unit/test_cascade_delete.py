@@ -0,0 +1,50 @@
+import base64
+import json
+
+import pytest
+
+from .conftest import PROVIDER
+
+
+def cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode('utf-8')).decode('ascii')
+
+
+def test_cascade_delete_reports_progress(api, monkeypatch, user):
+    # without a provider index the users are found with a parallel scan, resumed from the cursor
+    users, idps = api.create_tables(provider_index=None, module_index=None)
+    idps.put_item(Item={'provider': PROVIDER, 'module': 'ldap'})
+    with users.batch_writer() as batch:
+        for number in range(40):
+            batch.put_item(Item=user(f"user{number:02}", provider=PROVIDER if number % 4 else 'partner-b'))
+    import idp_cascade
+    import parallel_scan
+    # every call stops after its first page, one page per segment
+    monkeypatch.setattr(idp_cascade, 'time_budget', 1e-6)
+    monkeypatch.setattr(parallel_scan, 'default_segments', 4)
+    results = []
+    query = {'cascade': 'true'}
+    for _ in range(10):
+        response = api.call('idps', 'DELETE', f"/api/idp/{PROVIDER}", query=query)
+        assert response['statusCode'] == 200
+        results.append(api.json_body(response))
+        if not results[-1]['cursor']:
+            break
+        query['cursor'] = results[-1]['cursor']
+    assert [result['status'] for result in results][-1] == 'complete'
+    assert {result['status'] for result in results[:-1]} == {'in_progress'}
+    assert len(results) > 1
+    assert sum(result['deleted'] for result in results) == 30
+    assert 'Item' not in idps.get_item(Key={'provider': PROVIDER})
+    assert {item['identity_provider_key'] for item in users.scan()['Items']} == {'partner-b'}
+
+
+@pytest.mark.parametrize('value', [
+    cursor({'query': 'user0'}),
+    cursor({'scan': {'segments': 100000, 'keys': {}}}),
+    cursor({'scan': {'segments': 2, 'keys': {'7': None}}}),
+])
+def test_tampered_cascade_cursor_is_rejected(api, tables, value):
+    response = api.call('idps', 'DELETE', f"/api/idp/{PROVIDER}", query={'cascade': 'true', 'cursor': value})
+    assert response['statusCode'] == 400
+    assert api.json_body(response) == {'message': 'invalid cursor'}
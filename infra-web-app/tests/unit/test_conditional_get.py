@@ -0,0 +1,50 @@
+import pytest
+
+from .conftest import PROVIDER
+
+
+@pytest.mark.parametrize('path, query', [
+    # tagged with the version marker of the users table
+    ('/api/user/', {'provider': PROVIDER}),
+    # tagged with a hash of the body, large enough to be compressed
+    ('/api/user/alice', {'provider': PROVIDER}),
+])
+def test_not_modified_per_encoding(api, tables, path, query, user):
+    users, _ = tables
+    users.put_item(Item=user('alice', PublicKeys=[f"ssh-ed25519 {'A' * 68} key{number}" for number in range(20)]))
+    etags = {}
+    for encoding in ('gzip', 'identity'):
+        response = api.call('users', 'GET', path, query=query, headers={'accept-encoding': encoding})
+        assert response['statusCode'] == 200
+        etags[encoding] = response['headers']['ETag']
+        revalidated = api.call('users', 'GET', path, query=query,
+                               headers={'accept-encoding': encoding, 'if-none-match': etags[encoding]})
+        assert revalidated['statusCode'] == 304
+        assert revalidated['headers']['ETag'] == etags[encoding]
+        assert 'body' not in revalidated
+    assert etags['gzip'] != etags['identity']
+    # a copy cached in one encoding doesn't validate the other
+    response = api.call('users', 'GET', path, query=query,
+                        headers={'accept-encoding': 'identity', 'if-none-match': etags['gzip']})
+    assert response['statusCode'] == 200
+    assert api.json_body(response)
+
+
+def test_idp_list_revalidates_from_the_cached_marker(api, tables, monkeypatch):
+    _, idps = tables
+    idps.put_item(Item={'provider': PROVIDER, 'module': 'ldap'})
+    import table_versions
+    current = table_versions.current
+    reads = []
+    monkeypatch.setattr(table_versions, 'current', lambda table_name: reads.append(table_name) or current(table_name))
+    response = api.call('idps', 'GET', '/api/idp/')
+    assert response['statusCode'] == 200
+    etag = response['headers']['ETag']
+    for _ in range(3):
+        revalidated = api.call('idps', 'GET', '/api/idp/', headers={'if-none-match': etag})
+        assert revalidated['statusCode'] == 304
+    # read once, the revalidations within IDP_CACHE_VERSION_CHECK_SECONDS use the marker the cache checked
+    assert len(reads) == 1
+    # a write through this container shows up right away
+    assert api.call('idps', 'PUT', '/api/idp/', body='{"provider": "partner-b", "module": "argon2"}')['statusCode'] == 200
+    assert api.call('idps', 'GET', '/api/idp/', headers={'if-none-match': etag})['statusCode'] == 200
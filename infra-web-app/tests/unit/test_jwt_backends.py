@@ -0,0 +1,58 @@
+import pytest
+
+import jwt_backends
+import jwt_token_helper
+from jwt_token_helper import JwksCache, JwtTokenException
+
+from .conftest import CLIENT_ID, b64encode
+
+
+@pytest.fixture(params=sorted(jwt_backends.backends))
+def key_cache(request, signer, monkeypatch):
+    monkeypatch.setenv('COGNITO_USER_POOL_CLIENT_ID', CLIENT_ID)
+    return JwksCache(fetch=signer.keys, min_refresh_interval=0, backend=jwt_backends.backend(request.param))
+
+
+def test_good_token(signer, key_cache):
+    kid, claims = jwt_token_helper.verify_token(signer.token(), key_cache)
+    assert kid == signer.kid
+    assert claims['client_id'] == CLIENT_ID
+
+
+def test_bad_signature(signer, key_cache):
+    header, claims, signature = signer.token().split('.')
+    other_claims = signer.token(username='someone-else').split('.')[1]
+    for token in (f"{header}.{other_claims}.{signature}", f"{header}.{claims}.{b64encode(b'0' * 256)}",
+                  f"{header}.{claims}."):
+        with pytest.raises(JwtTokenException) as raised:
+            jwt_token_helper.verify_token(token, key_cache)
+        assert raised.value.args[0]['code'] == '02'
+
+
+def test_backends_agree_on_the_signature(signer):
+    signing_input, signature = signer.token().rsplit('.', 1)
+    for name in jwt_backends.backends:
+        backend = jwt_backends.backend(name)
+        public_key = backend.public_key(signer.jwk)
+        assert backend.verify(public_key, signing_input.encode('ascii'), jwt_backends.b64decode(signature))
+        assert not backend.verify(public_key, signing_input.encode('ascii') + b'x', jwt_backends.b64decode(signature))
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('jose', jwt_backends.JoseBackend),
+    ('cryptography', jwt_backends.CryptographyBackend),
+    (None, jwt_backends.CryptographyBackend),
+])
+def test_backend_from_environment(monkeypatch, value, expected):
+    if value is None:
+        monkeypatch.delenv('JWT_BACKEND', raising=False)
+    else:
+        monkeypatch.setenv('JWT_BACKEND', value)
+    assert type(jwt_backends.backend()) is expected
+    assert type(JwksCache(fetch=list).backend) is expected
+
+
+def test_unknown_backend_is_an_error(monkeypatch):
+    monkeypatch.setenv('JWT_BACKEND', 'pyjwt')
+    with pytest.raises(ValueError, match='JWT_BACKEND must be one of jose, cryptography'):
+        jwt_backends.backend()
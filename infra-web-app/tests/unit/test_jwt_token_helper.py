@@ -0,0 +1,155 @@
+import hashlib
+import hmac
+
+import pytest
+
+import jwt_token_helper
+from jwt_token_helper import JwksCache, JwtTokenException
+
+from .conftest import CLIENT_ID, Signer, b64encode
+
+
+@pytest.fixture(autouse=True)
+def client_id(monkeypatch):
+    monkeypatch.setenv('COGNITO_USER_POOL_CLIENT_ID', CLIENT_ID)
+
+
+@pytest.fixture
+def key_cache(signer):
+    return JwksCache(fetch=signer.keys, min_refresh_interval=0)
+
+
+def error_code(jwt_token, key_cache):
+    with pytest.raises(JwtTokenException) as raised:
+        jwt_token_helper.verify_token(jwt_token, key_cache)
+    return raised.value.args[0]['code']
+
+
+def test_valid_token(signer, key_cache):
+    kid, claims = jwt_token_helper.verify_token(signer.token(groups=('UserAdmins',)), key_cache)
+    assert kid == signer.kid
+    assert claims['cognito:groups'] == ['UserAdmins']
+
+
+def test_alg_none_is_rejected(signer, key_cache):
+    header = {'alg': 'none', 'typ': 'JWT', 'kid': signer.kid}
+    unsigned = signer.sign(header, signer.claims()).rsplit('.', 1)[0] + '.'
+    assert error_code(unsigned, key_cache) == '06'
+
+
+def test_hs256_with_the_public_key_is_rejected(signer, key_cache):
+    # the classic confusion attack, the published key used as an HMAC secret
+    token = signer.sign({'alg': 'HS256', 'typ': 'JWT', 'kid': signer.kid}, signer.claims())
+    signing_input = token.rsplit('.', 1)[0]
+    signature = hmac.new(signer.jwk['n'].encode('ascii'), signing_input.encode('ascii'), hashlib.sha256).digest()
+    assert error_code(f"{signing_input}.{b64encode(signature)}", key_cache) == '06'
+
+
+def test_expired_token_is_rejected(signer, key_cache):
+    assert error_code(signer.token(ttl=-60), key_cache) == '03'
+
+
+@pytest.mark.parametrize('exp', [None, 'tomorrow', '99999999999', True, [1]])
+def test_exp_that_is_not_a_number_is_rejected(signer, key_cache, exp):
+    claims = signer.claims(exp=exp)
+    if exp is None:
+        del claims['exp']
+    assert error_code(signer.sign({'alg': 'RS256', 'typ': 'JWT', 'kid': signer.kid}, claims), key_cache) == '03'
+
+
+def test_wrong_client_id_is_rejected(signer, key_cache):
+    assert error_code(signer.token(client_id='another-client'), key_cache) == '04'
+
+
+def test_id_token_is_rejected(signer, key_cache):
+    # id tokens name the app client in aud and have no client_id
+    claims = signer.claims(token_use='id', aud=CLIENT_ID)
+    del claims['client_id']
+    assert error_code(signer.sign({'alg': 'RS256', 'typ': 'JWT', 'kid': signer.kid}, claims), key_cache) == '04'
+    assert error_code(signer.token(token_use='id'), key_cache) == '07'
+
+
+def test_bad_signature_is_rejected(signer, key_cache):
+    header, claims, signature = signer.token().split('.')
+    forged = signer.token(groups=('IdpAdmins', 'UserAdmins', 'Admins')).split('.')[1]
+    assert error_code(f"{header}.{forged}.{signature}", key_cache) == '02'
+    assert error_code(f"{header}.{claims}.{b64encode(b'0' * 256)}", key_cache) == '02'
+
+
+@pytest.mark.parametrize('token', ['', 'abc', 'a.b', 'a.b.c.d', '!!.!!.!!', f"{b64encode(b'{}')}.e30.e30",
+                                   f"{b64encode(b'[]')}.e30.e30", None])
+def test_malformed_token_is_rejected(key_cache, token):
+    assert error_code(token, key_cache) == '05'
+
+
+def test_claims_that_are_not_an_object_are_malformed(signer, key_cache):
+    assert error_code(signer.sign({'alg': 'RS256', 'typ': 'JWT', 'kid': signer.kid}, [1, 2]), key_cache) == '05'
+
+
+def test_unknown_kid_is_rejected(signer, key_cache):
+    assert error_code(signer.token(kid='not-published'), key_cache) == '01'
+
+
+def test_rotated_key_is_fetched_once_seen():
+    old, new = Signer('old-key'), Signer('new-key')
+    published = [old.jwk]
+    key_cache = JwksCache(fetch=lambda: list(published), min_refresh_interval=0)
+    assert jwt_token_helper.verify_token(old.token(), key_cache)[0] == 'old-key'
+    # the pool publishes the new key alongside the old one, then drops the old one
+    published.append(new.jwk)
+    assert jwt_token_helper.verify_token(new.token(), key_cache)[0] == 'new-key'
+    assert key_cache.stats()['refreshes'] == 2
+    published.remove(old.jwk)
+    key_cache.clear()
+    assert error_code(old.token(), key_cache) == '01'
+    assert jwt_token_helper.verify_token(new.token(), key_cache)[0] == 'new-key'
+
+
+def test_token_cache_serves_verified_tokens(signer, key_cache):
+    cache = jwt_token_helper.TokenCache(key_cache, max_size=4, enabled=True)
+    token = signer.token()
+    assert jwt_token_helper.validate_token_cached(token, cache) == (['IdpAdmins', 'UserAdmins'], False)
+    assert jwt_token_helper.validate_token_cached(token, cache) == (['IdpAdmins', 'UserAdmins'], True)
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'size': 1}
+
+
+def test_token_cache_drops_expired_tokens(signer, key_cache, monkeypatch):
+    cache = jwt_token_helper.TokenCache(key_cache, max_size=4, enabled=True)
+    token = signer.token(ttl=60)
+    jwt_token_helper.validate_token_cached(token, cache)
+    now = jwt_token_helper.time.time()
+    monkeypatch.setattr(jwt_token_helper.time, 'time', lambda: now + 120)
+    assert cache.get(token) is None
+    assert cache.stats()['size'] == 0
+    with pytest.raises(JwtTokenException):
+        jwt_token_helper.validate_token_cached(token, cache)
+
+
+def test_token_cache_evicts_least_recently_used(signer, key_cache):
+    cache = jwt_token_helper.TokenCache(key_cache, max_size=2, enabled=True)
+    first, second, third = (signer.token() for _ in range(3))
+    for token in (first, second):
+        jwt_token_helper.validate_token_cached(token, cache)
+    # reading the first makes the second the least recently used
+    assert cache.get(first) is not None
+    jwt_token_helper.validate_token_cached(third, cache)
+    assert cache.stats()['size'] == 2
+    assert cache.get(second) is None
+    assert cache.get(first) is not None
+    assert cache.get(third) is not None
+
+
+def test_token_cache_drops_tokens_of_a_rotated_key():
+    old, new = Signer('old-key'), Signer('new-key')
+    published = [old.jwk]
+    key_cache = JwksCache(fetch=lambda: list(published), min_refresh_interval=0)
+    cache = jwt_token_helper.TokenCache(key_cache, max_size=4, enabled=True)
+    token = old.token()
+    jwt_token_helper.validate_token_cached(token, cache)
+    assert cache.get(token) is not None
+    published[:] = [new.jwk]
+    jwt_token_helper.validate_token_cached(new.token(), cache)
+    # the refresh for the new kid removed the old one, its tokens are verified again and fail
+    assert cache.get(token) is None
+    with pytest.raises(JwtTokenException):
+        jwt_token_helper.validate_token_cached(token, cache)
@@ -0,0 +1,166 @@
+import os
+
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+import pytest
+
+from stacks.idp_web_app_backend import IdpWebAppBackend
+
+# the stack resolves its assets relative to infra-web-app and needs the jwt layer built, see README
+project_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+pytestmark = pytest.mark.skipif(
+    not os.path.exists(os.path.join(project_dir, 'lambda_layers', 'python_jwt_layer', 'python_jwt.zip')),
+    reason='python_jwt layer not built')
+
+USERS_TABLE = 'transferidp_users'
+IDP_TABLE = 'transferidp_identity_providers'
+PROVIDER_INDEX = 'identity_provider_key-index'
+MODULE_INDEX = 'identity_provider_module-index'
+
+
+def template(monkeypatch, **kwargs):
+    monkeypatch.chdir(project_dir)
+    app = core.App()
+    # Vpc.from_lookup needs an account and region, without context it synthesizes a dummy VPC
+    stack = IdpWebAppBackend(app, "managed-tables",
+                             env=core.Environment(account='123456789012', region='us-east-1'),
+                             user_pool_client_id='client', jwks_proxy_endpoint='https://jwks', vpc_name='vpc',
+                             users_table=USERS_TABLE, idp_table=IDP_TABLE, **kwargs)
+    return assertions.Template.from_stack(stack)
+
+
+def index(name: str, partition_key: str):
+    return assertions.Match.object_like({
+        'IndexName': name,
+        'KeySchema': [{'AttributeName': partition_key, 'KeyType': 'HASH'},
+                      {'AttributeName': 'user', 'KeyType': 'RANGE'}],
+        'Projection': {'ProjectionType': 'KEYS_ONLY'},
+    })
+
+
+def test_existing_tables_are_not_created(monkeypatch):
+    stack = template(monkeypatch)
+    # only the version marker table, the existing users table is left as it is
+    stack.resource_count_is("AWS::DynamoDB::Table", 1)
+    stack.resource_count_is("Custom::TableIndex", 0)
+
+
+def test_provider_index_added_to_existing_table(monkeypatch):
+    stack = template(monkeypatch, add_provider_index=True, table_read_capacity=10, table_write_capacity=2)
+    stack.resource_count_is("AWS::DynamoDB::Table", 1)
+    stack.has_resource_properties("Custom::TableIndex", {
+        "TableName": USERS_TABLE,
+        "IndexName": PROVIDER_INDEX,
+        "PartitionKey": 'identity_provider_key',
+        "ReadCapacity": 10,
+        "WriteCapacity": 2,
+    })
+
+
+def test_managed_tables(monkeypatch):
+    stack = template(monkeypatch, manage_tables=True)
+    stack.resource_count_is("AWS::DynamoDB::Table", 3)
+    stack.resource_count_is("Custom::TableIndex", 0)
+    stack.resource_count_is("AWS::ApplicationAutoScaling::ScalableTarget", 0)
+    stack.has_resource("AWS::DynamoDB::Table", {
+        "Properties": {
+            "TableName": USERS_TABLE,
+            "KeySchema": [{'AttributeName': 'user', 'KeyType': 'HASH'},
+                          {'AttributeName': 'identity_provider_key', 'KeyType': 'RANGE'}],
+            "BillingMode": "PAY_PER_REQUEST",
+            "PointInTimeRecoverySpecification": {"PointInTimeRecoveryEnabled": True},
+            "GlobalSecondaryIndexes": [index(PROVIDER_INDEX, 'identity_provider_key')],
+            "StreamSpecification": assertions.Match.absent(),
+        },
+        "DeletionPolicy": "Retain",
+        "UpdateReplacePolicy": "Retain",
+    })
+    stack.has_resource("AWS::DynamoDB::Table", {
+        "Properties": {
+            "TableName": IDP_TABLE,
+            "KeySchema": [{'AttributeName': 'provider', 'KeyType': 'HASH'}],
+            "BillingMode": "PAY_PER_REQUEST",
+            "PointInTimeRecoverySpecification": {"PointInTimeRecoveryEnabled": True},
+        },
+        "DeletionPolicy": "Retain",
+    })
+
+
+def test_module_index(monkeypatch):
+    stack = template(monkeypatch, manage_tables=True, user_module_index=MODULE_INDEX)
+    stack.has_resource_properties("AWS::DynamoDB::Table", {
+        "TableName": USERS_TABLE,
+        "AttributeDefinitions": assertions.Match.array_with([
+            {'AttributeName': 'identity_provider_module', 'AttributeType': 'S'}]),
+        "GlobalSecondaryIndexes": [index(PROVIDER_INDEX, 'identity_provider_key'),
+                                   index(MODULE_INDEX, 'identity_provider_module')],
+    })
+
+
+def test_provisioned_capacity_autoscales(monkeypatch):
+    stack = template(monkeypatch, manage_tables=True, table_billing='PROVISIONED',
+                     table_read_capacity=10, table_write_capacity=4, table_max_read_capacity=200,
+                     table_max_write_capacity=50, table_target_utilization=60)
+    stack.has_resource_properties("AWS::DynamoDB::Table", {
+        "TableName": USERS_TABLE,
+        "BillingMode": assertions.Match.absent(),
+        "ProvisionedThroughput": {"ReadCapacityUnits": 10, "WriteCapacityUnits": 4},
+        "GlobalSecondaryIndexes": [assertions.Match.object_like({
+            "IndexName": PROVIDER_INDEX,
+            "ProvisionedThroughput": {"ReadCapacityUnits": 10, "WriteCapacityUnits": 4},
+        })],
+    })
+    # read and write of both tables and of the provider index
+    stack.resource_count_is("AWS::ApplicationAutoScaling::ScalableTarget", 6)
+    stack.resource_count_is("AWS::ApplicationAutoScaling::ScalingPolicy", 6)
+    stack.has_resource_properties("AWS::ApplicationAutoScaling::ScalableTarget", {
+        "ScalableDimension": "dynamodb:index:ReadCapacityUnits",
+        "MinCapacity": 10,
+        "MaxCapacity": 200,
+    })
+    stack.has_resource_properties("AWS::ApplicationAutoScaling::ScalableTarget", {
+        "ScalableDimension": "dynamodb:table:WriteCapacityUnits",
+        "MinCapacity": 4,
+        "MaxCapacity": 50,
+    })
+    stack.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+        "PolicyType": "TargetTrackingScaling",
+        "TargetTrackingScalingPolicyConfiguration": assertions.Match.object_like({"TargetValue": 60}),
+    })
+
+
+def test_streams(monkeypatch):
+    stack = template(monkeypatch, manage_tables=True, table_streams=True)
+    for table_name in (USERS_TABLE, IDP_TABLE):
+        stack.has_resource_properties("AWS::DynamoDB::Table", {
+            "TableName": table_name,
+            "StreamSpecification": {"StreamViewType": "NEW_AND_OLD_IMAGES"},
+        })
+
+
+def test_stats(monkeypatch):
+    stack = template(monkeypatch, manage_tables=True, table_stats=True)
+    stack.resource_count_is("AWS::DynamoDB::Table", 4)
+    stack.has_resource_properties("AWS::DynamoDB::Table", {
+        "TableName": USERS_TABLE,
+        "StreamSpecification": {"StreamViewType": "NEW_AND_OLD_IMAGES"},
+    })
+    stack.has_resource_properties("AWS::DynamoDB::Table", {
+        "KeySchema": [{'AttributeName': 'scope', 'KeyType': 'HASH'}, {'AttributeName': 'name', 'KeyType': 'RANGE'}],
+        "TimeToLiveSpecification": {"AttributeName": "expires", "Enabled": True},
+    })
+    stack.has_resource_properties("AWS::Lambda::Function", {"Handler": "stats_consumer.handler"})
+    # one mapping per table stream
+    stack.resource_count_is("AWS::Lambda::EventSourceMapping", 2)
+    stack.has_resource_properties("AWS::Lambda::EventSourceMapping", {
+        "StartingPosition": "TRIM_HORIZON",
+        "FunctionResponseTypes": ["ReportBatchItemFailures"],
+    })
+    stack.has_resource_properties("AWS::ElasticLoadBalancingV2::ListenerRule", {
+        "Conditions": [{"Field": "path-pattern", "PathPatternConfig": {"Values": ["/api/user/*", "/api/stats"]}}],
+    })
+
+
+def test_stats_need_managed_tables(monkeypatch):
+    with pytest.raises(ValueError):
+        template(monkeypatch, table_stats=True)
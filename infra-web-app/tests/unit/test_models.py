@@ -0,0 +1,71 @@
+import pytest
+
+import models
+
+from .conftest import PROVIDER, ROLE
+
+
+def form_user(**config):
+    """
+    User as the user form sends it, with the empty entries of the fields left blank
+    """
+    return {'user': 'alice', 'identity_provider_key': PROVIDER, 'identity_provider_module': 'ldap',
+            'ipv4_allow_list': [''],
+            'config': {'Role': ROLE, 'HomeDirectoryType': 'PATH', 'HomeDirectory': '',
+                       'HomeDirectoryDetails': [{}], 'PosixProfile': [{}], 'PublicKeys': [], **config}}
+
+
+def test_empty_form_fields_keep_their_list_shape():
+    item = models.item(models.parse_user(form_user()))
+    assert item == {'user': 'alice', 'identity_provider_key': PROVIDER, 'identity_provider_module': 'ldap',
+                    'ipv4_allow_list': [],
+                    'config': {'Role': ROLE, 'HomeDirectoryType': 'PATH', 'PosixProfile': [], 'PublicKeys': []}}
+
+
+def test_posix_profile_is_a_one_entry_list():
+    item = models.item(models.parse_user(form_user(PosixProfile=[{'Uid': '1000', 'Gid': '1000'}])))
+    assert item['config']['PosixProfile'] == [{'Uid': 1000, 'Gid': 1000}]
+    # a profile sent as an object is stored in the same shape
+    item = models.item(models.parse_user(form_user(PosixProfile={'Uid': 1000, 'Gid': 1000, 'SecondaryGids': [10]})))
+    assert item['config']['PosixProfile'] == [{'Uid': 1000, 'Gid': 1000, 'SecondaryGids': [10]}]
+
+
+def test_filled_in_lists_are_stored():
+    payload = form_user(PublicKeys=['ssh-ed25519 AAAA alice', ''],
+                        HomeDirectoryType='LOGICAL', HomeDirectoryDetails=[{'Entry': '/', 'Target': '/bucket/alice'}])
+    payload['ipv4_allow_list'] = ['10.0.0.0/8', '192.168.0.0/16']
+    item = models.item(models.parse_user(payload))
+    assert item['ipv4_allow_list'] == ['10.0.0.0/8', '192.168.0.0/16']
+    assert item['config']['PublicKeys'] == ['ssh-ed25519 AAAA alice']
+    assert item['config']['HomeDirectoryDetails'] == [{'Entry': '/', 'Target': '/bucket/alice'}]
+
+
+@pytest.mark.parametrize('user', ['Alice', 'alice.smith@example.com', 'ALICE_01'])
+def test_usernames(user):
+    assert models.parse_user(dict(form_user(), user=user)).user == user
+
+
+@pytest.mark.parametrize('payload, errors', [
+    (dict(form_user(), user='alice smith'), ['user must not contain spaces']),
+    (dict(form_user(), nickname='al'), ['nickname is not a known attribute']),
+    (form_user(PosixProfile=[{'Uid': '1000', 'Gid': '1000'}, {'Uid': '1001', 'Gid': '1001'}]),
+     ['config.PosixProfile must be a single profile']),
+    (form_user(PosixProfile=[{'Uid': 'x', 'Gid': '1000'}]), ['config.PosixProfile.Uid must be a whole number']),
+    (form_user(Role='', HomeDirectoryType='LOGICAL'),
+     ['config.Role is required']),
+    (form_user(HomeDirectoryType='LOGICAL'),
+     ['config.HomeDirectory or config.HomeDirectoryDetails is required when type is LOGICAL']),
+])
+def test_invalid_users(payload, errors):
+    with pytest.raises(models.ModelError) as raised:
+        models.parse_user(payload)
+    assert raised.value.errors == errors
+
+
+def test_idp_drops_the_fields_of_other_modules():
+    payload = {'provider': PROVIDER, 'module': 'ldap', 'public_key_support': 'false', 'okta_domain': '',
+               'config': {'server': 'ldap.example.com', 'search_base': 'DC=example,DC=com', 'port': '636',
+                          'ssl': True, 'mfa': False, 'client_id': ''}}
+    assert models.item(models.parse_idp(payload)) == {
+        'provider': PROVIDER, 'module': 'ldap', 'public_key_support': False,
+        'config': {'server': 'ldap.example.com', 'search_base': 'DC=example,DC=com', 'port': 636, 'ssl': True}}
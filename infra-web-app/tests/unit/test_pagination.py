@@ -0,0 +1,33 @@
+import base64
+import json
+
+import pytest
+
+
+def cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode('utf-8')).decode('ascii')
+
+
+@pytest.mark.parametrize('value', ['not a cursor', cursor(['user', 'partner-a'])])
+def test_tampered_cursor_is_rejected(api, tables, value):
+    response = api.call('users', 'GET', '/api/user/', query={'cursor': value})
+    assert response['statusCode'] == 400
+    assert api.json_body(response) == {'message': 'invalid cursor'}
+
+
+def test_pages_follow_the_cursor(api, tables, user):
+    users, _ = tables
+    for number in range(5):
+        users.put_item(Item=user(f"user{number}"))
+    names = []
+    query = {'limit': '2'}
+    while True:
+        response = api.call('users', 'GET', '/api/user/', query=query)
+        assert response['statusCode'] == 200
+        page = api.json_body(response)
+        assert len(page['items']) <= 2
+        names.extend(item['user'] for item in page['items'])
+        if not page['next_cursor']:
+            break
+        query['cursor'] = page['next_cursor']
+    assert sorted(names) == [f"user{number}" for number in range(5)]
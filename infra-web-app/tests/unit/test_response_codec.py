@@ -0,0 +1,34 @@
+from decimal import Decimal
+
+import pytest
+import simplejson
+
+import response_codec
+
+
+@pytest.mark.parametrize('value, expected', [
+    (Decimal('10'), 10),
+    (Decimal('1.5'), 1.5),
+    (Decimal('0.1'), 0.1),
+    (Decimal('1E+2'), 100),
+])
+def test_numbers_a_float_holds(value, expected):
+    assert simplejson.loads(response_codec.dumps({'value': value})) == {'value': expected}
+
+
+@pytest.mark.parametrize('value', [
+    '12345678901234567890.123456789',
+    '0.12345678901234567890123456789',
+    '3.14159265358979323846264338327950288',
+])
+def test_numbers_keep_every_digit(value):
+    body = response_codec.dumps({'items': [{'value': Decimal(value), 'name': 'x', 'tags': {'a'}}], 'count': 1})
+    assert simplejson.loads(body, use_decimal=True) == {'items': [{'value': Decimal(value), 'name': 'x',
+                                                                   'tags': ['a']}], 'count': 1}
+
+
+def test_unknown_types_are_an_error():
+    with pytest.raises(TypeError):
+        response_codec.dumps({'value': object()})
+    with pytest.raises(TypeError):
+        response_codec.dumps({'value': object(), 'number': Decimal('0.12345678901234567890123456789')})
@@ -0,0 +1,40 @@
+import pytest
+
+
+@pytest.fixture
+def router(api):
+    import manage_users
+    return manage_users.router()
+
+
+@pytest.mark.parametrize('method, path, route', [
+    ('GET', '/api/stats', 'GET /api/stats'),
+    ('GET', '/api/stats/', 'GET /api/stats'),
+    ('GET', '/api/user/', 'GET /api/user/'),
+    ('GET', '/api/user/alice', 'GET /api/user/'),
+    ('POST', '/api/user/import', 'POST /api/user/import'),
+    # the remainder after a prefix ending in / is a user name, whatever it starts with
+    ('GET', '/api/user/importer', 'GET /api/user/'),
+])
+def test_route_of_path(router, method, path, route):
+    found, _ = router.match(path, method)
+    assert found.name == route
+
+
+@pytest.mark.parametrize('path', ['/api/statsanything', '/api/stats-1', '/api/users'])
+def test_prefix_ends_at_a_path_segment(api, router, path):
+    assert router.match(path, 'GET') == (None, None)
+    response = api.call('users', 'GET', path)
+    assert response['statusCode'] == 404
+    assert api.json_body(response) == {'message': f"{path} not found"}
+
+
+@pytest.mark.parametrize('method, path, query', [
+    ('GET', '/api/user/alice', {}),
+    ('DELETE', '/api/user/alice', {}),
+    ('GET', '/api/user/', {'count': 'true'}),
+])
+def test_missing_provider_is_a_bad_request(api, tables, method, path, query):
+    response = api.call('users', method, path, query=query)
+    assert response['statusCode'] == 400
+    assert api.json_body(response) == {'message': 'provider query parameter is required'}
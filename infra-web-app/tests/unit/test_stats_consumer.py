@@ -0,0 +1,134 @@
+import json
+import os
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+functions_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'functions')
+if functions_dir not in sys.path:
+    sys.path.insert(0, functions_dir)
+
+import aggregates  # noqa: E402
+import ddb_helper  # noqa: E402
+import stats_consumer  # noqa: E402
+
+# stream batches recorded from the users and IdP tables, see stream_events/
+events_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stream_events')
+USERS_TABLE = 'transferidp_users'
+IDP_TABLE = 'transferidp_identity_providers'
+STATS_TABLE = 'toolkit_stats'
+
+expected = {
+    'users': {
+        'total': 3,
+        'provider': {'partner-a': 1, 'partner-b': 2},
+        'module': {'ldap': 1, 'okta': 2},
+        'role': {'arn:aws:iam::123456789012:role/transfer-admin': 1,
+                 'arn:aws:iam::123456789012:role/transfer-read': 1},
+    },
+    'idps': {'total': 2, 'module': {'ldap': 1, 'okta': 1}},
+}
+
+
+def recorded(name: str):
+    with open(os.path.join(events_dir, name)) as events:
+        return json.load(events)
+
+
+@pytest.fixture
+def stats_table(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setattr(aggregates, 'table_name', STATS_TABLE)
+    monkeypatch.setattr(aggregates, 'source_tables', {USERS_TABLE: 'users', IDP_TABLE: 'idps'})
+    with mock_aws():
+        ddb_helper.resource.cache_clear()
+        resource = boto3.resource('dynamodb')
+        resource.create_table(TableName=STATS_TABLE,
+                              KeySchema=[{'AttributeName': 'scope', 'KeyType': 'HASH'},
+                                         {'AttributeName': 'name', 'KeyType': 'RANGE'}],
+                              AttributeDefinitions=[{'AttributeName': 'scope', 'AttributeType': 'S'},
+                                                    {'AttributeName': 'name', 'AttributeType': 'S'}],
+                              BillingMode='PAY_PER_REQUEST')
+        yield resource
+    ddb_helper.resource.cache_clear()
+
+
+def test_recorded_events(stats_table):
+    users = stats_consumer.process(recorded('users.json'))
+    idps = stats_consumer.process(recorded('idps.json'))
+    assert users == idps == {'batchItemFailures': []}
+    assert aggregates.read() == expected
+
+
+def test_retried_batch_is_applied_once(stats_table):
+    batch = recorded('users.json')
+    stats_consumer.process(batch)
+    stats_consumer.process(recorded('idps.json'))
+    # Lambda delivers the whole batch again after a timeout or a failed record
+    assert stats_consumer.process(batch) == {'batchItemFailures': []}
+    assert aggregates.read() == expected
+
+
+def test_unchanged_counters_are_not_written(stats_table):
+    batch = recorded('users.json')
+    # the allow list of carol changed, nothing that is counted
+    record = batch['Records'][4]
+    assert record['eventName'] == 'MODIFY'
+    assert aggregates.apply_record(record) == 'unchanged'
+    assert stats_table.Table(STATS_TABLE).scan()['Count'] == 0
+
+
+def test_failed_record_is_reported(stats_table, monkeypatch):
+    batch = recorded('users.json')
+    apply_record = aggregates.apply_record
+    failing = batch['Records'][3]['eventID']
+
+    def flaky(record):
+        if record['eventID'] == failing:
+            raise RuntimeError('throttled')
+        return apply_record(record)
+
+    monkeypatch.setattr(aggregates, 'apply_record', flaky)
+    assert stats_consumer.process(batch) == {
+        'batchItemFailures': [{'itemIdentifier': batch['Records'][3]['dynamodb']['SequenceNumber']}]}
+    monkeypatch.setattr(aggregates, 'apply_record', apply_record)
+    # the retry starts at the failed record, the records before it are delivered again too
+    stats_consumer.process(batch)
+    stats_consumer.process(recorded('idps.json'))
+    assert aggregates.read() == expected
+
+
+def test_rebuild_matches_stream(stats_table):
+    users = stats_table.create_table(TableName=USERS_TABLE,
+                                     KeySchema=[{'AttributeName': 'user', 'KeyType': 'HASH'},
+                                                {'AttributeName': 'identity_provider_key', 'KeyType': 'RANGE'}],
+                                     AttributeDefinitions=[{'AttributeName': 'user', 'AttributeType': 'S'},
+                                                           {'AttributeName': 'identity_provider_key', 'AttributeType': 'S'}],
+                                     BillingMode='PAY_PER_REQUEST')
+    idps = stats_table.create_table(TableName=IDP_TABLE,
+                                    KeySchema=[{'AttributeName': 'provider', 'KeyType': 'HASH'}],
+                                    AttributeDefinitions=[{'AttributeName': 'provider', 'AttributeType': 'S'}],
+                                    BillingMode='PAY_PER_REQUEST')
+    # the tables as they are after the recorded batches
+    for table, batch in ((users, recorded('users.json')), (idps, recorded('idps.json'))):
+        for record in batch['Records']:
+            new_image = aggregates.image(record, 'NewImage')
+            if new_image is None:
+                table.delete_item(Key={name: value['S'] for name, value in record['dynamodb']['Keys'].items()})
+            else:
+                table.put_item(Item=new_image)
+    # a counter of a module no user has anymore
+    stats_table.Table(STATS_TABLE).put_item(Item={'scope': aggregates.counts_scope, 'name': 'users#module#argon2',
+                                                  'count': 4})
+
+    result = aggregates.rebuild(USERS_TABLE, IDP_TABLE, segments=2)
+    assert result['removed'] == 1
+    assert (result['users'], result['idps']) == (3, 2)
+    assert aggregates.read() == expected
+    # the stream carries on from the rebuilt counters
+    stats_consumer.process({'Records': [recorded('idps.json')['Records'][2]]})
+    assert aggregates.read()['idps']['module'] == {'ldap': 1, 'okta': 1, 'cognito': 1}
@@ -0,0 +1,75 @@
+import pytest
+from botocore.exceptions import ClientError
+
+import table_index
+
+from .conftest import PROVIDER_INDEX, USERS_TABLE
+
+
+class Client:
+    """
+    DescribeTable and UpdateTable of a users table, recording the updates
+    """
+
+    def __init__(self, billing_mode=None, indexes=(), update_error=None):
+        self.table = {'TableName': USERS_TABLE}
+        if billing_mode:
+            self.table['BillingModeSummary'] = {'BillingMode': billing_mode}
+        if indexes:
+            self.table['GlobalSecondaryIndexes'] = [{'IndexName': name} for name in indexes]
+        self.update_error = update_error
+        self.updates = []
+
+    def describe_table(self, TableName):
+        return {'Table': self.table}
+
+    def update_table(self, **kwargs):
+        if self.update_error:
+            raise ClientError({'Error': {'Code': 'ValidationException', 'Message': self.update_error}}, 'UpdateTable')
+        self.updates.append(kwargs)
+
+
+def add_index(client):
+    return table_index.add_index(client, USERS_TABLE, PROVIDER_INDEX, 'identity_provider_key', 10, 2)
+
+
+def test_on_demand_table_gets_no_throughput():
+    client = Client('PAY_PER_REQUEST')
+    assert add_index(client)
+    create = client.updates[0]['GlobalSecondaryIndexUpdates'][0]['Create']
+    assert create['IndexName'] == PROVIDER_INDEX
+    assert create['Projection'] == {'ProjectionType': 'KEYS_ONLY'}
+    assert 'ProvisionedThroughput' not in create
+
+
+@pytest.mark.parametrize('billing_mode', ['PROVISIONED', None])
+def test_provisioned_table_gets_the_index_throughput(billing_mode):
+    client = Client(billing_mode)
+    assert add_index(client)
+    create = client.updates[0]['GlobalSecondaryIndexUpdates'][0]['Create']
+    assert create['ProvisionedThroughput'] == {'ReadCapacityUnits': 10, 'WriteCapacityUnits': 2}
+
+
+def test_existing_index_is_left_alone():
+    client = Client('PAY_PER_REQUEST', indexes=[PROVIDER_INDEX])
+    assert not add_index(client)
+    assert client.updates == []
+
+
+def test_index_created_meanwhile_is_not_an_error():
+    client = Client('PAY_PER_REQUEST', update_error='Attempting to create an index which already exists')
+    assert not add_index(client)
+
+
+def test_other_validation_errors_fail_the_deployment():
+    client = Client('PROVISIONED', update_error='One or more parameter values were invalid: ProvisionedThroughput')
+    with pytest.raises(ClientError):
+        add_index(client)
+
+
+def test_delete_keeps_the_index(monkeypatch):
+    monkeypatch.setattr(table_index.boto3, 'client', lambda service: pytest.fail('no DynamoDB call on delete'))
+    event = {'RequestType': 'Delete', 'PhysicalResourceId': f"{USERS_TABLE}-{PROVIDER_INDEX}",
+             'ResourceProperties': {'TableName': USERS_TABLE, 'IndexName': PROVIDER_INDEX,
+                                    'PartitionKey': 'identity_provider_key', 'ReadCapacity': '10', 'WriteCapacity': '2'}}
+    assert table_index.handler(event, None) == {'PhysicalResourceId': f"{USERS_TABLE}-{PROVIDER_INDEX}"}
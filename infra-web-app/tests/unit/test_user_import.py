@@ -0,0 +1,84 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import ddb_helper
+import user_import
+
+from .conftest import PROVIDER, ROLE, Context
+
+
+def test_import_reports_every_row(api, tables):
+    users, _ = tables
+    body = '\n'.join([
+        'user,identity_provider_key,identity_provider_module,config.Role,config.HomeDirectoryType',
+        f"alice,{PROVIDER},ldap,{ROLE},PATH",
+        f"BAD,{PROVIDER},ldap,{ROLE},PATH",
+        f"bob,{PROVIDER},ldap,not-an-arn,PATH",
+        f"carol,{PROVIDER},ldap,,PATH",
+    ])
+    response = api.call('users', 'POST', '/api/user/import', body=body, headers={'content-type': 'text/csv'})
+    assert response['statusCode'] == 200
+    report = api.json_body(response)
+    assert (report['imported'], report['invalid'], report['failed']) == (2, 2, 0)
+    assert [(row['row'], row['user'], row['status']) for row in report['rows']] == [
+        (1, 'alice', 'imported'), (2, 'BAD', 'imported'), (3, 'bob', 'invalid'), (4, 'carol', 'invalid')]
+    assert report['rows'][2]['errors'] == ['config.Role must be an ARN']
+    assert report['rows'][3]['errors'] == ['config.Role is required']
+    assert sorted(item['user'] for item in users.scan()['Items']) == ['BAD', 'alice']
+
+
+def csv_upload(count: int):
+    rows = ['user,identity_provider_key,identity_provider_module,config.Role,config.HomeDirectoryType']
+    rows.extend(f"user{number:04},{PROVIDER},ldap,{ROLE},PATH" for number in range(count))
+    return '\n'.join(rows)
+
+
+def test_batches_are_written_concurrently(api, tables, monkeypatch):
+    users, _ = tables
+    batch_write = ddb_helper.batch_write
+    running = []
+    overlap = []
+    lock = threading.Lock()
+
+    def slow_batch_write(*args, **kwargs):
+        with lock:
+            running.append(1)
+            overlap.append(len(running))
+        time.sleep(0.02)
+        try:
+            return batch_write(*args, **kwargs)
+        finally:
+            with lock:
+                running.pop()
+
+    monkeypatch.setattr(ddb_helper, 'batch_write', slow_batch_write)
+    response = api.call('users', 'POST', '/api/user/import', body=csv_upload(250), headers={'content-type': 'text/csv'})
+    report = api.json_body(response)
+    assert (report['imported'], report['invalid'], report['failed']) == (250, 0, 0)
+    assert [row['row'] for row in report['rows']] == list(range(1, 251))
+    assert max(overlap) > 1
+    assert users.scan(Select='COUNT')['Count'] == 250
+
+
+def test_rows_after_the_deadline_are_failed(api, tables, monkeypatch):
+    users, _ = tables
+    # no time left beyond the margin, not a single batch is started
+    monkeypatch.setattr(user_import, 'deadline_margin', 0.5)
+    response = api.call('users', 'POST', '/api/user/import', body=csv_upload(30), headers={'content-type': 'text/csv'},
+                        context=Context(remaining_ms=400))
+    assert response['statusCode'] == 200
+    report = api.json_body(response)
+    assert (report['imported'], report['invalid'], report['failed']) == (0, 0, 30)
+    assert {tuple(row['errors']) for row in report['rows']} == {(user_import.deadline_error,)}
+    assert users.scan(Select='COUNT')['Count'] == 0
+
+
+def test_deadline_stops_between_batches(tables, monkeypatch):
+    users, _ = tables
+    clock = iter(range(100))
+    # every look at the clock advances it by a second, the second batch would start after the deadline
+    monkeypatch.setattr(user_import, 'time', SimpleNamespace(monotonic=lambda: next(clock)))
+    report = user_import.import_users(users, user_import.parse_rows(csv_upload(60), 'csv'), deadline=1, workers=1)
+    assert (report['imported'], report['failed']) == (25, 35)
+    assert [row['status'] for row in report['rows']] == ['imported'] * 25 + ['failed'] * 35
@@ -0,0 +1,81 @@
+import os
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+functions_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'functions')
+if functions_dir not in sys.path:
+    sys.path.insert(0, functions_dir)
+
+import ddb_helper  # noqa: E402
+import user_search  # noqa: E402
+
+USERS_TABLE = 'transferidp_users'
+PROVIDER_INDEX = 'identity_provider_key-index'
+MODULE_INDEX = 'identity_provider_module-index'
+
+
+def index(name: str, partition_key: str):
+    return {'IndexName': name,
+            'KeySchema': [{'AttributeName': partition_key, 'KeyType': 'HASH'},
+                          {'AttributeName': 'user', 'KeyType': 'RANGE'}],
+            'Projection': {'ProjectionType': 'KEYS_ONLY'}}
+
+
+@pytest.fixture
+def users(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    with mock_aws():
+        table = boto3.resource('dynamodb').create_table(
+            TableName=USERS_TABLE,
+            KeySchema=[{'AttributeName': 'user', 'KeyType': 'HASH'},
+                       {'AttributeName': 'identity_provider_key', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': name, 'AttributeType': 'S'}
+                                  for name in ('user', 'identity_provider_key', 'identity_provider_module')],
+            GlobalSecondaryIndexes=[index(PROVIDER_INDEX, 'identity_provider_key'),
+                                    index(MODULE_INDEX, 'identity_provider_module')],
+            BillingMode='PAY_PER_REQUEST')
+        for number in range(6):
+            table.put_item(Item={'user': f'user{number}', 'identity_provider_key': f'partner-{number % 2}',
+                                 'identity_provider_module': 'ldap'})
+        yield table
+
+
+def all_pages(table, query_parameters: dict, **kwargs):
+    pages = []
+    cursor = None
+    while True:
+        result = user_search.search(table, dict(query_parameters, cursor=cursor), **kwargs)
+        pages.append(result)
+        cursor = result['next_cursor']
+        if not cursor:
+            return pages
+
+
+@pytest.mark.parametrize('name, value, partition', [
+    ('module', 'ldap', 'identity_provider_module'),
+    ('provider', 'partner-0', 'identity_provider_key'),
+])
+def test_truncated_index_page_continues(users, monkeypatch, name, value, partition):
+    # room for the keys of one user per page, the cursor is then built from the last key returned
+    monkeypatch.setattr(ddb_helper, 'max_page_bytes', 80)
+    pages = all_pages(users, {name: value, 'limit': '3'}, provider_index=PROVIDER_INDEX, module_index=MODULE_INDEX)
+    expected = sorted(item['user'] for item in users.scan()['Items'] if item[partition] == value)
+    assert [item['user'] for page in pages for item in page['items']] == expected
+    assert all(len(page['items']) == 1 for page in pages)
+    # every page came from the index, none fell back to a scan
+    assert {page['access_path']['operation'] for page in pages} == {'query'}
+    cursor = ddb_helper.decode_cursor(pages[0]['next_cursor'])
+    assert set(cursor) == {'user', 'identity_provider_key', partition}
+
+
+def test_scan_sorts_each_page(users):
+    pages = all_pages(users, {'prefix': 'user', 'sort': '-user', 'limit': '2'})
+    for page in pages:
+        assert page['access_path'] == {'operation': 'scan', 'index': None, 'sort': 'page'}
+        assert [item['user'] for item in page['items']] == sorted((item['user'] for item in page['items']), reverse=True)
+    assert sorted(item['user'] for page in pages for item in page['items']) == [f'user{number}' for number in range(6)]
@@ -0,0 +1,26 @@
+// List endpoints return { items, next_cursor }, follow next_cursor until the last page
+export async function fetchAllPages(url, token) {
+  let items = []
+  let cursor = ''
+  do {
+    const separator = url.includes('?') ? '&' : '?'
+    const signal = AbortSignal.timeout(3000)
+    const response = await fetch(url + separator + 'cursor=' + encodeURIComponent(cursor), {
+      signal,
+      method: 'GET',
+      mode: 'cors',
+      cache: 'no-cache',
+      headers: {
+        Authorization: 'Bearer ' + token,
+        'Content-Type': 'application/json'
+      }
+    })
+    if (!response.ok) {
+      throw new Error('Failed to load ' + url + ': ' + response.status)
+    }
+    const page = await response.json()
+    items = items.concat(page.items)
+    cursor = page.next_cursor
+  } while (cursor)
+  return items
+}